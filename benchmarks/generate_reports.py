@@ -0,0 +1,142 @@
+"""This module generates synthetic ZAP HTML reports of any size in the older (results table)
+and newer (alerts table) layouts, for benchmarking the parser, comparison and ingest"""
+import argparse
+import os
+import random
+
+LAYOUTS = ('old', 'new')
+# Older reports only have the four risk levels, newer ones add False Positive
+OLD_LEVELS = ['High', 'Medium', 'Low', 'Informational']
+NEW_LEVELS = OLD_LEVELS + ['False Positive']
+RISK_CLASSES = {'High': 'risk-3', 'Medium': 'risk-2', 'Low': 'risk-1', 'Informational': 'risk-0',
+                'False Positive': 'risk--1'}
+REPORT_HEAD = "<!DOCTYPE html>\n<html>\n<head>\n<META http-equiv=\"Content-Type\" " \
+              "content=\"text/html; charset=UTF-8\" />\n<title>ZAP Scanning Report</title>\n" \
+              "</head>\n<body>\n<h1>ZAP Scanning Report</h1>\n<h3>Summary of Alerts</h3>\n"
+OLD_SUMMARY_ROW = "<tr bgcolor=\"#e8e8e8\">\n<td><a href=\"#%s\">%s</a></td>" \
+                  "<td align=\"center\">%s</td>\n</tr>\n"
+NEW_SUMMARY_ROW = "<tr>\n<td class=\"%s\">\n<div>%s</div>\n</td>\n<td align=\"center\">\n" \
+                  "<div>%s</div>\n</td>\n</tr>\n"
+NEW_ALERT_ROW = "<tr>\n<td><a href=\"#%s\">%s</a></td>\n<td align=\"center\" class=\"%s\">" \
+                "%s</td>\n<td align=\"center\">%s</td>\n</tr>\n"
+OLD_RESULT_HEAD = "<div class=\"spacer\"></div>\n<table width=\"100%%\" class=\"results\">\n" \
+                  "<tbody><tr height=\"24\" class=\"risk-%s\">\n<th width=\"20%%\">%s " \
+                  "(Medium)</th><th width=\"80%%\">%s</th>\n</tr>\n<tr bgcolor=\"#e8e8e8\">\n" \
+                  "<td width=\"20%%\">Description</td><td width=\"80%%\"><p>Synthetic alert %s." \
+                  "</p></td>\n</tr>\n"
+NEW_RESULT_HEAD = "<table class=\"results\">\n<tr height=\"24\">\n<th width=\"20%%\" " \
+                  "class=\"%s\"><a id=\"%s\"></a>\n<div>%s</div></th>\n<th class=\"%s\">%s</th>" \
+                  "\n</tr>\n<tr>\n<td width=\"20%%\">Description</td>\n<td width=\"80%%\">" \
+                  "<div>Synthetic alert %s.</div></td>\n</tr>\n"
+INSTANCE_ROWS = "<tr bgcolor=\"#e8e8e8\">\n<td width=\"20%%\" class=\"indent1\">URL</td>" \
+                "<td width=\"80%%\">https://www.example.com/page/%s/%s</td>\n</tr>\n" \
+                "<tr bgcolor=\"#e8e8e8\">\n<td width=\"20%%\" class=\"indent2\">Method</td>" \
+                "<td width=\"80%%\">GET</td>\n</tr>\n"
+RESULT_TAIL = "<tr bgcolor=\"#e8e8e8\">\n<td width=\"20%%\">Instances</td>" \
+              "<td width=\"80%%\">%s</td>\n</tr>\n</tbody></table>\n"
+
+
+def generate_alerts(alert_count, layout='new', instances=2, seed=0):
+    """This function returns alert_count [level, alert name, URL count] alerts with distinct
+    names, ordered by severity like a ZAP report. The URL counts average instances and the
+    same seed always gives the same alerts."""
+    levels = OLD_LEVELS if layout == 'old' else NEW_LEVELS
+    chooser = random.Random(seed)
+    alerts = [[chooser.choice(levels), "Synthetic Alert %07d" % number,
+               chooser.randint(1, 2 * instances - 1)] for number in range(alert_count)]
+    alerts.sort(key=lambda alert: levels.index(alert[0]))
+    return alerts
+
+
+def change_alerts(alerts, seed=1, churn=0.1):
+    """This function returns a later run of the same scan: about churn of the alerts are
+    resolved, as many new ones are found and as many again change their URL count."""
+    chooser = random.Random(seed)
+    changed = []
+    for level, alert_name, url_count in alerts:
+        draw = chooser.random()
+        if draw < churn:
+            continue
+        if draw < 2 * churn:
+            url_count = max(1, url_count + chooser.choice((-1, 1)))
+        changed.append([level, alert_name, url_count])
+    for number in range(len(alerts) - len(changed)):
+        level, _, url_count = alerts[chooser.randrange(len(alerts))]
+        changed.append([level, "Synthetic New Alert %07d" % number, url_count])
+    return changed
+
+
+def write_report(path, alerts, layout='new'):
+    """This function writes alerts as a ZAP HTML report in the older or newer layout."""
+    totals = {}
+    for level, _, _ in alerts:
+        totals[level] = totals.get(level, 0) + 1
+    with open(path, 'w', encoding='utf-8') as report:
+        report.write(REPORT_HEAD)
+        if layout == 'old':
+            write_old_layout(report, alerts, totals)
+        else:
+            write_new_layout(report, alerts, totals)
+        report.write("</body>\n</html>\n")
+    return path
+
+
+def write_old_layout(report, alerts, totals):
+    """This function writes the summary and one results table per alert of an older
+    report."""
+    report.write("<table width=\"45%\" class=\"summary\">\n<tbody>")
+    for level in OLD_LEVELS:
+        report.write(OLD_SUMMARY_ROW % (level.lower(), level, totals.get(level, 0)))
+    report.write("</tbody></table>\n<h3>Alert Detail</h3>\n")
+    for number, (level, alert_name, url_count) in enumerate(alerts):
+        report.write(OLD_RESULT_HEAD % (level.lower(), level, alert_name, number))
+        write_instances(report, number, url_count)
+
+
+def write_new_layout(report, alerts, totals):
+    """This function writes the summary, the alerts table and one results table per alert of
+    a newer report."""
+    report.write("<table class=\"summary\">\n")
+    for level in NEW_LEVELS:
+        report.write(NEW_SUMMARY_ROW % (RISK_CLASSES[level], level, totals.get(level, 0)))
+    report.write("</table>\n<h3>Alerts</h3>\n<table class=\"alerts\">\n")
+    for number, (level, alert_name, url_count) in enumerate(alerts):
+        report.write(NEW_ALERT_ROW % (number, alert_name, RISK_CLASSES[level], level,
+                                      url_count))
+    report.write("</table>\n<h3>Alert Detail</h3>\n")
+    for number, (level, alert_name, url_count) in enumerate(alerts):
+        risk_class = RISK_CLASSES[level]
+        report.write(NEW_RESULT_HEAD % (risk_class, number, level, risk_class, alert_name,
+                                        number))
+        write_instances(report, number, url_count)
+
+
+def write_instances(report, number, url_count):
+    """This function writes the URL instance rows closing an alert's results table."""
+    for instance in range(url_count):
+        report.write(INSTANCE_ROWS % (number, instance))
+    report.write(RESULT_TAIL % url_count)
+
+
+def main():
+    """This function writes a pair of synthetic reports, a baseline and a later run, for each
+    layout."""
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('alerts', type=int, help="Number of alerts in each report")
+    parser.add_argument('-d', '--directory', default='.', help="Directory the reports go in")
+    parser.add_argument('--instances', type=int, default=2,
+                        help="Average number of URL instances per alert")
+    parser.add_argument('--layout', choices=LAYOUTS + ('both',), default='both',
+                        help="Report layout to generate")
+    args = parser.parse_args()
+    os.makedirs(args.directory, exist_ok=True)
+    for layout in LAYOUTS if args.layout == 'both' else (args.layout,):
+        alerts = generate_alerts(args.alerts, layout, args.instances)
+        for name, run in (('baseline', alerts), ('later', change_alerts(alerts))):
+            path = os.path.join(args.directory, "%s_%s_%s.html" % (layout, args.alerts, name))
+            write_report(path, run, layout)
+            print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""This module times each stage of turning ZAP reports into a comparison, on synthetic reports
+of growing size, and checks the times and peak memory against a stored baseline. The parse
+stages also record the peak resident memory of a process doing nothing but that parse, which
+counts the memory lxml allocates for the tree outside of the Python heap.
+Run it from the repository root with python -m benchmarks.run_benchmarks"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from owasp_zap_historic_parser.delta_formats import build_alert_delta
+from owasp_zap_historic_parser.owasp_zap_historical import AlertAggregator, \
+    convert_alert_to_dictionary, iter_html_alerts_streaming, parse_report, \
+    record_zap_results, write_alert_breakdown
+from owasp_zap_historic_parser.storage import SQLiteStorage
+from benchmarks.generate_reports import LAYOUTS, change_alerts, generate_alerts, write_report
+
+SIZES = (10, 1000, 10000, 100000)
+# Stages on reports of this many alerts or more are timed once, keeping a full run short
+LARGE_SIZE = 100000
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Parses the report in argv[1], streaming when argv[2] is 'streaming', and prints the peak
+# resident memory of the process in KiB. ru_maxrss is in KiB on Linux and bytes on macOS, and
+# Linux carries the peak of the forking process over into it, so VmHWM is read there instead
+PEAK_RSS_SCRIPT = """import resource, sys
+from owasp_zap_historic_parser.owasp_zap_historical import parse_report
+parse_report(sys.argv[1], sys.argv[2] == 'streaming')
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+peak = peak // 1024 if sys.platform == 'darwin' else peak
+try:
+    with open('/proc/self/status', encoding='utf-8') as status:
+        peak = next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    pass
+print(peak)
+"""
+# A stage regresses when it is this much slower or bigger than the baseline, and by more than
+# the noise floor, so tiny stages do not fail on timer jitter
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.25
+TIME_FLOOR = 0.005
+MEMORY_FLOOR_KIB = 256
+BASELINE_DATE = datetime.datetime(2021, 3, 1, 10)
+LATER_DATE = datetime.datetime(2021, 3, 2, 10)
+
+
+def measure(run, setup=None, teardown=None, repeat=3):
+    """This function returns the best time in seconds of repeat calls of run and the peak
+    Python memory in KiB of one more call traced by tracemalloc. setup, when given, makes
+    the argument of each call untimed, and teardown is called with it afterwards."""
+    best = None
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        started = time.perf_counter()
+        run(argument)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        if teardown:
+            teardown(argument)
+    argument = setup() if setup else None
+    tracemalloc.start()
+    try:
+        run(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if teardown:
+        teardown(argument)
+    return {'seconds': round(best, 6), 'peak_kib': round(peak / 1024)}
+
+
+def measure_parse(report_path, streaming, repeat):
+    """This function returns the measurements of parsing a report, adding the peak resident
+    memory in KiB of a separate process that only parses it. tracemalloc does not see the
+    tree lxml builds in C, so only this tells the streaming parse from the tree parse."""
+    measured = measure(lambda _: parse_report(report_path, streaming), repeat=repeat)
+    output = subprocess.run([sys.executable, '-c', PEAK_RSS_SCRIPT, report_path,
+                             'streaming' if streaming else 'tree'],
+                            cwd=ROOT_PATH, check=True, capture_output=True, text=True).stdout
+    measured['peak_rss_kib'] = int(output)
+    return measured
+
+
+def benchmark_size(directory, layout, size, repeat):
+    """This function generates the baseline and later reports of a layout and size and
+    returns the measurements of each stage, keyed by stage name."""
+    baseline_alerts = generate_alerts(size, layout)
+    later_alerts = change_alerts(baseline_alerts)
+    if size >= LARGE_SIZE:
+        repeat = 1
+    baseline_path = write_report(os.path.join(directory, '%s_%s_baseline.html' % (
+        layout, size)), baseline_alerts, layout)
+    later_path = write_report(os.path.join(directory, '%s_%s_later.html' % (layout, size)),
+                              later_alerts, layout)
+    rows = list(iter_html_alerts_streaming(later_path))
+    baseline = parse_report(baseline_path)
+    later = parse_report(later_path)
+    current_dict = convert_alert_to_dictionary(later)
+    last_dict = convert_alert_to_dictionary(baseline)
+    totals = dict.fromkeys(['High', 'Medium', 'Low', 'Informational', 'False Positive'], 0)
+    for level, _, _ in later:
+        totals[level] += 1
+    databases = []
+
+    def aggregate(_):
+        aggregator = AlertAggregator()
+        aggregator.add_rows(rows)
+        return aggregator.results()
+
+    def compare(_):
+        return build_alert_delta('QA', 'Active', (LATER_DATE, 'later', '1.1'),
+                                 (1, BASELINE_DATE, 'baseline', '1.0'), totals,
+                                 convert_alert_to_dictionary(later),
+                                 convert_alert_to_dictionary(baseline))
+
+    def render(_):
+        write_alert_breakdown(io.StringIO(), current_dict, last_dict, 'before', 'after')
+
+    def open_database():
+        database = os.path.join(directory, 'db%s' % len(databases))
+        databases.append(database)
+        storage = SQLiteStorage(database, 'bench')
+        record_zap_results(storage, 'QA', 'Active', baseline, 'bench', 'baseline', '1.0',
+                           execution_date=BASELINE_DATE)
+        return storage
+
+    def ingest(storage):
+        record_zap_results(storage, 'QA', 'Active', later, 'bench', 'later', '1.1',
+                           execution_date=LATER_DATE, sink=io.StringIO())
+
+    return {
+        'parse': measure_parse(later_path, False, repeat),
+        'parse_streaming': measure_parse(later_path, True, repeat),
+        'aggregate': measure(aggregate, repeat=repeat),
+        'compare': measure(compare, repeat=repeat),
+        'render': measure(render, repeat=repeat),
+        'ingest': measure(ingest, open_database, lambda storage: storage.close(), repeat),
+    }
+
+
+def run_benchmarks(sizes, layouts, repeat):
+    """This function benchmarks every layout and size and returns the measurements keyed by
+    layout/size/stage."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in layouts:
+            for size in sizes:
+                for stage, measured in benchmark_size(directory, layout, size, repeat).items():
+                    key = '%s/%s/%s' % (layout, size, stage)
+                    results[key] = measured
+                    print("%-32s %10.4f s %10s KiB %10s KiB RSS" % (
+                        key, measured['seconds'], measured['peak_kib'],
+                        measured.get('peak_rss_kib', '-')))
+    return results
+
+
+def find_regressions(results, baseline):
+    """This function returns a message for every measurement slower or bigger than its
+    baseline beyond the tolerances."""
+    regressions = []
+    for key, measured in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        seconds, base_seconds = measured['seconds'], expected['seconds']
+        if seconds > base_seconds * (1 + TIME_TOLERANCE) and \
+                seconds - base_seconds > TIME_FLOOR:
+            regressions.append("%s took %.4f s, baseline %.4f s" % (key, seconds, base_seconds))
+        peak, base_peak = measured['peak_kib'], expected['peak_kib']
+        if peak > base_peak * (1 + MEMORY_TOLERANCE) and peak - base_peak > MEMORY_FLOOR_KIB:
+            regressions.append("%s peaked at %s KiB, baseline %s KiB" % (key, peak, base_peak))
+        rss, base_rss = measured.get('peak_rss_kib'), expected.get('peak_rss_kib')
+        if rss is not None and base_rss is not None and \
+                rss > base_rss * (1 + MEMORY_TOLERANCE) and rss - base_rss > MEMORY_FLOOR_KIB:
+            regressions.append("%s peaked at %s KiB resident, baseline %s KiB" % (
+                key, rss, base_rss))
+    return regressions
+
+
+def main():
+    """This function runs the benchmarks and compares them with, or stores them as, the
+    baseline. It returns 1 when a stage regressed."""
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help="Numbers of alerts in the generated reports")
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS),
+                        help="Report layouts to benchmark")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Timed runs of each stage on reports under %s alerts, the "
+                             "fastest is kept" % LARGE_SIZE)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline results file")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Store these results as the baseline instead of checking them")
+    args = parser.parse_args()
+    results = run_benchmarks(args.sizes, args.layouts, args.repeat)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump({'python': platform.python_version(), 'results': results},
+                      baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print("Baseline written to %s" % args.baseline)
+        return 0
+    with open(args.baseline, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)['results']
+    regressions = find_regressions(results, baseline)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    if not regressions:
+        print("No regressions against %s" % args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
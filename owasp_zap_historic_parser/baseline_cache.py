@@ -0,0 +1,62 @@
+"""This module keeps the latest execution of each project, environment and scan type on local
+disk, so the comparison with it does not have to read it back from the database"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+
+# Snapshots of other formats, such as the alerts keyed by level and type written before
+# alerts were keyed by their alert type id, are treated as a miss
+SNAPSHOT_FORMAT = 2
+
+
+class BaselineCache:
+    """This class stores one alert snapshot per project, environment and scan type in a
+    directory. A snapshot is only used when its execution id is the one the database names as
+    the previous execution, so a cache left behind by another collector is never trusted."""
+
+    def __init__(self, directory, location):
+        self.directory = directory
+        self.location = location
+
+    def path(self, projectname, this_env, scantype):
+        """This method returns the file holding the snapshot of a project, environment and
+        scan type in the database at this cache's location."""
+        key = json.dumps([self.location, projectname, this_env, scantype])
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, projectname, this_env, scantype, execution_id):
+        """This method returns the cached execution row (id, date, link, version) and alerts
+        if the snapshot is of execution_id, otherwise None."""
+        try:
+            with open(self.path(projectname, this_env, scantype), encoding='utf-8') as cached:
+                snapshot = json.load(cached)
+            if snapshot.get('format') != SNAPSHOT_FORMAT or \
+                    snapshot['execution_id'] != execution_id:
+                return None
+            execution_row = (execution_id,
+                             datetime.datetime.fromisoformat(snapshot['execution_date']),
+                             snapshot['url_link'], snapshot['version'])
+            return execution_row, snapshot['alerts']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, projectname, this_env, scantype, execution_row, alerts):
+        """This method replaces the snapshot of a project, environment and scan type with the
+        given execution row and alerts. The file is swapped in whole, so a reader never sees
+        half a snapshot."""
+        execution_id, execution_date, url_link, version = execution_row
+        path = self.path(projectname, this_env, scantype)
+        snapshot = {'format': SNAPSHOT_FORMAT, 'execution_id': execution_id,
+                    'execution_date': execution_date.isoformat(), 'url_link': url_link,
+                    'version': version, 'alerts': alerts}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with open(descriptor, 'w', encoding='utf-8') as cached:
+                json.dump(snapshot, cached, separators=(',', ':'))
+            os.replace(temp_path, path)
+        except OSError as error:
+            print("Unable to write baseline cache %s: %s" % (path, error))
@@ -0,0 +1,149 @@
+"""This module writes the comparison of an execution with the previous one as JSON, Markdown or
+JUnit XML, built from the same alert dictionaries as the HTML email so that pipelines do not
+have to scrape it"""
+import json
+from xml.sax.saxutils import escape, quoteattr
+from .owasp_zap_historical import SEVERITY_LEVELS, format_report_date
+
+DELTA_FORMATS = ('json', 'markdown', 'junit')
+DELTA_STATUSES = ('new', 'increased', 'decreased', 'unchanged', 'resolved')
+# Alerts that fail the JUnit suite: new or increased at one of these levels
+JUNIT_FAILURE_LEVELS = ('High', 'Medium', 'Low')
+JUNIT_FAILURE_STATUSES = ('new', 'increased')
+
+
+def get_alert_status(urls, urls2):
+    """This function returns how an alert of this execution changed from urls2 URLs affected
+    in the previous execution to urls, with urls2 None when the alert was not in the previous
+    execution. Alerts can affect 0 URLs, so whether an alert is new is decided by its presence
+    and the counts only tell increased, decreased and unchanged apart."""
+    if urls2 is None:
+        return 'new'
+    if urls > urls2:
+        return 'increased'
+    if urls < urls2:
+        return 'decreased'
+    return 'unchanged'
+
+
+def build_alert_delta(this_env, scantype, execution_row, compare_row, totals, set1, set2):
+    """This function builds the comparison of the current alerts, set1, with those of the
+    previous execution, set2, as a dictionary. execution_row is the (date, link, version) of
+    this execution and compare_row the (id, date, link, version) of the previous one, or None
+    when there is nothing to compare with. Alerts are listed by severity, then the alerts
+    only found in the previous execution."""
+    execution_date, url_link, version = execution_row
+    alerts_by_level = {level: [] for level in SEVERITY_LEVELS}
+    for key, alert in set1.items():
+        level_alerts = alerts_by_level.get(alert['Alert Level'])
+        if level_alerts is None:
+            continue
+        urls = alert['URLs Affected']
+        urls2 = set2[key]['URLs Affected'] if key in set2 else None
+        level_alerts.append({'level': alert['Alert Level'], 'alert': alert['Alert Type'],
+                             'urls_affected': urls,
+                             'previous_urls_affected': 0 if urls2 is None else urls2,
+                             'status': get_alert_status(urls, urls2)})
+    alerts = [alert for level_alerts in alerts_by_level.values() for alert in level_alerts]
+    for key, alert in set2.items():
+        if key not in set1:
+            alerts.append({'level': alert['Alert Level'], 'alert': alert['Alert Type'],
+                           'urls_affected': 0, 'previous_urls_affected': alert['URLs Affected'],
+                           'status': 'resolved'})
+    statuses = dict.fromkeys(DELTA_STATUSES, 0)
+    for alert in alerts:
+        statuses[alert['status']] += 1
+    severity_totals = {level: totals[level] for level in SEVERITY_LEVELS}
+    severity_totals['Total'] = sum(severity_totals.values())
+    comparison = None
+    if compare_row is not None:
+        comparison = {'execution_date': compare_row[1],
+                      'report_link': compare_row[2], 'version': compare_row[3]}
+    return {'environment': this_env, 'scan_type': scantype, 'version': version,
+            'execution_date': execution_date, 'report_link': url_link,
+            'comparison': comparison, 'totals': severity_totals, 'statuses': statuses,
+            'alerts': alerts}
+
+
+def format_utc_date(utc_date):
+    """This function formats a UTC execution date as ISO 8601."""
+    return utc_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def write_alert_delta(sink, output_format, delta):
+    """This keyword writes the comparison built by build_alert_delta to sink in one of
+    DELTA_FORMATS."""
+    if output_format == 'json':
+        write_json_delta(sink, delta)
+    elif output_format == 'markdown':
+        write_markdown_delta(sink, delta)
+    elif output_format == 'junit':
+        write_junit_delta(sink, delta)
+    else:
+        raise ValueError("Unknown output format %s" % output_format)
+
+
+def write_json_delta(sink, delta):
+    """This keyword writes the comparison as one JSON document, with the dates in ISO 8601."""
+    json.dump(delta, sink, indent=2, default=format_utc_date)
+    sink.write('\n')
+
+
+def write_markdown_delta(sink, delta):
+    """This keyword writes the comparison as Markdown, with the report details, the alert
+    totals and a table of the alerts."""
+    sink.write("# OWASP ZAP Report Comparison for %s / %s / %s\n\n" % (
+        delta['environment'], delta['scan_type'], delta['version']))
+    sink.write("- This report date: %s\n" % format_report_date(delta['execution_date']))
+    sink.write("- This report link: <%s>\n" % delta['report_link'].replace(' ', '%20'))
+    comparison = delta['comparison']
+    if comparison is None:
+        sink.write("\nNot enough rows to compare results for %s and %s.\n" % (
+            delta['environment'], delta['scan_type']))
+    else:
+        sink.write("- Comparison report version: %s\n" % comparison['version'])
+        sink.write("- Comparison report date: %s\n" %
+                   format_report_date(comparison['execution_date']))
+        sink.write("- Comparison report link: <%s>\n" %
+                   comparison['report_link'].replace(' ', '%20'))
+    totals = delta['totals']
+    sink.write("\n## Overall Alerts\n\n| Total | %s |\n|%s\n| %s |\n" % (
+        ' | '.join(SEVERITY_LEVELS), ' ---: |' * (len(SEVERITY_LEVELS) + 1),
+        ' | '.join(str(totals[level]) for level in ['Total'] + SEVERITY_LEVELS)))
+    sink.write("\n## Alert Breakdown\n\n| Alert Level | Description | URLs Affected | "
+               "Previous URLs Affected | Status |\n| --- | --- | ---: | ---: | --- |\n")
+    for alert in delta['alerts']:
+        sink.write("| %s | %s | %s | %s | %s |\n" % (
+            alert['level'], alert['alert'].replace('|', '\\|'), alert['urls_affected'],
+            alert['previous_urls_affected'], alert['status']))
+
+
+def write_junit_delta(sink, delta):
+    """This keyword writes the comparison as a JUnit XML test suite with a test case per alert.
+    An alert fails when it is new or increased at one of JUNIT_FAILURE_LEVELS, so a CI gate
+    can read the result without parsing the email."""
+    alerts = delta['alerts']
+    failures = sum(1 for alert in alerts if is_junit_failure(alert))
+    suite_name = "OWASP ZAP %s / %s" % (delta['environment'], delta['scan_type'])
+    sink.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    timestamp = format_utc_date(delta['execution_date'])
+    sink.write('<testsuite name=%s tests="%s" failures="%s" timestamp=%s>\n' % (
+        quoteattr(suite_name), len(alerts), failures, quoteattr(timestamp)))
+    for alert in alerts:
+        sink.write('  <testcase classname=%s name=%s>' % (
+            quoteattr(alert['level']), quoteattr(alert['alert'])))
+        detail = "%s: %s URLs affected, %s before" % (
+            alert['status'], alert['urls_affected'], alert['previous_urls_affected'])
+        if is_junit_failure(alert):
+            sink.write('<failure type=%s message=%s/>' % (
+                quoteattr(alert['status']), quoteattr(detail)))
+        else:
+            sink.write('<system-out>%s</system-out>' % escape(detail))
+        sink.write('</testcase>\n')
+    sink.write('</testsuite>\n')
+
+
+def is_junit_failure(alert):
+    """This function returns whether an alert fails the JUnit test suite."""
+    return alert['status'] in JUNIT_FAILURE_STATUSES and \
+        alert['level'] in JUNIT_FAILURE_LEVELS
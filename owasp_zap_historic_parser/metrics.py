@@ -0,0 +1,169 @@
+"""This module measures where the time of an ingest goes: per-stage timers, row counts and the
+statements sent to the database, written out as one JSON record per report, and an optional
+cProfile and tracemalloc dump of a whole run"""
+import contextlib
+import json
+import sys
+import time
+
+PROFILE_LINES = 25
+ALLOCATION_LINES = 10
+
+
+class IngestMetrics:
+    """This class collects the metrics of one report. Time is added to the stage currently
+    open, and every statement sent through a connection wrapped by count_round_trips is
+    counted against that stage and by its SQL verb."""
+
+    def __init__(self, report=None):
+        self.report = report
+        self.stages = {}
+        self.rows = {}
+        self.statements = {}
+        self.current_stage = None
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """This method times the block it wraps as the named stage, adding to earlier time
+        spent in a stage of the same name."""
+        outer_stage = self.current_stage
+        self.current_stage = self.stages.setdefault(name, {'seconds': 0.0, 'round_trips': 0})
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current_stage['seconds'] += time.perf_counter() - started
+            self.current_stage = outer_stage
+
+    def count_rows(self, name, count):
+        """This method records a row count, such as the alerts parsed or read back."""
+        self.rows[name] = self.rows.get(name, 0) + count
+
+    def count_statement(self, sql):
+        """This method counts one statement sent to the database."""
+        verb = sql.split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+        self.statements[verb] = self.statements.get(verb, 0) + 1
+        if self.current_stage is not None:
+            self.current_stage['round_trips'] += 1
+
+    def count_round_trips(self, con):
+        """This method returns con wrapped so its statements are counted."""
+        return CountingConnection(con, self)
+
+    def record(self):
+        """This method returns the metrics as a dictionary ready for JSON."""
+        stages = {name: {'seconds': round(stage['seconds'], 6),
+                         'round_trips': stage['round_trips']}
+                  for name, stage in self.stages.items()}
+        return {'report': self.report, 'stages': stages, 'rows': self.rows,
+                'round_trips': sum(self.statements.values()), 'statements': self.statements,
+                'total_seconds': round(time.perf_counter() - self.started, 6)}
+
+
+class CountingConnection:
+    """This class passes everything through to a DB-API connection, counting the statements,
+    commits and rollbacks sent through it and through its cursors."""
+
+    def __init__(self, con, metrics):
+        self._con = con
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        """This method returns a counting cursor of the connection."""
+        return CountingCursor(self._con.cursor(*args, **kwargs), self._metrics)
+
+    def execute(self, sql, *args):
+        """This method counts and runs a statement on connections that run them directly."""
+        self._metrics.count_statement(sql)
+        return self._con.execute(sql, *args)
+
+    def commit(self):
+        """This method counts and sends a commit."""
+        self._metrics.count_statement('COMMIT')
+        return self._con.commit()
+
+    def rollback(self):
+        """This method counts and sends a rollback."""
+        self._metrics.count_statement('ROLLBACK')
+        return self._con.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+
+class CountingCursor:
+    """This class passes everything through to a DB-API cursor, counting the statements run
+    on it. An executemany call is one statement, as the drivers batch it."""
+
+    def __init__(self, cursor_obj, metrics):
+        self._cursor = cursor_obj
+        self._metrics = metrics
+
+    def execute(self, sql, *args, **kwargs):
+        """This method counts and runs a statement."""
+        self._metrics.count_statement(sql)
+        return self._cursor.execute(sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        """This method counts and runs a batched statement."""
+        self._metrics.count_statement(sql)
+        return self._cursor.executemany(sql, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def get_metrics(opts, report=None):
+    """This function returns a new IngestMetrics when opts asks for metrics, otherwise None."""
+    if getattr(opts, 'metrics', None) is None:
+        return None
+    return IngestMetrics(report)
+
+
+@contextlib.contextmanager
+def measure_stage(metrics, name):
+    """This context manager times a stage when there are metrics to record it in."""
+    if metrics is None:
+        yield
+    else:
+        with metrics.stage(name):
+            yield
+
+
+def write_metrics(destination, metrics):
+    """This function appends the metrics record as one JSON line to the destination file, or
+    writes it to stderr when destination is -."""
+    line = json.dumps(metrics.record(), sort_keys=True, separators=(',', ':')) + '\n'
+    if destination == '-':
+        sys.stderr.write(line)
+    else:
+        with open(destination, 'a', encoding='utf-8') as metrics_file:
+            metrics_file.write(line)
+
+
+def profile_run(profile_path, function, *args):
+    """This function runs function under cProfile and tracemalloc, saves the profile to
+    profile_path for pstats or a viewer, and prints the slowest functions and the largest
+    allocations to stderr. It returns what function returned."""
+    # pylint: disable=import-outside-toplevel
+    import cProfile
+    import pstats
+    import tracemalloc
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        result = profiler.runcall(function, *args)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    profiler.dump_stats(profile_path)
+    stats = pstats.Stats(profiler, stream=sys.stderr)
+    stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+    sys.stderr.write("Python memory: %.0f KiB in use, %.0f KiB peak\n" % (current / 1024,
+                                                                        peak / 1024))
+    for statistic in snapshot.statistics('lineno')[:ALLOCATION_LINES]:
+        sys.stderr.write("%s\n" % statistic)
+    sys.stderr.write("Profile written to %s\n" % profile_path)
+    return result
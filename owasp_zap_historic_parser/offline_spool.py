@@ -0,0 +1,125 @@
+"""This module keeps parsed ZAP results on local disk while the database is unreachable and
+replays them into MySQL once it is back"""
+import datetime
+import json
+import os
+from .owasp_zap_historical import get_database_location, pooled_connections, \
+    process_zap_results
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+REPLAY_SUFFIX = '.replay'
+CHECKPOINT_SUFFIX = '.checkpoint'
+
+
+def spool_zap_results(spool_path, opts, parsed_results, execution_date=None,
+                      report_digest=None):
+    """This keyword appends one parsed report to the offline spool file, synced to disk before
+    it returns, and returns a message saying where the results were kept."""
+    execution_date = execution_date or datetime.datetime.utcnow()
+    entry = {
+        'project': opts.projectname,
+        'environment': opts.this_env,
+        'scan_type': opts.scantype,
+        'url_link': opts.urllink,
+        'version': opts.version,
+        'execution_date': execution_date.strftime(DATE_FORMAT),
+        'report_digest': report_digest,
+        'results': parsed_results,
+    }
+    line = json.dumps(entry, separators=(',', ':')) + '\n'
+    # one write on an append-only descriptor, so a crash never leaves half an entry mid-file
+    descriptor = os.open(spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        os.write(descriptor, line.encode('utf-8'))
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+    message = "Database unavailable, spooled %s alerts to %s for replay" % (
+        len(parsed_results), spool_path)
+    print(message)
+    return message
+
+
+def replay_spool(opts):
+    """This keyword replays the offline spool into the database in the order it was written,
+    keeping the original execution dates. It returns the number of entries left unreplayed."""
+    spool_path = opts.target or opts.offline_spool
+    work_path = spool_path + REPLAY_SUFFIX
+    replayed = 0
+    while True:
+        # finish a replay interrupted earlier before taking the current spool
+        if not os.path.exists(work_path):
+            if not os.path.exists(spool_path):
+                break
+            os.replace(spool_path, work_path)
+        entries = read_spool_entries(work_path)
+        done = read_checkpoint(work_path)
+        for position in range(done, len(entries)):
+            try:
+                replay_entry(opts, entries[position])
+            except Exception as error:  # pylint: disable=broad-except
+                print("FAILED entry %s of %s: %s" % (position + 1, work_path, error))
+                remaining = len(entries) - position
+                print("%s spooled reports replayed, %s left" % (replayed, remaining))
+                return remaining
+            write_checkpoint(work_path, position + 1)
+            replayed += 1
+        os.remove(work_path)
+        if os.path.exists(work_path + CHECKPOINT_SUFFIX):
+            os.remove(work_path + CHECKPOINT_SUFFIX)
+    print("%s spooled reports replayed" % replayed)
+    return 0
+
+
+def replay_entry(opts, entry):
+    """This keyword stores one spooled report through the pooled MySQL connections, unless a
+    report with the same digest was ingested while it waited."""
+    from .storage import MySQLStorage  # pylint: disable=import-outside-toplevel
+    with pooled_connections(opts, entry['project']) as connected:
+        if connected is None:
+            raise ConnectionError('Unable to make MySQL connection')
+        my_ozhdb, root_ozhdb = connected
+        report_digest = entry.get('report_digest')
+        if report_digest and MySQLStorage(my_ozhdb, root_ozhdb).find_report(
+                entry['environment'], entry['scan_type'], report_digest) is not None:
+            return None
+        execution_date = datetime.datetime.strptime(entry['execution_date'], DATE_FORMAT)
+        return process_zap_results(my_ozhdb, root_ozhdb, entry['environment'],
+                                   entry['scan_type'], entry['results'], entry['project'],
+                                   entry['url_link'], entry['version'],
+                                   batch_size=opts.batch_size,
+                                   verify_totals=opts.verify_totals,
+                                   execution_date=execution_date,
+                                   report_digest=report_digest,
+                                   location=get_database_location(opts, entry['project']))
+
+
+def read_spool_entries(spool_path):
+    """This function reads the entries of a spool file, ignoring a torn final line left by a
+    crash part way through a write."""
+    entries = []
+    with open(spool_path, encoding='utf-8') as spool:
+        for line in spool:
+            if not line.endswith('\n'):
+                break
+            entries.append(json.loads(line))
+    return entries
+
+
+def read_checkpoint(work_path):
+    """This function returns how many entries of a replay file were already committed."""
+    try:
+        with open(work_path + CHECKPOINT_SUFFIX, encoding='utf-8') as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(work_path, done):
+    """This function durably records how many entries of a replay file were committed."""
+    checkpoint_path = work_path + CHECKPOINT_SUFFIX
+    with open(checkpoint_path + '.tmp', 'w', encoding='utf-8') as checkpoint:
+        checkpoint.write(str(done))
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
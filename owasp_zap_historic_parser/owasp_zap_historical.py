@@ -1,11 +1,23 @@
-"""This module is used for parsing OWASP ZAP html files and pushing the results to MySQL"""
+"""This module is used for parsing OWASP ZAP html, json and xml reports and pushing the results
+to MySQL"""
+import concurrent.futures
+import contextlib
 import datetime
-import mysql.connector
-from lxml import etree
-import pytz
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from .metrics import get_metrics, measure_stage, write_metrics
 
-# Times are stored as UTC and converted using this variable to CDT.
-CENTRAL = pytz.timezone('US/Central')
+# lxml, mysql.connector and pytz are imported by the functions that use them, so the CLI can
+# start, print help and parse reports without loading the database driver.
+# Times are stored as UTC and converted using this time zone to CDT.
+CENTRAL = 'US/Central'
 TABLE_LOCATOR = "//td[@class='risk-3']/div[.='High']"
 HIGH_LOCATOR = "//table[@class='results']//th[contains(text(),'High ')]"
 MED_LOCATOR = "//table[@class='results']//th[contains(text(),'Medium ')]"
@@ -16,79 +28,815 @@ NEW_MED_LOCATOR = "//table[@class='alerts']//td[.='Medium']"
 NEW_LOW_LOCATOR = "//table[@class='alerts']//td[.='Low']"
 NEW_INFO_LOCATOR = "//table[@class='alerts']//td[.='Informational']"
 NEW_FALSE_LOCATOR = "//table[@class='alerts']//td[.='False Positive']"
+SEVERITY_LEVELS = ['High', 'Medium', 'Low', 'Informational', 'False Positive']
+RESULTS_LEVEL_MARKERS = [('High', 'High '), ('Medium', 'Medium '), ('Low', 'Low '),
+                         ('Informational', 'Informational ')]
+RISK_CODE_LEVELS = {'3': 'High', '2': 'Medium', '1': 'Low', '0': 'Informational'}
+# Rows describing one URL instance in an html results table, in TB_ALERT_INSTANCE order
+INSTANCE_FIELDS = ['URL', 'Method', 'Parameter', 'Attack', 'Evidence']
+REPORT_EXTENSIONS = {'.html': 'html', '.htm': 'html', '.json': 'json', '.xml': 'xml'}
+# Alert breakdown table fragments, filled in with % so rows are not built by concatenation
+ALERT_TABLE_HEAD = "<h2>Alert Breakdown</h2><table style='float: left; text-align: center; " \
+                   "border: 1px white; border-collapse: collapse;' width='1400'><thead>" \
+                   "<tr style='background: gray;'><td style='border: 1px solid;'><strong>" \
+                   "Alert Level</strong></td><td style='border: 1px solid;'><strong>" \
+                   "Description</strong></td><td style='border: 1px solid;'><strong>URLs " \
+                   "Affected<br />%s</strong></td><td style='border: 1px solid;'><strong>URLs " \
+                   "Affected<br />%s</strong></td><td style='border: 1px solid;'><strong>" \
+                   "Comments</strong></td></tr></thead><tbody>"
+ALERT_ROW_START = "<tr style='background-color: %s; color: %s'><td style='border: 1px solid " \
+                  "#000;'><strong>%s</strong></td>"
+ALERT_ROW_END = "<td style='border: 1px solid #000;'><strong>%s</strong></td><td style=' " \
+                "border: 1px solid #000;'><strong>%s</strong></td><td style='border: 1px " \
+                "solid #000;'><strong>%s</strong></td><td style='border: 1px solid #000;'>" \
+                "<strong>%s</strong></td></tr>"
+# Background and text colors of the breakdown rows, in the order the levels are written
+ALERT_ROW_COLORS = {'High': ("red", "#FFF"), 'Medium': ("orange", "#FFF"),
+                    'Low': ("yellow", "#000"), 'Informational': ("blue", "#FFF"),
+                    'False Positive': ("green", "#FFF")}
+ALERT_ROW_STARTS = {level: ALERT_ROW_START % (colors + (level,))
+                    for level, colors in ALERT_ROW_COLORS.items()}
+RESOLVED_ROW_COLORS = ("lightgreen", "#000")
+ALERT_BATCH_SIZE = 500
+ALERT_LEVELS_SQL = "SELECT Alert_Level, COUNT(*) FROM TB_ALERTS WHERE Execution_Id = %s " \
+                   "GROUP BY Alert_Level"
+POOL_SIZE = 2
+POOL_RECYCLE = 3600
+# Connection pools shared by every report processed in this process, keyed by server and user
+CONNECTION_POOLS = {}
+JSON_CHUNK_SIZE = 65536
+REPORT_DIGEST_CHUNK_SIZE = 1048576
+JSON_SKIP = re.compile(r'[^"\[\]{}]*')
+JSON_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+JSON_ARRAY_START = re.compile(r'\s*:\s*\[')
+JSON_SEPARATOR = re.compile(r'[\s,]*')
 
 
 def process_zap_file(opts):
     """This keyword parses the ZAP results, stores them into the appropriate tables,
         then compares the results to the most recent scan on the same environment and scan type."""
-    # parse html results from Legion OWASP ZAP job
-    parsed_results = html_parser(opts.filename)
-    # connect to database
-    my_ozhdb = connect_to_mysql_db(opts.ozh_host, opts.ozh_port, opts.ozh_username,
-                                   opts.ozh_password, opts.projectname)
-    root_ozhdb = connect_to_mysql_db(opts.ozh_host, opts.ozh_port, opts.ozh_username,
-                                     opts.ozh_password, 'owaspzaphistoric')
-    # insert latest result into tb_alerts and tb_execution, update tb_project,
-    # and compare to last result
-    final_message = process_zap_results(my_ozhdb, root_ozhdb, opts.this_env, opts.scantype,
-                                        parsed_results, opts.projectname, opts.urllink,
-                                        opts.version)
-    print(final_message)
+    metrics = get_metrics(opts, opts.filename)
+    # the comparison is streamed to stdout as it is written and kept to be returned
+    output = io.StringIO()
+    sink = TeeWriter(sys.stdout, output)
+    try:
+        with measure_stage(metrics, 'digest'):
+            report_digest = get_report_digest(opts.filename)
+        # a report sent again prints the comparison of the execution it was stored as
+        duplicate_id, unreachable = find_duplicate_report(opts, report_digest, sink, metrics)
+        final_message = None
+        if duplicate_id is None:
+            # parse results from Legion OWASP ZAP job
+            with measure_stage(metrics, 'parse'):
+                parsed_results = parse_report(opts.filename, opts.streaming)
+            if metrics is not None:
+                metrics.count_rows('parsed_alerts', len(parsed_results))
+            # only a spooled report comes back as a message, which the spool has printed
+            final_message = store_zap_results(opts, parsed_results, sink, metrics,
+                                              report_digest, opts.filename, unreachable)
+        if final_message is None:
+            # end the streamed comparison the way printing it whole did
+            print()
+            final_message = output.getvalue()
+        if duplicate_id is not None:
+            sys.stderr.write("Report already ingested as execution %s\n" % duplicate_id)
+    finally:
+        if metrics is not None:
+            write_metrics(opts.metrics, metrics)
     return final_message
 
 
+class TeeWriter:
+    """This class is a file-like sink passing everything written to it on to each of its
+    sinks."""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, text):
+        """This method writes text to every sink."""
+        for sink in self.sinks:
+            sink.write(text)
+
+
+def process_zap_batch(opts, report_paths):
+    """This keyword parses several ZAP reports in a process pool, then stores and compares them
+    one at a time in the given order over pooled connections. It prints a summary line per
+    report and returns the number of reports that failed."""
+    failures = 0
+    # an unreadable report gets no digest here and fails on its own below
+    report_digests = {}
+    for report_path in report_paths:
+        with contextlib.suppress(OSError):
+            report_digests[report_path] = get_report_digest(report_path)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=opts.workers) as executor:
+        # identical reports are parsed once, and not at all when already ingested
+        parse_jobs = {}
+        for report_path, report_digest in report_digests.items():
+            if report_digest not in parse_jobs:
+                parse_jobs[report_digest] = executor.submit(parse_report, report_path,
+                                                            opts.streaming)
+        for report_path in report_paths:
+            # parsing runs in the workers, so only the store stages are measured here
+            metrics = get_metrics(opts, report_path)
+            try:
+                report_digest = report_digests.get(report_path)
+                if report_digest is None:
+                    report_digest = get_report_digest(report_path)
+                duplicate_id, unreachable = find_duplicate_report(opts, report_digest,
+                                                                  metrics=metrics)
+                if duplicate_id is not None:
+                    parse_jobs[report_digest].cancel()
+                    print("SAME   %s: already ingested as execution %s" % (report_path,
+                                                                         duplicate_id))
+                    continue
+                parsed_results = parse_jobs[report_digest].result()
+                store_zap_results(opts, parsed_results, metrics=metrics,
+                                  report_digest=report_digest, report_path=report_path,
+                                  unreachable=unreachable)
+            except Exception as error:  # pylint: disable=broad-except
+                failures += 1
+                print("FAILED %s: %s" % (report_path, error))
+                continue
+            finally:
+                if metrics is not None:
+                    write_metrics(opts.metrics, metrics)
+            print("OK     %s: %s alerts" % (report_path, len(parsed_results)))
+    print("%s of %s reports ingested" % (len(report_paths) - failures, len(report_paths)))
+    return failures
+
+
+def write_parsed_reports(report_paths, sink, streaming=False):
+    """This keyword parses each report and writes its alerts to sink as canonical NDJSON, one
+    record per alert followed by a record with the report's severity totals. Nothing is
+    stored, so the database driver is never loaded."""
+    for report_path in report_paths:
+        parsed_results = parse_report(report_path, streaming)
+        for level, alert_type, urls_affected in parsed_results:
+            write_ndjson_record(sink, {'report': report_path, 'level': level,
+                                       'alert': alert_type, 'urls_affected': urls_affected})
+        write_ndjson_record(sink, {'report': report_path,
+                                   'totals': count_alert_levels(parsed_results)})
+
+
+def write_ndjson_record(sink, record):
+    """This function writes one record as a line of canonical json."""
+    sink.write(json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n')
+
+
+def get_report_digest(filename):
+    """This function returns the SHA-256 of a report file, read in chunks so large reports
+    are never held in memory."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as report:
+        for chunk in iter(lambda: report.read(REPORT_DIGEST_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_duplicate_report(opts, report_digest, sink=None, metrics=None):
+    """This keyword looks for an execution of the environment and scan type in opts stored
+    from a report with this digest. If there is one it writes that execution's comparison to
+    sink, when one is given, records the report as a duplicate with opts.record_duplicate and
+    returns the execution id. It returns None when the report is new and raises
+    ConnectionError when the database cannot be reached."""
+    with open_storage(opts, metrics) as storage:
+        with measure_stage(metrics, 'find_duplicate'):
+            execution_id = storage.find_report(opts.this_env, opts.scantype, report_digest)
+        if execution_id is None:
+            return None
+        if opts.record_duplicate:
+            with measure_stage(metrics, 'insert'):
+                storage.add_duplicate(execution_id, datetime.datetime.utcnow(),
+                                      opts.urllink, opts.version)
+        if sink is not None:
+            replay_duplicate_report(storage, opts.this_env, opts.scantype, execution_id,
+                                    sink, opts.output_format, metrics)
+        return execution_id
+
+
+def find_duplicate_report(opts, report_digest, sink=None, metrics=None):
+    """This keyword runs store_duplicate_report and returns the execution id it found, or
+    None, and whether the database could not be reached, so the store that follows goes
+    straight to the offline spool instead of waiting for the server again."""
+    try:
+        return store_duplicate_report(opts, report_digest, sink, metrics), False
+    except ConnectionError:
+        return None, True
+
+
+def store_zap_results(opts, parsed_results, sink=None, metrics=None, report_digest=None,
+                      report_path=None, unreachable=False):
+    """This keyword stores parsed ZAP results for the project in opts and returns the
+    comparison with the previous execution, or writes it to sink if one is given. With
+    metrics the stages and database statements of the store are measured. The report_digest
+    is stored with the execution. With opts.capture_instances the URL instances are read
+    again from report_path while they are stored; spooled results are kept without them.
+    When unreachable says MySQL already failed to connect for this report, the results are
+    spooled without trying it again."""
+    baseline_cache = get_baseline_cache(opts)
+    instances = None
+    if opts.capture_instances and report_path is not None:
+        instances = iter_report_instances(report_path)
+    if opts.backend == 'sqlite':
+        from .storage import SQLiteStorage  # pylint: disable=import-outside-toplevel
+        with measure_stage(metrics, 'connect'):
+            storage = SQLiteStorage(opts.sqlite_path, opts.projectname)
+        if metrics is not None:
+            storage.con = metrics.count_round_trips(storage.con)
+            storage.ocon = metrics.count_round_trips(storage.ocon)
+        try:
+            return record_zap_results(storage, opts.this_env, opts.scantype, parsed_results,
+                                      opts.projectname, opts.urllink, opts.version,
+                                      batch_size=opts.batch_size,
+                                      verify_totals=opts.verify_totals,
+                                      baseline_cache=baseline_cache, sink=sink,
+                                      output_format=opts.output_format, metrics=metrics,
+                                      report_digest=report_digest, instances=instances)
+        finally:
+            storage.close()
+    if unreachable:
+        return spool_unstored_results(opts, parsed_results, report_digest)
+    # connect to database, reusing pooled connections from earlier reports
+    with contextlib.ExitStack() as connections:
+        with measure_stage(metrics, 'connect'):
+            connected = connections.enter_context(pooled_connections(opts))
+        if connected is None:
+            return spool_unstored_results(opts, parsed_results, report_digest)
+        my_ozhdb, root_ozhdb = connected
+        # insert latest result into tb_alerts and tb_execution, update tb_project,
+        # and compare to last result
+        return process_zap_results(my_ozhdb, root_ozhdb, opts.this_env, opts.scantype,
+                                   parsed_results, opts.projectname, opts.urllink,
+                                   opts.version, batch_size=opts.batch_size,
+                                   verify_totals=opts.verify_totals,
+                                   baseline_cache=baseline_cache, sink=sink,
+                                   output_format=opts.output_format, metrics=metrics,
+                                   report_digest=report_digest,
+                                   location=get_database_location(opts, opts.projectname),
+                                   instances=instances)
+
+
+def spool_unstored_results(opts, parsed_results, report_digest=None):
+    """This keyword keeps results MySQL could not take in the offline spool for a later
+    replay and returns the message saying where, or raises ConnectionError when opts has no
+    offline spool."""
+    if not opts.offline_spool:
+        raise ConnectionError('Unable to make MySQL connection')
+    # keep the results for a later replay instead of failing the job
+    from .offline_spool import spool_zap_results  # pylint: disable=import-outside-toplevel
+    return spool_zap_results(opts.offline_spool, opts, parsed_results,
+                             report_digest=report_digest)
+
+
+@contextlib.contextmanager
+def pooled_connections(opts, projectname=None):
+    """This context manager yields pooled connections to the project schema, opts.projectname
+    unless another is given, and to owaspzaphistoric, or None when either cannot be made.
+    The second is not tried once the first has failed, as each attempt can wait out the
+    whole connect timeout."""
+    pool = get_connection_pool(opts.ozh_host, opts.ozh_port, opts.ozh_username,
+                               opts.ozh_password, opts.pool_size, opts.pool_recycle,
+                               opts.connect_timeout)
+    with pool.connection(projectname or opts.projectname) as my_ozhdb:
+        if my_ozhdb is None:
+            yield None
+            return
+        with pool.connection('owaspzaphistoric') as root_ozhdb:
+            yield None if root_ozhdb is None else (my_ozhdb, root_ozhdb)
+
+
+def get_baseline_cache(opts):
+    """This function returns the baseline cache for the database in opts, or None when
+    --baseline-cache is not set."""
+    if not opts.baseline_cache:
+        return None
+    from .baseline_cache import BaselineCache  # pylint: disable=import-outside-toplevel
+    return BaselineCache(opts.baseline_cache, get_database_location(opts))
+
+
+def get_database_location(opts, dbname=None):
+    """This function returns a name for the SQLite directory or MySQL server in opts, followed
+    by the schema when a dbname is given, which keys what is cached about that database."""
+    if opts.backend == 'sqlite':
+        location = 'sqlite:' + os.path.abspath(opts.sqlite_path)
+    else:
+        location = 'mysql:%s:%s' % (opts.ozh_host, opts.ozh_port)
+    return location if dbname is None else '%s/%s' % (location, dbname)
+
+
+@contextlib.contextmanager
+def open_storage(opts, metrics=None):
+    """This keyword yields the storage backend selected in opts, using pooled connections for
+    MySQL, and closes it afterwards. With metrics its statements are counted."""
+    # pylint: disable=import-outside-toplevel
+    from .storage import MySQLStorage, SQLiteStorage
+    if opts.backend == 'sqlite':
+        storage = SQLiteStorage(opts.sqlite_path, opts.projectname)
+        if metrics is not None:
+            storage.con = metrics.count_round_trips(storage.con)
+            storage.ocon = metrics.count_round_trips(storage.ocon)
+        try:
+            yield storage
+        finally:
+            storage.close()
+        return
+    with pooled_connections(opts) as connected:
+        if connected is None:
+            raise ConnectionError('Unable to make MySQL connection')
+        my_ozhdb, root_ozhdb = connected
+        if metrics is not None:
+            my_ozhdb = metrics.count_round_trips(my_ozhdb)
+            root_ozhdb = metrics.count_round_trips(root_ozhdb)
+        yield MySQLStorage(my_ozhdb, root_ozhdb, get_database_location(opts, opts.projectname))
+
+
+def migrate_schema(opts):
+    """This keyword creates or upgrades the project and owaspzaphistoric schemas, including
+    the indexes the comparison queries use, and prints the query plan of each of those
+    queries. Running it again changes nothing."""
+    # pylint: disable=import-outside-toplevel
+    from .storage import MySQLStorage, SQLiteStorage
+    if opts.backend == 'sqlite':
+        storage = SQLiteStorage(opts.sqlite_path, opts.projectname)
+        try:
+            print_schema_report(storage, opts.projectname)
+        finally:
+            storage.close()
+        return
+    # a fresh server has neither schema yet, so connect without a default one to create them
+    server_db = connect_to_mysql_db(opts.ozh_host, opts.ozh_port, opts.ozh_username,
+                                    opts.ozh_password, None, opts.connect_timeout)
+    if server_db is None:
+        raise ConnectionError('Unable to make MySQL connection')
+    try:
+        cursor_obj = server_db.cursor()
+        for dbname in (opts.projectname, 'owaspzaphistoric'):
+            cursor_obj.execute("CREATE DATABASE IF NOT EXISTS `%s`" % dbname.replace('`', '``'))
+            if cursor_obj.rowcount:
+                print("Created database %s" % dbname)
+    finally:
+        server_db.close()
+    root_ozhdb = connect_to_mysql_db(opts.ozh_host, opts.ozh_port, opts.ozh_username,
+                                     opts.ozh_password, 'owaspzaphistoric', opts.connect_timeout)
+    if root_ozhdb is None:
+        raise ConnectionError('Unable to make MySQL connection')
+    try:
+        my_ozhdb = connect_to_mysql_db(opts.ozh_host, opts.ozh_port, opts.ozh_username,
+                                       opts.ozh_password, opts.projectname, opts.connect_timeout)
+        if my_ozhdb is None:
+            raise ConnectionError('Unable to make MySQL connection')
+        try:
+            print_schema_report(MySQLStorage(my_ozhdb, root_ozhdb), opts.projectname)
+        finally:
+            my_ozhdb.close()
+    finally:
+        root_ozhdb.close()
+
+
+def print_schema_report(storage, projectname):
+    """This keyword migrates a storage backend's schemas and prints the changes made and the
+    comparison query plans."""
+    changes = storage.migrate(projectname)
+    for change in changes:
+        print(change)
+    if not changes:
+        print("Schema for %s is up to date" % projectname)
+    for sql, plan in storage.query_plans():
+        print("\n" + sql)
+        for line in plan:
+            print("  " + line)
+
+
+def expand_report_paths(report_spec):
+    """This function turns the -f argument into the list of reports to process. A directory
+    gives the ZAP reports in it, a glob gives its matches and @file gives the reports listed
+    in that manifest, one per line. Anything else is a single report."""
+    if not report_spec:
+        return [report_spec]
+    if report_spec.startswith('@'):
+        manifest_path = report_spec[1:]
+        manifest_dir = os.path.dirname(manifest_path)
+        with open(manifest_path, encoding='utf-8') as manifest:
+            return [os.path.join(manifest_dir, line.strip()) for line in manifest
+                    if line.strip() and not line.strip().startswith('#')]
+    if os.path.isdir(report_spec):
+        return sorted(os.path.join(report_spec, file_name)
+                      for file_name in os.listdir(report_spec)
+                      if os.path.splitext(file_name)[1].lower() in REPORT_EXTENSIONS)
+    if glob.has_magic(report_spec):
+        return sorted(glob.glob(report_spec))
+    return [report_spec]
+
+
+def parse_report(filename, streaming=False):
+    """This keyword parses a ZAP html, json or xml report, picking the reader from the file
+    extension or, failing that, from the start of the file."""
+    report_format = get_report_format(filename)
+    if report_format == 'json':
+        return json_parser(filename)
+    if report_format == 'xml':
+        return xml_parser(filename)
+    if streaming:
+        return html_stream_parser(filename)
+    return html_parser(filename)
+
+
+def get_report_format(filename):
+    """This function returns 'html', 'json' or 'xml' for a ZAP report."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in REPORT_EXTENSIONS:
+        return REPORT_EXTENSIONS[extension]
+    with open(filename, 'rb') as report:
+        head = report.read(1024)
+    if head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'{'):
+        return 'json'
+    if b'<OWASPZAPReport' in head:
+        return 'xml'
+    return 'html'
+
+
 def html_parser(filename):
     """This keyword parses the ZAP html file."""
-    # ID locators and put into list
-    zap_results = []
+    from lxml import etree  # pylint: disable=import-outside-toplevel
     # Get parser ready
     parser = etree.HTMLParser()
     tree = etree.parse(filename, parser)
-    # See if report has alert table and adjust which locators to use
+    aggregator = AlertAggregator()
+    aggregator.add_rows(iter_html_alerts(tree))
+    return aggregator.results()
+
+
+class AlertAggregator:
+    """This class merges parsed alert rows sharing a level and alert type, adding up their
+    URL counts. Rows can be fed from any report format in any order."""
+
+    def __init__(self):
+        self._index = {}
+
+    def add(self, level, alert_type, url_count):
+        """This method adds one alert row, merging it into an existing (level, alert type)
+        entry when there is one."""
+        key = (level, alert_type)
+        result = self._index.get(key)
+        if result is None:
+            self._index[key] = [level, alert_type, url_count]
+        else:
+            result[2] = result[2] + url_count
+
+    def add_rows(self, rows):
+        """This method adds every (level, alert type, URL count) row of an iterable."""
+        for level, alert_type, url_count in rows:
+            self.add(level, alert_type, url_count)
+
+    def results(self):
+        """This method returns the merged [level, alert type, URL count] entries grouped by
+        severity, keeping first-seen order within each level."""
+        return sorted(self._index.values(), key=lambda result: get_severity_rank(result[0]))
+
+    def __len__(self):
+        return len(self._index)
+
+
+def get_severity_rank(level):
+    """This function returns the sort position of an alert level, unknown levels last."""
+    try:
+        return SEVERITY_LEVELS.index(level)
+    except ValueError:
+        return len(SEVERITY_LEVELS)
+
+
+def iter_html_alerts(tree):
+    """This generator walks each alerts/results table of a parsed ZAP report once and yields
+    (level, alert name, URL count) for every alert row in document order."""
+    # See if report has alert table and adjust which tables to walk
     table_count = int(tree.xpath("count(" + TABLE_LOCATOR + ")"))
-    if table_count > 0:
-        loc_list = [NEW_HIGH_LOCATOR, NEW_MED_LOCATOR, NEW_LOW_LOCATOR, NEW_INFO_LOCATOR,
-                    NEW_FALSE_LOCATOR]
-    else:
-        loc_list = [HIGH_LOCATOR, MED_LOCATOR, LOW_LOCATOR, INFO_LOCATOR]
-    # Iterate through locators and get alert information and url count
-    for loc in loc_list:
-        level = ''
-        url_count = ''
-        loc_count = int(tree.xpath("count(" + loc + ")"))
-        if loc in [HIGH_LOCATOR, NEW_HIGH_LOCATOR]:
-            level = 'High'
-        elif loc in [MED_LOCATOR, NEW_MED_LOCATOR]:
-            level = 'Medium'
-        elif loc in [LOW_LOCATOR, NEW_LOW_LOCATOR]:
-            level = 'Low'
-        elif loc in [INFO_LOCATOR, NEW_INFO_LOCATOR]:
-            level = 'Informational'
-        elif loc == NEW_FALSE_LOCATOR:
-            level = 'False Positive'
-        for i in range(loc_count):
-            # set alert name locator for older or newer zap report
-            this_alert_loc, this_url_loc = get_locators(loc, i)
-            alert_type = tree.xpath(this_alert_loc)[0]
-            # set url count locator for older or newer zap report
-            if loc in [HIGH_LOCATOR, MED_LOCATOR, LOW_LOCATOR, INFO_LOCATOR]:
-                url_count = int(tree.xpath("count(" + this_url_loc + ")"))
-            elif loc in [NEW_HIGH_LOCATOR, NEW_MED_LOCATOR, NEW_LOW_LOCATOR, NEW_INFO_LOCATOR,
-                         NEW_FALSE_LOCATOR]:
-                url_count = int(tree.xpath(this_url_loc)[0].text)
-            this_result = [level, alert_type.text, url_count]
-            if not zap_results:
-                zap_results.append(this_result)
+    table_class = 'alerts' if table_count > 0 else 'results'
+    for table in tree.iter('table'):
+        if table.get('class') != table_class:
+            continue
+        # nested tables are covered by the walk of their outermost table
+        if any(outer.get('class') == table_class for outer in table.iterancestors('table')):
+            continue
+        if table_class == 'alerts':
+            yield from iter_alerts_table(table)
+        else:
+            yield from iter_results_table(table)
+
+
+def iter_alerts_table(table):
+    """This generator yields the alert rows of a newer ZAP report's alerts table."""
+    for cell in table.iter('td'):
+        level = get_string_value(cell)
+        if level in SEVERITY_LEVELS:
+            yield (level,) + read_alerts_row(cell.getparent())
+
+
+def iter_results_table(table):
+    """This generator yields the alert rows of an older ZAP report's results table."""
+    url_counts = {}
+    for header in table.iter('th'):
+        header_text = get_first_text(header)
+        for level, marker in RESULTS_LEVEL_MARKERS:
+            if marker not in header_text:
                 continue
-            # if alert already exists in zap_results, then just add the URL count
-            for result in zap_results:
-                if level == result[0] and alert_type.text == result[1]:
-                    result[2] = result[2] + url_count
-                    break
-                if result == zap_results[-1]:
-                    zap_results.append(this_result)
+            row = header.getparent()
+            container = row.getparent()
+            # URL rows are counted once per alert block, however many headers match it
+            if container not in url_counts:
+                url_counts[container] = sum(1 for cell in container.iter('td')
+                                            if get_string_value(cell) == 'URL')
+            yield level, row.findall('th')[1].text, url_counts[container]
+
+
+def read_alerts_row(row):
+    """This function returns the alert name and instance count of an alerts table row."""
+    cells = [child for child in row if child.tag == 'td']
+    return cells[0].find('a').text, int(cells[2].text)
+
+
+def html_stream_parser(filename):
+    """This keyword parses the ZAP html file incrementally, keeping memory use bounded for
+    very large reports."""
+    aggregator = AlertAggregator()
+    aggregator.add_rows(iter_html_alerts_streaming(filename))
+    return aggregator.results()
+
+
+def iter_html_alerts_streaming(filename):
+    """This generator yields the same rows as iter_html_alerts while the report is still being
+    read, emitting each alert as its table row (or, for older reports, its alert block)
+    closes and discarding elements once they are processed."""
+    from lxml import etree  # pylint: disable=import-outside-toplevel
+    new_layout = False
+    open_tables = []
+    # older reports: alert block element -> [level, alert name] pairs and its URL row count
+    pending_blocks = {}
+    url_counts = {}
+    for event, element in etree.iterparse(filename, events=('start', 'end'), html=True):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'table':
+                open_tables.append(element.get('class'))
+            continue
+        if tag == 'div' and not new_layout:
+            # same test as TABLE_LOCATOR; the summary table precedes the alert tables
+            parent = element.getparent()
+            new_layout = parent is not None and parent.tag == 'td' and \
+                parent.get('class') == 'risk-3' and get_string_value(element) == 'High'
+        elif tag == 'td' and not new_layout and 'results' in open_tables:
+            if get_string_value(element) == 'URL':
+                for ancestor in element.iterancestors():
+                    url_counts[ancestor] = url_counts.get(ancestor, 0) + 1
+        elif tag == 'tr' and new_layout and 'alerts' in open_tables:
+            for cell in element:
+                level = get_string_value(cell) if cell.tag == 'td' else None
+                if level in SEVERITY_LEVELS:
+                    yield (level,) + read_alerts_row(element)
+        elif tag == 'tr' and not new_layout and 'results' in open_tables:
+            for header in element.iter('th'):
+                header_text = get_first_text(header)
+                for level, marker in RESULTS_LEVEL_MARKERS:
+                    if marker in header_text:
+                        block = header.getparent().getparent()
+                        alert_name = header.getparent().findall('th')[1].text
+                        pending_blocks.setdefault(block, []).append((level, alert_name))
+        elif tag == 'table':
+            open_tables.pop()
+        if element in pending_blocks:
+            url_count = url_counts.get(element, 0)
+            for level, alert_name in pending_blocks.pop(element):
+                yield level, alert_name, url_count
+        url_counts.pop(element, None)
+        # drop processed rows and finished top level sections
+        parent = element.getparent()
+        if tag == 'tr' or (parent is not None and parent.tag == 'body'):
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def json_parser(filename):
+    """This keyword parses the ZAP json file."""
+    aggregator = AlertAggregator()
+    aggregator.add_rows(iter_json_alerts(filename))
+    return aggregator.results()
+
+
+def iter_json_alerts(filename):
+    """This generator reads a ZAP json report in chunks and yields (level, alert name,
+    URL count) for each alert, decoding a single alert object at a time."""
+    with open(filename, encoding='utf-8-sig') as report:
+        stream = JsonReportStream(report)
+        while stream.find_array('alerts'):
+            for alert in stream.iter_array():
+                instances = alert.get('instances') or []
+                yield (get_zap_level(alert.get('riskcode'), alert.get('confidence')),
+                       alert.get('alert') or alert.get('name'),
+                       int(alert.get('count', len(instances))))
+
+
+class JsonReportStream:
+    """This class scans a json document from a file object without loading all of it, so the
+    values of a chosen array can be decoded one by one."""
+
+    def __init__(self, report, chunk_size=JSON_CHUNK_SIZE):
+        self._report = report
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+
+    def find_array(self, key):
+        """This method moves past the next object member called key whose value is an array,
+        returning False if the document ends first."""
+        while True:
+            self._pos = self._match(JSON_SKIP).end()
+            if self._pos >= len(self._buffer):
+                return False
+            if self._buffer[self._pos] != '"':
+                self._pos += 1
+                continue
+            string = self._match(JSON_STRING)
+            if string is None:
+                raise ValueError('Unterminated string in json report')
+            self._pos = string.end()
+            if string.group() == '"' + key + '"':
+                array_start = self._match(JSON_ARRAY_START)
+                if array_start is not None:
+                    self._pos = array_start.end()
+                    return True
+
+    def iter_array(self):
+        """This generator decodes the values of the array the stream is positioned in."""
+        while True:
+            self._pos = self._match(JSON_SEPARATOR).end()
+            if self._pos >= len(self._buffer):
+                raise ValueError('Unexpected end of json report')
+            if self._buffer[self._pos] == ']':
+                self._pos += 1
+                return
+            while True:
+                try:
+                    value, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
                     break
-    return zap_results
+                except json.JSONDecodeError:
+                    if not self._read():
+                        raise
+            yield value
+
+    def _match(self, pattern):
+        """This method matches pattern at the current position, reading on while the match
+        reaches the end of what has been read so far."""
+        while True:
+            match = pattern.match(self._buffer, self._pos)
+            if match is not None and match.end() < len(self._buffer):
+                return match
+            if not self._read():
+                return match
+
+    def _read(self):
+        """This method appends the next chunk of the report to the buffer, dropping what has
+        been consumed. Chunks grow with the buffer so large values decode in linear time."""
+        chunk = self._report.read(max(self._chunk_size, len(self._buffer) - self._pos))
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+
+def xml_parser(filename):
+    """This keyword parses the ZAP xml file."""
+    aggregator = AlertAggregator()
+    aggregator.add_rows(iter_xml_alerts(filename))
+    return aggregator.results()
+
+
+def iter_xml_alerts(filename):
+    """This generator yields (level, alert name, URL count) for each alertitem of a ZAP xml
+    report as it is read, clearing every alertitem once processed."""
+    from lxml import etree  # pylint: disable=import-outside-toplevel
+    for _, element in etree.iterparse(filename, events=('end',), tag='alertitem'):
+        count = element.findtext('count')
+        if count is None:
+            count = len(element.findall('instances/instance'))
+        yield (get_zap_level(element.findtext('riskcode'), element.findtext('confidence')),
+               element.findtext('alert') or element.findtext('name'),
+               int(count))
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def iter_report_instances(filename):
+    """This generator yields (level, alert name, URL, method, parameter, attack, evidence)
+    for every URL instance of an alert in a ZAP report of any format, reading the report
+    incrementally so the instances of a large scan are never all held in memory."""
+    report_format = get_report_format(filename)
+    if report_format == 'json':
+        return iter_json_instances(filename)
+    if report_format == 'xml':
+        return iter_xml_instances(filename)
+    return iter_html_instances(filename)
+
+
+def iter_html_instances(filename):
+    """This generator yields the URL instances of the results tables of a ZAP html report as
+    it is read. An instance starts at its URL row and takes the method, parameter, attack and
+    evidence rows after it; rows are discarded once processed."""
+    from lxml import etree  # pylint: disable=import-outside-toplevel
+    alert = instance = None
+    for _, element in etree.iterparse(filename, events=('end',), tag=('tr', 'table'),
+                                      html=True):
+        if element.tag == 'table':
+            if instance is not None:
+                yield alert + tuple(instance)
+            alert = instance = None
+        else:
+            headers = [child for child in element if child.tag == 'th']
+            cells = [child for child in element if child.tag == 'td']
+            if len(headers) == 2:
+                if instance is not None:
+                    yield alert + tuple(instance)
+                alert = (get_results_level(get_string_value(headers[0]).strip()),
+                         headers[1].text)
+                instance = None
+            elif alert is not None and len(cells) == 2:
+                label = get_string_value(cells[0]).strip()
+                if label == 'URL':
+                    if instance is not None:
+                        yield alert + tuple(instance)
+                    instance = [''] * len(INSTANCE_FIELDS)
+                if instance is not None and label in INSTANCE_FIELDS:
+                    instance[INSTANCE_FIELDS.index(label)] = get_string_value(cells[1]).strip()
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def get_results_level(header_text):
+    """This function returns the alert level of a results table header, which is the level
+    itself in newer reports and the level followed by the confidence in older ones."""
+    if header_text in SEVERITY_LEVELS:
+        return header_text
+    for level, marker in RESULTS_LEVEL_MARKERS:
+        if marker in header_text:
+            return level
+    return header_text
+
+
+def iter_json_instances(filename):
+    """This generator yields the URL instances of each alert of a ZAP json report, decoding
+    a single alert object at a time."""
+    with open(filename, encoding='utf-8-sig') as report:
+        stream = JsonReportStream(report)
+        while stream.find_array('alerts'):
+            for alert in stream.iter_array():
+                level = get_zap_level(alert.get('riskcode'), alert.get('confidence'))
+                alert_name = alert.get('alert') or alert.get('name')
+                for instance in alert.get('instances') or []:
+                    yield (level, alert_name) + tuple(
+                        instance.get(field) or '' for field in
+                        ('uri', 'method', 'param', 'attack', 'evidence'))
+
+
+def iter_xml_instances(filename):
+    """This generator yields the URL instances of each alertitem of a ZAP xml report as it is
+    read, clearing every alertitem once processed."""
+    from lxml import etree  # pylint: disable=import-outside-toplevel
+    for _, element in etree.iterparse(filename, events=('end',), tag='alertitem'):
+        level = get_zap_level(element.findtext('riskcode'), element.findtext('confidence'))
+        alert_name = element.findtext('alert') or element.findtext('name')
+        for instance in element.iterfind('instances/instance'):
+            yield (level, alert_name) + tuple(
+                instance.findtext(field) or '' for field in
+                ('uri', 'method', 'param', 'attack', 'evidence'))
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def get_zap_level(riskcode, confidence):
+    """This function returns the alert level ZAP shows for a risk code and confidence."""
+    if str(confidence) == '0':
+        return 'False Positive'
+    return RISK_CODE_LEVELS[str(riskcode)]
+
+
+def get_string_value(element):
+    """This function returns the XPath string value of an element."""
+    return ''.join(element.itertext())
+
+
+def get_first_text(element):
+    """This function returns the first text node of an element, as XPath's text() would."""
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return ''
 
 
 def get_locators(base_loc, loc_index):
@@ -106,66 +854,145 @@ def get_locators(base_loc, loc_index):
     return alert_loc, url_count_loc
 
 
-def process_zap_results(con, ocon, this_env, scantype, zapresults, projectname, url_link, version):
+def process_zap_results(con, ocon, this_env, scantype, zapresults, projectname, url_link, version,
+                        batch_size=ALERT_BATCH_SIZE, verify_totals=False, execution_date=None,
+                        baseline_cache=None, sink=None, output_format='html', metrics=None,
+                        report_digest=None, location=None, instances=None):
     """This keyword takes the parsed results from the ZAP file and inserts them into the
-     appropriate tables."""
-    cursor_obj = con.cursor()
-    root_cursor_obj = ocon.cursor()
-    # new row in TB_EXECUTION table
-    utc = datetime.datetime.utcnow()
-    cursor_obj.execute("INSERT INTO TB_EXECUTION (Execution_Id, Execution_Date) "
-                       "VALUES (0, '%s')" % utc)
-    con.commit()
-    cursor_obj.execute("SELECT Execution_Id, Execution_Date from TB_EXECUTION ORDER BY "
-                       "Execution_Id DESC LIMIT 1;")
-    last_id = cursor_obj.fetchone()
-    # update project's TB_ALERTS table
-    for result in zapresults:
-        this_level = result[0]
-        this_type = result[1]
-        this_urls_aff = result[2]
-        sql = "INSERT INTO TB_ALERTS (Alert_Id, Execution_Id, Alert_Level, Alert_Type," \
-              " URLS_Affected)" \
-              "VALUES (%s, %s, %s, %s, %s);"
-        val = (0, last_id[0], this_level, this_type, this_urls_aff)
-        cursor_obj.execute(sql, val)
-        con.commit()
-    # get alert totals from TB_ALERTS for TB_EXECUTION
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_ALERTS WHERE Execution_Id = '%s' AND"
-                       " Alert_Level ='High' ;" % last_id[0])
-    high_alerts = cursor_obj.fetchone()
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_ALERTS WHERE Execution_Id = '%s' AND"
-                       " Alert_Level ='Medium' ;" % last_id[0])
-    medium_alerts = cursor_obj.fetchone()
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_ALERTS WHERE Execution_Id = '%s' AND"
-                       " Alert_Level ='Low' ;" % last_id[0])
-    low_alerts = cursor_obj.fetchone()
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_ALERTS WHERE Execution_Id = '%s' AND"
-                       " Alert_Level ='Informational' ;" % last_id[0])
-    info_alerts = cursor_obj.fetchone()
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_ALERTS WHERE Execution_Id = '%s' AND"
-                       " Alert_Level ='False Positive' ;" % last_id[0])
-    false_alerts = cursor_obj.fetchone()
-    # update project's TB_EXECUTION latest id
-    cursor_obj.execute("UPDATE TB_EXECUTION SET Environment = '%s', Scan_Type = '%s',"
-                       "High_Alerts = %s, Medium_Alerts = %s,"
-                       "Low_Alerts = %s, Informational_Alerts = %s, False_Alerts = %s,"
-                       "URL_Link = '%s', Version = '%s' WHERE Execution_Id='%s';"
-                       % (this_env, scantype, high_alerts[0], medium_alerts[0], low_alerts[0],
-                          info_alerts[0], false_alerts[0], url_link, version, last_id[0]))
-    con.commit()
-    # update owasphistoric.TB_PROJECT table
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_EXECUTION;")
-    execution_rows = cursor_obj.fetchone()
-    root_cursor_obj.execute(
-        "UPDATE TB_PROJECT SET Last_Updated = '%s', Total_Executions = %s, Environment = '%s',"
-        "Scan_Type ='%s', Recent_High =%s, Recent_Medium =%s, Recent_Low =%s, "
-        "Recent_Informational =%s, Recent_False =%s, Version ='%s' WHERE Project_Name='%s';"
-        % (utc, execution_rows[0], this_env, scantype, high_alerts[0], medium_alerts[0],
-           low_alerts[0], info_alerts[0], false_alerts[0], version, projectname))
-    ocon.commit()
-    last_date = last_id[1].replace(tzinfo=datetime.timezone.utc) \
-        .astimezone(CENTRAL).strftime('%b %d %Y %I:%M %p %Z')
+     appropriate MySQL tables through the project and owaspzaphistoric connections, returning
+     the comparison with the previous execution. The location of the project schema shares
+     its alert type ids with later reports."""
+    from .storage import MySQLStorage  # pylint: disable=import-outside-toplevel
+    if metrics is not None:
+        con = metrics.count_round_trips(con)
+        ocon = metrics.count_round_trips(ocon)
+    return record_zap_results(MySQLStorage(con, ocon, location), this_env, scantype, zapresults,
+                              projectname, url_link, version, batch_size=batch_size,
+                              verify_totals=verify_totals, execution_date=execution_date,
+                              baseline_cache=baseline_cache, sink=sink,
+                              output_format=output_format, metrics=metrics,
+                              report_digest=report_digest, instances=instances)
+
+
+def record_zap_results(storage, this_env, scantype, zapresults, projectname, url_link, version,
+                       batch_size=ALERT_BATCH_SIZE, verify_totals=False, execution_date=None,
+                       baseline_cache=None, sink=None, output_format='html', metrics=None,
+                       report_digest=None, instances=None):
+    """This keyword records the parsed results in a storage backend and builds the comparison
+     with the previous execution, returning it, or writing it to sink if one is given. The
+     execution row, its alerts and its alert totals are committed together, so a failure
+     part way through leaves no partial execution behind.
+     With verify_totals the alert totals are checked against TB_ALERTS before committing. The
+     execution is dated now in UTC unless an execution_date is given. With a baseline_cache
+     the previous execution is taken from the cache when it is still the latest one. The
+     comparison is the HTML email body unless output_format names one of DELTA_FORMATS.
+     With metrics each stage is timed and the alerts written and read back are counted. The
+     report_digest is stored with the execution so the same report is not ingested again.
+     The URL instances of the alerts are stored from instances when it is given."""
+    utc = execution_date or datetime.datetime.utcnow()
+    with measure_stage(metrics, 'insert'):
+        execution_id, totals, previous_id, total_executions = storage.add_execution(
+            utc, this_env, scantype, zapresults, url_link, version, batch_size, verify_totals,
+            report_digest, instances)
+    with measure_stage(metrics, 'update_project'):
+        # update owasphistoric.TB_PROJECT table
+        storage.update_project(projectname, utc, this_env, scantype, totals, version,
+                               total_executions)
+    # compare against the newest execution before this one, ignoring any ingested since
+    compare_row = None
+    current_dict = last_dict = {}
+    with measure_stage(metrics, 'compare'):
+        if previous_id is not None:
+            # alerts are matched by alert type id, their level and type are only read to render
+            current_alerts = storage.get_alert_counts(execution_id)
+            baseline = None
+            if baseline_cache is not None:
+                baseline = baseline_cache.load(projectname, this_env, scantype, previous_id)
+            if baseline is None:
+                compare_row = storage.get_execution(previous_id)
+                last_alerts = storage.get_alert_counts(previous_id)
+            else:
+                compare_row, last_alerts = baseline
+            alert_names = storage.get_alert_names(
+                [key for key, _ in current_alerts] + [key for key, _ in last_alerts])
+            current_dict = convert_alert_counts_to_dictionary(current_alerts, alert_names)
+            last_dict = convert_alert_counts_to_dictionary(last_alerts, alert_names)
+        elif output_format != 'html':
+            # with nothing to compare against every alert of the first execution is new
+            current_dict = convert_alert_to_dictionary(zapresults)
+        if baseline_cache is not None:
+            # the ids were resolved when the execution was added, so this reads the cache only
+            alert_type_ids = storage.resolve_alert_types(zapresults)
+            baseline_cache.save(projectname, this_env, scantype,
+                                (execution_id, utc, url_link, version),
+                                [[alert_type_ids[(level, alert_type)], urls_affected]
+                                 for level, alert_type, urls_affected in zapresults])
+    if metrics is not None:
+        metrics.count_rows('inserted_alerts', len(zapresults))
+        if previous_id is not None:
+            metrics.count_rows('current_alerts', len(current_alerts))
+            metrics.count_rows('previous_alerts', len(last_alerts))
+    output = io.StringIO() if sink is None else sink
+    with measure_stage(metrics, 'render'):
+        write_comparison(output, output_format, this_env, scantype, (utc, url_link, version),
+                         totals, compare_row, current_dict, last_dict)
+    return output.getvalue() if sink is None else None
+
+
+def replay_duplicate_report(storage, this_env, scantype, execution_id, sink=None,
+                            output_format='html', metrics=None):
+    """This keyword builds the comparison of an execution already stored, execution_id, with
+    the execution of the environment and scan type before it, returning it, or writing it to
+    sink if one is given."""
+    compare_row = None
+    last_dict = {}
+    with measure_stage(metrics, 'compare'):
+        execution_row = storage.get_execution(execution_id)
+        current_alerts = storage.get_alert_counts(execution_id)
+        last_alerts = []
+        previous_id = storage.get_previous_execution(this_env, scantype, execution_id)
+        if previous_id is not None:
+            compare_row = storage.get_execution(previous_id)
+            last_alerts = storage.get_alert_counts(previous_id)
+        alert_names = storage.get_alert_names(
+            [key for key, _ in current_alerts] + [key for key, _ in last_alerts])
+        current_dict = convert_alert_counts_to_dictionary(current_alerts, alert_names)
+        last_dict = convert_alert_counts_to_dictionary(last_alerts, alert_names)
+    output = io.StringIO() if sink is None else sink
+    with measure_stage(metrics, 'render'):
+        write_comparison(output, output_format, this_env, scantype, execution_row[1:],
+                         count_alert_levels([alert_names[key] for key, _ in current_alerts]),
+                         compare_row, current_dict, last_dict)
+    return output.getvalue() if sink is None else None
+
+
+def write_comparison(sink, output_format, this_env, scantype, execution_row, totals,
+                     compare_row, current_dict, last_dict):
+    """This keyword writes the comparison of an execution, whose (date, link, version) is
+    execution_row, with the previous one, compare_row, to sink as the HTML email body or in
+    one of DELTA_FORMATS."""
+    utc, url_link, version = execution_row
+    if output_format == 'html':
+        write_html_comparison(sink, this_env, scantype, version, url_link, utc, totals,
+                              compare_row, current_dict, last_dict)
+    else:
+        # pylint: disable=import-outside-toplevel
+        from .delta_formats import build_alert_delta, write_alert_delta
+        write_alert_delta(sink, output_format,
+                          build_alert_delta(this_env, scantype, execution_row, compare_row,
+                                            totals, current_dict, last_dict))
+
+
+def write_html_comparison(sink, this_env, scantype, version, url_link, utc, totals,
+                          compare_row, current_dict, last_dict):
+    """This keyword writes the HTML email body comparing an execution with the previous one,
+    compare_row, to sink. Without a compare_row only the report details are written."""
+    high_alerts = totals['High']
+    medium_alerts = totals['Medium']
+    low_alerts = totals['Low']
+    info_alerts = totals['Informational']
+    false_alerts = totals['False Positive']
+    last_date = format_report_date(utc)
     # compare latest results
     # Construct title for email body
     title = "<h1>OWASP ZAP Report Comparison for " + this_env + " / " + scantype + " / " + \
@@ -175,63 +1002,111 @@ def process_zap_results(con, ocon, this_env, scantype, zapresults, projectname,
             "<td style='border: 1px;'>" + "<strong>This report link:</strong></td><td style" + \
             "='border: 1px;'><a href='" + url_link.replace(' ', '%20') + "'>This ZAP Report" + \
             "</a></td></tr>"
-    overall = ""
-    alert_breakdown = ""
-    cursor_obj.execute("SELECT COUNT(*) FROM TB_EXECUTION WHERE Environment = '%s'"
-                       " AND Scan_Type ='%s' ;" % (this_env, scantype))
-    compare_rows = cursor_obj.fetchone()
-    if compare_rows[0] < 2:
-        title += "</tbody></table><p>Not enough rows to compare results for " + this_env + \
-                 " and " + scantype + ".</p><hr />"
-    else:
-        cursor_obj.execute("SELECT Execution_Id, Execution_Date, URL_Link FROM TB_EXECUTION "
-                           "WHERE Environment = '%s' AND Scan_Type ='%s' ORDER BY Execution_Id "
-                           "DESC LIMIT 2;" % (this_env, scantype))
-        these_rows = cursor_obj.fetchall()
-        compare_row = these_rows[1]
-        cursor_obj.execute("SELECT Alert_level, Alert_Type, URLS_Affected FROM TB_ALERTS WHERE "
-                           "Execution_Id = '%s'" % last_id[0])
-        current_alerts = cursor_obj.fetchall()
-        cursor_obj.execute("SELECT Alert_level, Alert_Type, URLS_Affected FROM TB_ALERTS WHERE "
-                           "Execution_Id = '%s'" % compare_row[0])
-        last_alerts = cursor_obj.fetchall()
-        cursor_obj.execute("SELECT Version FROM TB_EXECUTION WHERE Execution_Id = '%s'"
-                           % compare_row[0])
-        last_version = cursor_obj.fetchone()
-        compare_date = compare_row[1].replace(tzinfo=datetime.timezone.utc) \
-            .astimezone(CENTRAL).strftime('%b %d %Y %I:%M %p %Z')
-        title += "<tr><td style='border: 1px;'><strong>Comparison Report Version:</strong></td>" + \
-                 "<td style='border: 1px;'>" + str(last_version[0]) + "</td></tr><tr>" + \
-                 "<td style='border: 1px;'><strong>Comparison Report Date:</strong></td>" + \
-                 "<td style='border: 1px;'>" + compare_date + "</td></tr><tr>" + \
-                 "<td style='border: 1px;'><strong>Comparison Report Link:</strong></td>" + \
-                 "<td style='border: 1px;'><a href='" + compare_row[2].replace(' ', '%20') + "'>" +\
-                 "Comparison ZAP Report</a></td></tr></tbody></table><hr />"
-        # Construct Overall Alerts Table
-        total_alerts = high_alerts[0] + medium_alerts[0] + low_alerts[0] + info_alerts[0] + \
-                       false_alerts[0]
-        overall = "<h2>Overall Alerts</h2><table style='float: left; text-align: center; " + \
-                  "border: 1px white; border-collapse: collapse;' width='465'><thead><tr " + \
-                  "style='background: gray;'><td style='border: 1px solid;'><strong>Total" + \
-                  "</strong></td><td style='border: 1px solid;'><strong>High</strong></td>" + \
-                  "<td style='border: 1px solid;'><strong>Medium</strong></td><td style='" + \
-                  "border: 1px solid;'><strong>Low</strong></td><td style='border: 1px solid;'>" + \
-                  "<strong>Informational</strong></td><td style='border: 1px solid;'>" + \
-                  "<strong>False Positives</strong></td></tr></thead><tbody><tr style='" + \
-                  "background: silver;'><td style='border: 1px solid;'><strong>" + \
-                  str(total_alerts) + "</strong></td><td style='border: 1px solid black; " + \
-                  "'><strong>" + str(high_alerts[0]) + "</strong></td><td style='" + \
-                  "border: 1px solid black;'><strong>" + str(medium_alerts[0]) + \
-                  "</strong></td><td style='border: 1px solid black;'><strong>" + \
-                  str(low_alerts[0]) + "</strong></td><td style='border: 1px solid black; " + \
-                  "'><strong>" + str(info_alerts[0]) + "</strong></td>" + \
-                  "<td style='border: 1px solid black;'><strong>" + \
-                  str(false_alerts[0]) + "</strong></td></tr></tbody></table><br><br><br><hr />"
-        current_dict = convert_alert_to_dictionary(current_alerts)
-        last_dict = convert_alert_to_dictionary(last_alerts)
-        alert_breakdown = compare_zap_results(current_dict, last_dict, last_date,
-                                              compare_date)
-    return title + overall + alert_breakdown
+    if compare_row is None:
+        sink.write(title + "</tbody></table><p>Not enough rows to compare results for " +
+                   this_env + " and " + scantype + ".</p><hr />")
+        return
+    last_version = compare_row[3]
+    compare_date = format_report_date(compare_row[1])
+    title += "<tr><td style='border: 1px;'><strong>Comparison Report Version:</strong></td>" + \
+             "<td style='border: 1px;'>" + str(last_version) + "</td></tr><tr>" + \
+             "<td style='border: 1px;'><strong>Comparison Report Date:</strong></td>" + \
+             "<td style='border: 1px;'>" + compare_date + "</td></tr><tr>" + \
+             "<td style='border: 1px;'><strong>Comparison Report Link:</strong></td>" + \
+             "<td style='border: 1px;'><a href='" + compare_row[2].replace(' ', '%20') + "'>" + \
+             "Comparison ZAP Report</a></td></tr></tbody></table><hr />"
+    # Construct Overall Alerts Table
+    total_alerts = high_alerts + medium_alerts + low_alerts + info_alerts + \
+        false_alerts
+    overall = "<h2>Overall Alerts</h2><table style='float: left; text-align: center; " + \
+              "border: 1px white; border-collapse: collapse;' width='465'><thead><tr " + \
+              "style='background: gray;'><td style='border: 1px solid;'><strong>Total" + \
+              "</strong></td><td style='border: 1px solid;'><strong>High</strong></td>" + \
+              "<td style='border: 1px solid;'><strong>Medium</strong></td><td style='" + \
+              "border: 1px solid;'><strong>Low</strong></td><td style='border: 1px solid;'>" + \
+              "<strong>Informational</strong></td><td style='border: 1px solid;'>" + \
+              "<strong>False Positives</strong></td></tr></thead><tbody><tr style='" + \
+              "background: silver;'><td style='border: 1px solid;'><strong>" + \
+              str(total_alerts) + "</strong></td><td style='border: 1px solid black; " + \
+              "'><strong>" + str(high_alerts) + "</strong></td><td style='" + \
+              "border: 1px solid black;'><strong>" + str(medium_alerts) + \
+              "</strong></td><td style='border: 1px solid black;'><strong>" + \
+              str(low_alerts) + "</strong></td><td style='border: 1px solid black; " + \
+              "'><strong>" + str(info_alerts) + "</strong></td>" + \
+              "<td style='border: 1px solid black;'><strong>" + \
+              str(false_alerts) + "</strong></td></tr></tbody></table><br><br><br><hr />"
+    sink.write(title)
+    sink.write(overall)
+    write_alert_breakdown(sink, current_dict, last_dict, last_date, compare_date)
+
+
+def insert_alerts(cursor_obj, execution_id, zapresults, alert_type_ids,
+                  batch_size=ALERT_BATCH_SIZE, placeholder='%s'):
+    """This function inserts an execution's parsed alerts into TB_ALERTS with their
+    TB_ALERT_TYPE ids from alert_type_ids, keyed by (level, type), sending up to batch_size
+    rows per executemany call. It does not commit."""
+    sql = "INSERT INTO TB_ALERTS (Execution_Id, Alert_Level, Alert_Type, URLS_Affected, " \
+          "Alert_Type_Id) VALUES (%s);" % ', '.join([placeholder] * 5)
+    values = [(execution_id, level, alert_type, urls_affected,
+               alert_type_ids[(level, alert_type)])
+              for level, alert_type, urls_affected in zapresults]
+    for start in range(0, len(values), batch_size):
+        cursor_obj.executemany(sql, values[start:start + batch_size])
+
+
+def insert_instances(cursor_obj, execution_id, instances, alert_type_ids,
+                     batch_size=ALERT_BATCH_SIZE, placeholder='%s'):
+    """This function inserts the URL instances of an execution's alerts into
+    TB_ALERT_INSTANCE as they are read from instances, sending up to batch_size rows per
+    executemany call, which the MySQL driver sends as one multi-row INSERT. It returns the
+    number of instances stored and does not commit."""
+    sql = "INSERT INTO TB_ALERT_INSTANCE (Execution_Id, Alert_Type_Id, URL, Method, " \
+          "Parameter, Attack, Evidence) VALUES (%s);" % ', '.join([placeholder] * 7)
+    stored = 0
+    batch = []
+    for level, alert_type, *fields in instances:
+        alert_type_id = alert_type_ids.get((level, alert_type))
+        # instances are only kept for the alerts stored with them
+        if alert_type_id is None:
+            continue
+        batch.append((execution_id, alert_type_id, *fields))
+        if len(batch) == batch_size:
+            cursor_obj.executemany(sql, batch)
+            stored += len(batch)
+            batch = []
+    if batch:
+        cursor_obj.executemany(sql, batch)
+        stored += len(batch)
+    return stored
+
+
+def count_alert_levels(zapresults):
+    """This function returns the number of alerts at each severity level of parsed results."""
+    totals = dict.fromkeys(SEVERITY_LEVELS, 0)
+    for result in zapresults:
+        if result[0] in totals:
+            totals[result[0]] += 1
+    return totals
+
+
+def verify_alert_levels(cursor_obj, execution_id, totals, placeholder='%s'):
+    """This function checks alert totals against an execution's TB_ALERTS rows using a single
+    grouped query, raising ValueError if they differ."""
+    cursor_obj.execute(ALERT_LEVELS_SQL.replace('%s', placeholder), (execution_id,))
+    stored_totals = dict.fromkeys(SEVERITY_LEVELS, 0)
+    for level, count in cursor_obj.fetchall():
+        if level in stored_totals:
+            stored_totals[level] = count
+    if stored_totals != totals:
+        raise ValueError("Alert totals %s do not match TB_ALERTS totals %s for execution %s"
+                         % (totals, stored_totals, execution_id))
+
+
+def format_report_date(utc_date):
+    """This function formats a UTC execution date in central time for the email body."""
+    import pytz  # pylint: disable=import-outside-toplevel
+    return utc_date.replace(tzinfo=datetime.timezone.utc) \
+        .astimezone(pytz.timezone(CENTRAL)).strftime('%b %d %Y %I:%M %p %Z')
 
 
 def convert_alert_to_dictionary(alert_list):
@@ -246,87 +1121,62 @@ def convert_alert_to_dictionary(alert_list):
     return overall_dict
 
 
+def convert_alert_counts_to_dictionary(alert_counts, alert_names):
+    """This function converts (key, urls affected) rows into a dictionary of dictionaries
+    keyed by their alert type key, with the level and type of each key from alert_names."""
+    overall_dict = {}
+    for key, count in alert_counts:
+        level, alert_type = alert_names[key]
+        overall_dict[key] = {'Alert Level': level,
+                             'Alert Type': alert_type,
+                             'URLs Affected': count}
+    return overall_dict
+
+
 def compare_zap_results(set1, set2, date1, date2):
     """This keyword compares the current ZAP result with the most recent result of the same
     parameters and creates a table showing the differences."""
+    alerts_table = io.StringIO()
+    write_alert_breakdown(alerts_table, set1, set2, date1, date2)
+    return alerts_table.getvalue()
+
+
+def write_alert_breakdown(sink, set1, set2, date1, date2):
+    """This keyword writes the table of differences between the current ZAP result and the
+    previous one to sink, a row at a time. Alerts are written by severity, then the alerts
+    only found in the previous result."""
     # Set H2 and Table Headers
-    alerts_table = "<h2>Alert Breakdown</h2><table style='float: left; text-align: center; " + \
-                   "border: 1px white; border-collapse: collapse;' width='1400'><thead>" + \
-                   "<tr style='background: gray;'><td style='border: 1px solid;'><strong>" + \
-                   "Alert Level</strong></td><td style='border: 1px solid;'><strong>Description" + \
-                   "</strong></td><td style='border: 1px solid;'><strong>URLs Affected<br />" + \
-                   date1 + "</strong></td><td style='border: 1px solid;'><strong>URLs " + \
-                   "Affected<br />" + date2 + "</strong></td><td style='border: 1px solid" + \
-                   ";'><strong>Comments</strong></td></tr></thead><tbody>"
-    # Set Alert Table
-    high_alerts = ''
-    low_alerts = ''
-    med_alerts = ''
-    info_alerts = ''
-    false_alerts = ''
-    resolved_alerts = ''
+    sink.write(ALERT_TABLE_HEAD % (date1, date2))
+    # one pass sorts the current alerts by severity, rows are then written in that order
+    keys_by_level = {level: [] for level in ALERT_ROW_COLORS}
     for key in set1:
-        if key in set2:
-            if set2[key]['Alert Level'] == "High":
-                high_alerts += get_alert_table_row("red", "#FFF", "High",
-                                                   set1[key]['Alert Type'],
-                                                   set1[key]['URLs Affected'],
-                                                   set2[key]['URLs Affected'])
-            elif set2[key]['Alert Level'] == "Medium":
-                med_alerts += get_alert_table_row("orange", "#FFF", "Medium",
-                                                  set1[key]['Alert Type'],
-                                                  set1[key]['URLs Affected'],
-                                                  set2[key]['URLs Affected'])
-            elif set2[key]['Alert Level'] == "Low":
-                low_alerts += get_alert_table_row("yellow", "#000", "Low",
-                                                  set1[key]['Alert Type'],
-                                                  set1[key]['URLs Affected'],
-                                                  set2[key]['URLs Affected'])
-            elif set2[key]['Alert Level'] == "Informational":
-                info_alerts += get_alert_table_row("blue", "#FFF", "Informational",
-                                                   set1[key]['Alert Type'],
-                                                   set1[key]['URLs Affected'],
-                                                   set2[key]['URLs Affected'])
-            elif set2[key]['Alert Level'] == "False Positive":
-                false_alerts += get_alert_table_row("green", "#FFF", "False Positive",
-                                                    set1[key]['Alert Type'],
-                                                    set1[key]['URLs Affected'],
-                                                    set2[key]['URLs Affected'])
-        else:
-            if set1[key]['Alert Level'] == "High":
-                high_alerts += get_alert_table_row("red", "#FFF", "High",
-                                                   set1[key]['Alert Type'],
-                                                   set1[key]['URLs Affected'], 0)
-            elif set1[key]['Alert Level'] == "Medium":
-                med_alerts += get_alert_table_row("orange", "#FFF", "Medium",
-                                                  set1[key]['Alert Type'],
-                                                  set1[key]['URLs Affected'], 0)
-            elif set1[key]['Alert Level'] == "Low":
-                low_alerts += get_alert_table_row("yellow", "#000", "Low",
-                                                  set1[key]['Alert Type'],
-                                                  set1[key]['URLs Affected'], 0)
-            elif set1[key]['Alert Level'] == "Informational":
-                info_alerts += get_alert_table_row("blue", "#FFF", "Informational",
-                                                   set1[key]['Alert Type'],
-                                                   set1[key]['URLs Affected'], 0)
-            elif set1[key]['Alert Level'] == "False Positive":
-                false_alerts += get_alert_table_row("green", "#FFF", "False Positive",
-                                                    set1[key]['Alert Type'],
-                                                    set1[key]['URLs Affected'], 0)
+        level_keys = keys_by_level.get(set1[key]['Alert Level'])
+        if level_keys is not None:
+            level_keys.append(key)
+    for level, level_keys in keys_by_level.items():
+        row_start = ALERT_ROW_STARTS[level]
+        for key in level_keys:
+            urls = set1[key]['URLs Affected']
+            urls2 = set2[key]['URLs Affected'] if key in set2 else 0
+            sink.write(row_start + ALERT_ROW_END % (set1[key]['Alert Type'], urls, urls2,
+                                                    get_alert_comment(urls, urls2)))
     for key in set2:
         if key not in set1:
-            resolved_alerts += get_alert_table_row("lightgreen", "#000",
-                                                   set2[key]['Alert Level'],
-                                                   set2[key]['Alert Type'],
-                                                   0, set2[key]['URLs Affected'])
-    # Construct and close Alerts table
-    alerts_table += high_alerts + med_alerts + low_alerts + info_alerts + \
-                    false_alerts + resolved_alerts + "</tbody></table>"
-    return alerts_table
+            sink.write(get_alert_table_row(*RESOLVED_ROW_COLORS, set2[key]['Alert Level'],
+                                           set2[key]['Alert Type'], 0,
+                                           set2[key]['URLs Affected']))
+    # Close Alerts table
+    sink.write("</tbody></table>")
 
 
 def get_alert_table_row(back_color, color, alert_type, desc, urls, urls2):
     """This method creates a table row for the alert table."""
+    return ALERT_ROW_START % (back_color, color, alert_type) + \
+        ALERT_ROW_END % (desc, urls, urls2, get_alert_comment(urls, urls2))
+
+
+def get_alert_comment(urls, urls2):
+    """This function returns the comment on how an alert's URLs affected changed."""
     comments = ''
     if urls > urls2 > 0:
         comments = 'Number of URLs Affected increased'
@@ -338,41 +1188,128 @@ def get_alert_table_row(back_color, color, alert_type, desc, urls, urls2):
         comments = 'Alert potentially resolved'
     elif urls2 == 0:
         comments = 'New Alert'
-    return (
-            "<tr style='background-color: "
-            + back_color
-            + "; color: "
-            + color
-            + "'><td style='border: 1px solid #000"
-            + ";'><strong>"
-            + alert_type
-            + "</strong></td><td style='border: 1px "
-            + "solid #000;'><strong>"
-            + desc
-            + "</strong></td><td style=' border: 1px solid #000;'>"
-            + "<strong>"
-            + str(urls)
-            + "</strong>"
-            + "</td><td style='border: 1px solid #000"
-            + ";'><strong>"
-            + str(urls2)
-            + "</strong></td><td style='border: 1px solid #000;'>"
-            + "<strong>"
-            + comments
-            + "</strong></td></tr>"
-    )
-
-
-def connect_to_mysql_db(host, port, user, pwd, dbname):
-    """This keyword makes the connection to the MySQL database."""
+    return comments
+
+
+def connect_to_mysql_db(host, port, user, pwd, dbname, timeout=None):
+    """This keyword makes the connection to the MySQL database, giving up after timeout
+    seconds when one is set. It returns None when the server cannot be reached or the
+    connection times out. Any other error, such as a wrong password or a missing schema, is
+    raised, so it is not mistaken for an unreachable database and spooled."""
+    import mysql.connector  # pylint: disable=import-outside-toplevel
+    options = {}
+    if timeout is not None:
+        options['connection_timeout'] = timeout
     try:
         return mysql.connector.connect(
             host=host,
             port=port,
             user=user,
             passwd=pwd,
-            database=dbname
+            database=dbname,
+            **options
         )
     except AttributeError:
         print('Unable to make MySQL connection')
         return None
+    except (mysql.connector.InterfaceError, mysql.connector.OperationalError) as error:
+        print('Unable to make MySQL connection: %s' % error)
+        return None
+
+
+class ConnectionPool:
+    """This class keeps MySQL connections to one server open between reports. Connections are
+    switched to the requested schema when handed out and replaced once older than recycle
+    seconds."""
+
+    def __init__(self, host, port, user, pwd, size=POOL_SIZE, recycle=POOL_RECYCLE,
+                 timeout=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.pwd = pwd
+        self.size = size
+        self.recycle = recycle
+        self.timeout = timeout
+        self._idle = []
+        self._opened = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, dbname):
+        """This method returns an open connection using the dbname schema, or None if no
+        connection can be made."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                con = self._idle.pop()
+            if time.monotonic() - self._opened.get(id(con), 0) < self.recycle and \
+                    con.is_connected():
+                con.database = dbname
+                return con
+            self.discard(con)
+        con = connect_to_mysql_db(self.host, self.port, self.user, self.pwd, dbname,
+                                  self.timeout)
+        if con is not None:
+            self._opened[id(con)] = time.monotonic()
+        return con
+
+    def release(self, con):
+        """This method hands a connection back for reuse, closing it if the pool is full."""
+        if con is None:
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(con)
+                return
+        self.discard(con)
+
+    def discard(self, con):
+        """This method closes a connection instead of returning it to the pool."""
+        if con is None:
+            return
+        self._opened.pop(id(con), None)
+        try:
+            con.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    @contextlib.contextmanager
+    def connection(self, dbname):
+        """This context manager acquires a connection and releases it afterwards, discarding
+        it instead if the block raised."""
+        con = self.acquire(dbname)
+        try:
+            yield con
+        except BaseException:
+            self.discard(con)
+            raise
+        self.release(con)
+
+    def close(self):
+        """This method closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            self.discard(con)
+
+
+def get_connection_pool(host, port, user, pwd, size=POOL_SIZE, recycle=POOL_RECYCLE,
+                        timeout=None):
+    """This keyword returns the process wide connection pool for a MySQL server and user,
+    creating it on first use."""
+    key = (host, port, user)
+    pool = CONNECTION_POOLS.get(key)
+    if pool is None:
+        pool = CONNECTION_POOLS[key] = ConnectionPool(host, port, user, pwd, size, recycle,
+                                                      timeout)
+    pool.size = size
+    pool.recycle = recycle
+    pool.timeout = timeout
+    return pool
+
+
+def close_connection_pools():
+    """This keyword closes and forgets every connection pool."""
+    while CONNECTION_POOLS:
+        CONNECTION_POOLS.popitem()[1].close()
@@ -1,12 +1,28 @@
-"""This is the arguments/runner module for OWASP ZAP Historical Parser"""
+"""This is the arguments/runner module for OWASP ZAP Historical Parser.
+Processing modules are imported once the arguments are parsed, keeping --help and argument
+errors fast."""
 import argparse
-from .owasp_zap_historical import process_zap_file
+import sys
 
 
 def parse_options():
     """This function defines the arguments"""
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
+    parser.add_argument(
+        'command', nargs='?',
+        choices=['ingest', 'watch', 'replay', 'init-schema', 'migrate', 'trend'],
+        default='ingest',
+        help="ingest the -f report(s), watch a spool directory for new reports, replay the "
+             "offline spool into the database, create/upgrade the schemas (init-schema "
+             "and migrate are the same), or show alert trends over the latest executions"
+    )
+
+    parser.add_argument(
+        'target', nargs='?',
+        help="Spool directory for the watch command, offline spool file for replay"
+    )
+
     general = parser.add_argument_group("General")
 
     general.add_argument(
@@ -48,13 +64,183 @@ def parse_options():
     )
 
     general.add_argument(
-        '-f', '--filename', dest='filename', help="File / path of ZAP report.html"
+        '-f', '--filename', dest='filename',
+        help="File / path of ZAP report.html, report.json or report.xml. A directory, glob or "
+             "@manifest file ingests several reports"
+    )
+
+    general.add_argument(
+        '--streaming', dest='streaming', action='store_true',
+        help="Parse the report incrementally to bound memory use on very large reports"
+    )
+
+    general.add_argument(
+        '--batch-size', dest='batch_size', type=int, default=500,
+        help="Number of alerts inserted per database statement"
+    )
+
+    general.add_argument(
+        '--verify-totals', dest='verify_totals', action='store_true',
+        help="Check the alert totals against the stored alerts before committing"
+    )
+
+    general.add_argument(
+        '--pool-size', dest='pool_size', type=int, default=2,
+        help="Number of idle MySQL connections kept for reuse between reports"
+    )
+
+    general.add_argument(
+        '--pool-recycle', dest='pool_recycle', type=int, default=3600,
+        help="Seconds after which a pooled MySQL connection is replaced"
+    )
+
+    general.add_argument(
+        '--workers', dest='workers', type=int, default=None,
+        help="Number of processes parsing reports when ingesting several, all CPUs if not set"
+    )
+
+    general.add_argument(
+        '--parse-only', dest='parse_only', action='store_true',
+        help="Only parse the report(s) and write the alerts as NDJSON, without MySQL"
+    )
+
+    general.add_argument(
+        '-o', '--output', dest='output', default='-',
+        help="File the --parse-only NDJSON is written to, - for stdout"
+    )
+
+    general.add_argument(
+        '--backend', dest='backend', choices=['mysql', 'sqlite'], default='mysql',
+        help="Database the results are stored in"
+    )
+
+    general.add_argument(
+        '--sqlite-path', dest='sqlite_path', default='zap_history',
+        help="Directory holding the SQLite databases for --backend sqlite"
+    )
+
+    general.add_argument(
+        '--baseline-cache', dest='baseline_cache', default=None,
+        help="Directory caching the latest alerts of each environment and scan type, so the "
+             "comparison does not read them back from the database"
+    )
+
+    general.add_argument(
+        '--offline-spool', dest='offline_spool', default=None,
+        help="File the parsed results are appended to when MySQL is unreachable, replayed "
+             "later with the replay command"
+    )
+
+    general.add_argument(
+        '--connect-timeout', dest='connect_timeout', type=int, default=None,
+        help="Seconds to wait for a MySQL connection before giving up"
+    )
+
+    general.add_argument(
+        '--output-format', dest='output_format',
+        choices=['html', 'json', 'markdown', 'junit'], default='html',
+        help="Format the comparison with the previous execution is printed in"
+    )
+
+    general.add_argument(
+        '--record-duplicate', dest='record_duplicate', action='store_true',
+        help="Record a reference row when a report identical to one already ingested for the "
+             "environment and scan type is sent again, instead of only printing its comparison"
+    )
+
+    general.add_argument(
+        '--capture-instances', dest='capture_instances', action='store_true',
+        help="Also store the URL, method, parameter, attack and evidence of every alert "
+             "instance, read from the report in a second streaming pass"
+    )
+
+    general.add_argument(
+        '--metrics', dest='metrics', default=None,
+        help="File a JSON line of stage timings, row counts and database round trips is "
+             "appended to for each report, - for stderr"
+    )
+
+    general.add_argument(
+        '--profile', dest='profile', default=None,
+        help="File the cProfile statistics of the ingest are saved to, with a summary and "
+             "the largest allocations printed to stderr"
+    )
+
+    general.add_argument(
+        '--runs', dest='runs', type=int, default=10,
+        help="Number of latest executions the trend command covers"
+    )
+
+    watch = parser.add_argument_group("Watch")
+
+    watch.add_argument(
+        '--poll-interval', dest='poll_interval', type=float, default=5.0,
+        help="Seconds between checks of the spool directory"
+    )
+
+    watch.add_argument(
+        '--max-backoff', dest='max_backoff', type=float, default=300.0,
+        help="Longest wait in seconds between retries while the database is unavailable"
     )
 
-    return parser.parse_args()
+    args = parser.parse_intermixed_args()
+    if args.command == 'watch' and not args.target:
+        parser.error("the watch command needs a spool directory")
+    if args.command == 'replay' and not (args.target or args.offline_spool):
+        parser.error("the replay command needs an offline spool file")
+    if args.command in ('init-schema', 'migrate', 'trend') and not args.projectname:
+        parser.error("the %s command needs a project name (-n)" % args.command)
+    return args
 
 
 def main():
     """This function processes the arguments"""
     args = parse_options()
-    process_zap_file(args)
+    # pylint: disable=import-outside-toplevel
+    if args.command == 'watch':
+        from .watcher import watch_spool
+        watch_spool(args)
+        return 0
+    if args.command == 'replay':
+        from .offline_spool import replay_spool
+        return 1 if replay_spool(args) else 0
+    if args.command in ('init-schema', 'migrate'):
+        from .owasp_zap_historical import migrate_schema
+        migrate_schema(args)
+        return 0
+    if args.command == 'trend':
+        from .trends import report_trends
+        return report_trends(args)
+    from .owasp_zap_historical import expand_report_paths
+    report_paths = expand_report_paths(args.filename)
+    if not report_paths:
+        print("No ZAP reports found for %s" % args.filename)
+        return 1
+    if args.parse_only:
+        return parse_only(args, report_paths)
+    if args.profile:
+        from .metrics import profile_run
+        return profile_run(args.profile, ingest, args, report_paths)
+    return ingest(args, report_paths)
+
+
+def ingest(args, report_paths):
+    """This function stores and compares the reports, one directly or several in a batch"""
+    # pylint: disable=import-outside-toplevel
+    from .owasp_zap_historical import process_zap_file, process_zap_batch
+    if report_paths == [args.filename]:
+        process_zap_file(args)
+        return 0
+    return 1 if process_zap_batch(args, report_paths) else 0
+
+
+def parse_only(args, report_paths):
+    """This function writes the parsed alerts of the reports as NDJSON"""
+    # pylint: disable=import-outside-toplevel
+    from .owasp_zap_historical import write_parsed_reports
+    if args.output == '-':
+        write_parsed_reports(report_paths, sys.stdout, args.streaming)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as sink:
+            write_parsed_reports(report_paths, sink, args.streaming)
+    return 0
@@ -0,0 +1,722 @@
+"""This module holds the storage backends the parsed ZAP results are recorded in. Each backend
+keeps a project's executions and alerts apart from the shared project table, like the MySQL
+project and owaspzaphistoric schemas."""
+import datetime
+import os
+import sqlite3
+from .owasp_zap_historical import ALERT_BATCH_SIZE, ALERT_LEVELS_SQL, count_alert_levels, \
+    insert_alerts, insert_instances, verify_alert_levels
+
+ROOT_DATABASE = 'owaspzaphistoric'
+# Tables of each schema, in creation order
+MYSQL_PROJECT_TABLES = {
+    'TB_EXECUTION': "CREATE TABLE IF NOT EXISTS TB_EXECUTION (Execution_Id INT NOT NULL "
+                    "AUTO_INCREMENT PRIMARY KEY, Execution_Date DATETIME, Environment TEXT, "
+                    "Scan_Type TEXT, High_Alerts INT, Medium_Alerts INT, Low_Alerts INT, "
+                    "Informational_Alerts INT, False_Alerts INT, URL_Link TEXT, Version TEXT, "
+                    "Report_Digest CHAR(64))",
+    'TB_ALERTS': "CREATE TABLE IF NOT EXISTS TB_ALERTS (Alert_Id INT NOT NULL AUTO_INCREMENT "
+                 "PRIMARY KEY, Execution_Id INT, Alert_Level TEXT, Alert_Type TEXT, "
+                 "URLS_Affected INT, Alert_Type_Id INT)",
+    # compared byte for byte, so the ids match the alert texts exactly
+    'TB_ALERT_TYPE': "CREATE TABLE IF NOT EXISTS TB_ALERT_TYPE (Alert_Type_Id INT NOT NULL "
+                     "AUTO_INCREMENT PRIMARY KEY, Alert_Level VARCHAR(32) CHARACTER SET "
+                     "utf8mb4 COLLATE utf8mb4_bin NOT NULL, Alert_Type VARCHAR(512) CHARACTER "
+                     "SET utf8mb4 COLLATE utf8mb4_bin NOT NULL, UNIQUE KEY UX_ALERT_TYPE "
+                     "(Alert_Type, Alert_Level))",
+    'TB_ALERT_INSTANCE': "CREATE TABLE IF NOT EXISTS TB_ALERT_INSTANCE (Instance_Id BIGINT NOT "
+                         "NULL AUTO_INCREMENT PRIMARY KEY, Execution_Id INT NOT NULL, "
+                         "Alert_Type_Id INT NOT NULL, URL TEXT, Method VARCHAR(16), "
+                         "Parameter TEXT, Attack TEXT, Evidence TEXT)",
+    'TB_SCAN_ROLLUP': "CREATE TABLE IF NOT EXISTS TB_SCAN_ROLLUP (Environment VARCHAR(191) "
+                      "NOT NULL, Scan_Type VARCHAR(191) NOT NULL, Total_Executions INT NOT "
+                      "NULL, Latest_Execution_Id INT NOT NULL, Previous_Execution_Id INT, "
+                      "PRIMARY KEY (Environment, Scan_Type))",
+    'TB_DUPLICATE_REPORT': "CREATE TABLE IF NOT EXISTS TB_DUPLICATE_REPORT (Duplicate_Id INT "
+                           "NOT NULL AUTO_INCREMENT PRIMARY KEY, Execution_Id INT, "
+                           "Execution_Date DATETIME, URL_Link TEXT, Version TEXT)",
+}
+MYSQL_ROOT_TABLES = {
+    'TB_PROJECT': "CREATE TABLE IF NOT EXISTS TB_PROJECT (Project_Id INT NOT NULL "
+                  "AUTO_INCREMENT PRIMARY KEY, Project_Name TEXT, Last_Updated DATETIME, "
+                  "Total_Executions INT, Environment TEXT, Scan_Type TEXT, Recent_High INT, "
+                  "Recent_Medium INT, Recent_Low INT, Recent_Informational INT, "
+                  "Recent_False INT, Version TEXT)",
+}
+# Columns added to tables created by earlier versions, as table -> [(column, type)]
+MYSQL_PROJECT_COLUMNS = {
+    'TB_EXECUTION': [('Report_Digest', 'CHAR(64)')],
+    'TB_ALERTS': [('Alert_Type_Id', 'INT')],
+}
+# Indexes for the comparison queries as (table, index name, columns). The text columns are
+# indexed by prefix so they work whether the dashboard created them as TEXT or VARCHAR.
+MYSQL_PROJECT_INDEXES = [
+    ('TB_EXECUTION', 'IX_EXECUTION_ENV_SCAN', 'Environment(64), Scan_Type(64), Execution_Id'),
+    ('TB_ALERTS', 'IX_ALERTS_EXECUTION_LEVEL', 'Execution_Id, Alert_Level(32)'),
+    ('TB_EXECUTION', 'IX_EXECUTION_DIGEST', 'Report_Digest'),
+    ('TB_ALERT_INSTANCE', 'IX_INSTANCE_EXECUTION_TYPE', 'Execution_Id, Alert_Type_Id'),
+]
+MYSQL_ROOT_INDEXES = [
+    ('TB_PROJECT', 'IX_PROJECT_NAME', 'Project_Name(64)'),
+]
+SQLITE_PROJECT_TABLES = {
+    'TB_EXECUTION': "CREATE TABLE IF NOT EXISTS TB_EXECUTION (Execution_Id INTEGER PRIMARY "
+                    "KEY AUTOINCREMENT, Execution_Date TEXT, Environment TEXT, Scan_Type TEXT, "
+                    "High_Alerts INTEGER, Medium_Alerts INTEGER, Low_Alerts INTEGER, "
+                    "Informational_Alerts INTEGER, False_Alerts INTEGER, URL_Link TEXT, "
+                    "Version TEXT, Report_Digest TEXT)",
+    'TB_ALERTS': "CREATE TABLE IF NOT EXISTS TB_ALERTS (Alert_Id INTEGER PRIMARY KEY "
+                 "AUTOINCREMENT, Execution_Id INTEGER, Alert_Level TEXT, Alert_Type TEXT, "
+                 "URLS_Affected INTEGER, Alert_Type_Id INTEGER)",
+    'TB_ALERT_TYPE': "CREATE TABLE IF NOT EXISTS TB_ALERT_TYPE (Alert_Type_Id INTEGER PRIMARY "
+                     "KEY AUTOINCREMENT, Alert_Level TEXT NOT NULL, Alert_Type TEXT NOT NULL, "
+                     "UNIQUE (Alert_Type, Alert_Level))",
+    'TB_ALERT_INSTANCE': "CREATE TABLE IF NOT EXISTS TB_ALERT_INSTANCE (Instance_Id INTEGER "
+                         "PRIMARY KEY AUTOINCREMENT, Execution_Id INTEGER NOT NULL, "
+                         "Alert_Type_Id INTEGER NOT NULL, URL TEXT, Method TEXT, Parameter "
+                         "TEXT, Attack TEXT, Evidence TEXT)",
+    'TB_SCAN_ROLLUP': "CREATE TABLE IF NOT EXISTS TB_SCAN_ROLLUP (Environment TEXT NOT NULL, "
+                      "Scan_Type TEXT NOT NULL, Total_Executions INTEGER NOT NULL, "
+                      "Latest_Execution_Id INTEGER NOT NULL, Previous_Execution_Id INTEGER, "
+                      "PRIMARY KEY (Environment, Scan_Type))",
+    'TB_DUPLICATE_REPORT': "CREATE TABLE IF NOT EXISTS TB_DUPLICATE_REPORT (Duplicate_Id "
+                           "INTEGER PRIMARY KEY AUTOINCREMENT, Execution_Id INTEGER, "
+                           "Execution_Date TEXT, URL_Link TEXT, Version TEXT)",
+}
+SQLITE_ROOT_TABLES = {
+    'TB_PROJECT': "CREATE TABLE IF NOT EXISTS TB_PROJECT (Project_Id INTEGER PRIMARY KEY "
+                  "AUTOINCREMENT, Project_Name TEXT UNIQUE, Last_Updated TEXT, "
+                  "Total_Executions INTEGER, Environment TEXT, Scan_Type TEXT, "
+                  "Recent_High INTEGER, Recent_Medium INTEGER, Recent_Low INTEGER, "
+                  "Recent_Informational INTEGER, Recent_False INTEGER, Version TEXT)",
+}
+SQLITE_PROJECT_COLUMNS = {
+    'TB_EXECUTION': [('Report_Digest', 'TEXT')],
+    'TB_ALERTS': [('Alert_Type_Id', 'INTEGER')],
+}
+# The digest index and TB_ALERT_TYPE also mark the columns added with them as present,
+# keeping the open check cheap
+SQLITE_PROJECT_INDEXES = [
+    ('TB_EXECUTION', 'IX_EXECUTION_ENV_SCAN', 'Environment, Scan_Type, Execution_Id'),
+    ('TB_ALERTS', 'IX_ALERTS_EXECUTION_LEVEL', 'Execution_Id, Alert_Level'),
+    ('TB_EXECUTION', 'IX_EXECUTION_DIGEST', 'Report_Digest'),
+    ('TB_ALERT_INSTANCE', 'IX_INSTANCE_EXECUTION_TYPE', 'Execution_Id, Alert_Type_Id'),
+]
+SQLITE_ROOT_INDEXES = []
+# Fills a newly created rollup from the executions already stored
+TABLE_BACKFILLS = {
+    'TB_SCAN_ROLLUP': "INSERT INTO TB_SCAN_ROLLUP (Environment, Scan_Type, Total_Executions, "
+                      "Latest_Execution_Id) SELECT Environment, Scan_Type, COUNT(*), "
+                      "MAX(Execution_Id) FROM TB_EXECUTION WHERE Environment IS NOT NULL AND "
+                      "Scan_Type IS NOT NULL GROUP BY Environment, Scan_Type",
+    'TB_ALERT_TYPE': "INSERT INTO TB_ALERT_TYPE (Alert_Level, Alert_Type) SELECT DISTINCT "
+                     "Alert_Level, Alert_Type FROM TB_ALERTS WHERE Alert_Level IS NOT NULL AND "
+                     "Alert_Type IS NOT NULL",
+}
+# Fills a newly added column of the rows already stored, as (table, column) -> statement
+COLUMN_BACKFILLS = {
+    ('TB_ALERTS', 'Alert_Type_Id'): "UPDATE TB_ALERTS SET Alert_Type_Id = (SELECT "
+                                    "t.Alert_Type_Id FROM TB_ALERT_TYPE AS t WHERE "
+                                    "t.Alert_Level = TB_ALERTS.Alert_Level AND "
+                                    "t.Alert_Type = TB_ALERTS.Alert_Type)",
+}
+# New alert types are inserted once, concurrent runs adding the same one keep the first row
+MYSQL_ALERT_TYPE_INSERT_SQL = "INSERT INTO TB_ALERT_TYPE (Alert_Level, Alert_Type) VALUES " \
+                              "(%s, %s) ON DUPLICATE KEY UPDATE Alert_Type_Id = Alert_Type_Id"
+SQLITE_ALERT_TYPE_INSERT_SQL = "INSERT OR IGNORE INTO TB_ALERT_TYPE (Alert_Level, " \
+                               "Alert_Type) VALUES (?, ?)"
+# Alert types are looked up this many at a time, keeping within SQLite's parameter limit
+ALERT_TYPE_LOOKUP_SIZE = 500
+# Alert type ids of each project database, kept for the life of the process
+ALERT_TYPE_CACHES = {}
+# Counts an execution in its environment and scan type rollup. The assignments run left to
+# right, so Previous_Execution_Id takes the old Latest_Execution_Id before it is replaced.
+MYSQL_ROLLUP_UPSERT_SQL = "INSERT INTO TB_SCAN_ROLLUP (Environment, Scan_Type, " \
+                          "Total_Executions, Latest_Execution_Id) VALUES (%s, %s, 1, %s) " \
+                          "ON DUPLICATE KEY UPDATE Total_Executions = Total_Executions + 1, " \
+                          "Previous_Execution_Id = Latest_Execution_Id, " \
+                          "Latest_Execution_Id = VALUES(Latest_Execution_Id)"
+SQLITE_ROLLUP_UPSERT_SQL = "INSERT INTO TB_SCAN_ROLLUP (Environment, Scan_Type, " \
+                           "Total_Executions, Latest_Execution_Id) VALUES (?, ?, 1, ?) " \
+                           "ON CONFLICT (Environment, Scan_Type) DO UPDATE SET " \
+                           "Total_Executions = Total_Executions + 1, " \
+                           "Previous_Execution_Id = Latest_Execution_Id, " \
+                           "Latest_Execution_Id = excluded.Latest_Execution_Id"
+# The comparison queries, shared by the storage methods and the query plan report
+ROLLUP_SQL = "SELECT Previous_Execution_Id, (SELECT SUM(Total_Executions) FROM " \
+             "TB_SCAN_ROLLUP) FROM TB_SCAN_ROLLUP WHERE Environment = %s AND Scan_Type = %s"
+EXECUTION_SQL = "SELECT Execution_Id, Execution_Date, URL_Link, Version FROM TB_EXECUTION " \
+                "WHERE Execution_Id = %s"
+# Alerts are compared by their TB_ALERT_TYPE id, the texts are only looked up to render them
+EXECUTION_ALERTS_SQL = "SELECT Alert_Id, Alert_Type_Id, URLS_Affected FROM TB_ALERTS WHERE " \
+                       "Execution_Id = %s ORDER BY Alert_Id"
+# Alerts written without an id, by a collector from before TB_ALERT_TYPE, are matched by text
+UNTYPED_ALERTS_SQL = "SELECT Alert_Id, Alert_Level, Alert_Type FROM TB_ALERTS WHERE " \
+                     "Execution_Id = %s AND Alert_Type_Id IS NULL"
+# The latest execution of an environment and scan type stored from a report with this digest
+REPORT_DIGEST_SQL = "SELECT MAX(Execution_Id) FROM TB_EXECUTION WHERE Report_Digest = %s " \
+                    "AND Environment = %s AND Scan_Type = %s"
+PREVIOUS_EXECUTION_SQL = "SELECT MAX(Execution_Id) FROM TB_EXECUTION WHERE Environment = %s " \
+                         "AND Scan_Type = %s AND Execution_Id < %s"
+DUPLICATE_REPORT_SQL = "INSERT INTO TB_DUPLICATE_REPORT (Execution_Id, Execution_Date, " \
+                       "URL_Link, Version) VALUES (%s, %s, %s, %s)"
+# The alerts of the latest executions of an environment and scan type, oldest first. Executions
+# without alerts still give one row, with the alert columns NULL. The texts stored with the
+# alerts are read, so alerts written without an alert type id are followed as well.
+RECENT_ALERTS_SQL = "SELECT e.Execution_Id, e.Execution_Date, e.Version, a.Alert_Level, " \
+                    "a.Alert_Type, a.URLS_Affected FROM (SELECT Execution_Id, Execution_Date, " \
+                    "Version FROM TB_EXECUTION WHERE Environment = %s AND Scan_Type = %s " \
+                    "ORDER BY Execution_Id DESC LIMIT %s) AS e LEFT JOIN TB_ALERTS AS a " \
+                    "ON a.Execution_Id = e.Execution_Id ORDER BY e.Execution_Id"
+# Sample parameters for the query plans, any environment and scan type give the same plan
+PLAN_QUERIES = [
+    (ROLLUP_SQL, ('QA', 'Active')),
+    (EXECUTION_SQL, (1,)),
+    (EXECUTION_ALERTS_SQL, (1,)),
+    (ALERT_LEVELS_SQL, (1,)),
+    (RECENT_ALERTS_SQL, ('QA', 'Active', 10)),
+    (REPORT_DIGEST_SQL, ('0' * 64, 'QA', 'Active')),
+    (PREVIOUS_EXECUTION_SQL, ('QA', 'Active', 2)),
+]
+
+
+class MySQLStorage:
+    """This class records executions through a connection to the project's MySQL schema and
+    one to the owaspzaphistoric schema. The caller owns both connections. The location names
+    the server and schema, sharing the alert type ids looked up with later reports; without
+    one they are kept for this storage only."""
+
+    def __init__(self, con, ocon, location=None):
+        self.con = con
+        self.ocon = ocon
+        self.cursor_obj = con.cursor()
+        self.root_cursor_obj = ocon.cursor()
+        self.location = location
+        self.alert_types = get_alert_type_cache(location)
+
+    def add_execution(self, execution_date, this_env, scantype, zapresults, url_link, version,
+                      batch_size=ALERT_BATCH_SIZE, verify_totals=False, report_digest=None,
+                      instances=None):
+        """This method inserts an execution and its alerts, with the URL instances read from
+        instances when given, and counts it in the scan rollup, all in one transaction. It
+        returns the execution id, its alert totals, the id of the previous execution of the
+        environment and scan type (None for the first) and the project's number of
+        executions."""
+        cursor_obj = self.cursor_obj
+        alert_type_ids = self.resolve_alert_types(zapresults)
+        try:
+            cursor_obj.execute("INSERT INTO TB_EXECUTION (Execution_Date, Report_Digest) "
+                               "VALUES (%s, %s);", (execution_date, report_digest))
+            # the id comes from this insert, so concurrent runs can never swap executions
+            execution_id = cursor_obj.lastrowid
+            # update project's TB_ALERTS table
+            insert_alerts(cursor_obj, execution_id, zapresults, alert_type_ids, batch_size)
+            if instances is not None:
+                insert_instances(cursor_obj, execution_id, instances, alert_type_ids, batch_size)
+            # alert totals for TB_EXECUTION come from the parsed results
+            totals = count_alert_levels(zapresults)
+            if verify_totals:
+                verify_alert_levels(cursor_obj, execution_id, totals)
+            # update project's TB_EXECUTION latest id
+            cursor_obj.execute("UPDATE TB_EXECUTION SET Environment = '%s', Scan_Type = '%s',"
+                               "High_Alerts = %s, Medium_Alerts = %s,"
+                               "Low_Alerts = %s, Informational_Alerts = %s, False_Alerts = %s,"
+                               "URL_Link = '%s', Version = '%s' WHERE Execution_Id='%s';"
+                               % (this_env, scantype, totals['High'], totals['Medium'],
+                                  totals['Low'], totals['Informational'],
+                                  totals['False Positive'], url_link, version, execution_id))
+            # the rollup row stays locked until commit, so concurrent runs queue on it
+            cursor_obj.execute(MYSQL_ROLLUP_UPSERT_SQL, (this_env, scantype, execution_id))
+            cursor_obj.execute(ROLLUP_SQL, (this_env, scantype))
+            previous_id, total_executions = cursor_obj.fetchone()
+            self.con.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+        return execution_id, totals, previous_id, int(total_executions)
+
+    def resolve_alert_types(self, zapresults):
+        """This method returns the TB_ALERT_TYPE ids by (level, type) of parsed results,
+        adding the alert types not stored yet in their own transaction. Types missing from
+        the cache are looked up in batches, so a report costs no round trips once its types
+        are known."""
+        missing = self.alert_types.find_missing(zapresults)
+        if missing:
+            self.alert_types.add(select_alert_types(self.cursor_obj, missing))
+            missing = self.alert_types.find_missing(missing)
+        if missing:
+            try:
+                self.cursor_obj.executemany(MYSQL_ALERT_TYPE_INSERT_SQL, missing)
+                self.con.commit()
+            except Exception:
+                self.con.rollback()
+                raise
+            self.alert_types.add(select_alert_types(self.cursor_obj, missing))
+            self.alert_types.check(missing)
+        return self.alert_types.ids
+
+    def update_project(self, projectname, execution_date, this_env, scantype, totals, version,
+                       total_executions):
+        """This method refreshes the project's row in owaspzaphistoric.TB_PROJECT."""
+        self.root_cursor_obj.execute(
+            "UPDATE TB_PROJECT SET Last_Updated = '%s', Total_Executions = %s, "
+            "Environment = '%s',Scan_Type ='%s', Recent_High =%s, Recent_Medium =%s, "
+            "Recent_Low =%s, Recent_Informational =%s, Recent_False =%s, Version ='%s' "
+            "WHERE Project_Name='%s';"
+            % (execution_date, total_executions, this_env, scantype, totals['High'],
+               totals['Medium'], totals['Low'], totals['Informational'],
+               totals['False Positive'], version, projectname))
+        self.ocon.commit()
+
+    def find_report(self, this_env, scantype, report_digest):
+        """This method returns the id of the latest execution of the environment and scan
+        type stored from a report with this digest, or None."""
+        self.cursor_obj.execute(REPORT_DIGEST_SQL, (report_digest, this_env, scantype))
+        return self.cursor_obj.fetchone()[0]
+
+    def add_duplicate(self, execution_id, execution_date, url_link, version):
+        """This method records that a report already stored as execution_id was sent
+        again."""
+        self.cursor_obj.execute(DUPLICATE_REPORT_SQL,
+                                (execution_id, execution_date, url_link, version))
+        self.con.commit()
+
+    def get_previous_execution(self, this_env, scantype, execution_id):
+        """This method returns the id of the execution of the environment and scan type
+        before execution_id, or None."""
+        self.cursor_obj.execute(PREVIOUS_EXECUTION_SQL, (this_env, scantype, execution_id))
+        return self.cursor_obj.fetchone()[0]
+
+    def get_execution(self, execution_id):
+        """This method returns the id, date, report link and version of an execution."""
+        self.cursor_obj.execute(EXECUTION_SQL, (execution_id,))
+        return self.cursor_obj.fetchone()
+
+    def get_alert_counts(self, execution_id):
+        """This method returns the alert type id and urls affected of an execution's alerts,
+        in the order they were stored."""
+        return read_alert_counts(self.cursor_obj, self.alert_types, execution_id)
+
+    def get_alert_names(self, keys):
+        """This method returns the (level, type) of each alert type id in keys."""
+        return read_alert_names(self.cursor_obj, self.alert_types, keys)
+
+    def get_alerts(self, execution_id):
+        """This method returns the level, type and urls affected of an execution's alerts."""
+        return name_alert_counts(self.get_alert_counts(execution_id), self.get_alert_names)
+
+    def get_recent_alerts(self, this_env, scantype, runs):
+        """This method returns the execution id, date and version with the level, type and
+        urls affected of each alert of the latest runs executions, oldest first."""
+        self.cursor_obj.execute(RECENT_ALERTS_SQL, (this_env, scantype, runs))
+        return self.cursor_obj.fetchall()
+
+    def migrate(self, projectname):
+        """This method creates the missing tables and indexes of the project and
+        owaspzaphistoric schemas and registers the project, returning what it changed. It
+        is safe to run again."""
+        changes = apply_mysql_schema(self.cursor_obj, MYSQL_PROJECT_TABLES,
+                                     MYSQL_PROJECT_COLUMNS, MYSQL_PROJECT_INDEXES)
+        self.con.commit()
+        if "Created table TB_ALERT_TYPE" in changes:
+            self.alert_types = reset_alert_type_cache(self.location)
+        changes += apply_mysql_schema(self.root_cursor_obj, MYSQL_ROOT_TABLES, {},
+                                      MYSQL_ROOT_INDEXES)
+        self.root_cursor_obj.execute("SELECT COUNT(*) FROM TB_PROJECT WHERE Project_Name = %s",
+                                     (projectname,))
+        if not self.root_cursor_obj.fetchone()[0]:
+            self.root_cursor_obj.execute("INSERT INTO TB_PROJECT (Project_Name) VALUES (%s)",
+                                         (projectname,))
+            changes.append("Registered project %s" % projectname)
+        self.ocon.commit()
+        return changes
+
+    def query_plans(self):
+        """This method returns each comparison query with the lines of its EXPLAIN output."""
+        plans = []
+        for sql, params in PLAN_QUERIES:
+            self.cursor_obj.execute("EXPLAIN " + sql, params)
+            columns = self.cursor_obj.column_names
+            plans.append((sql, ["table=%(table)s type=%(type)s key=%(key)s rows=%(rows)s "
+                                "extra=%(Extra)s" % dict(zip(columns, row))
+                                for row in self.cursor_obj.fetchall()]))
+        return plans
+
+    def close(self):
+        """This method does nothing, the connections belong to the caller."""
+
+
+class SQLiteStorage:
+    """This class records executions in embedded SQLite databases kept in one directory: one
+    file per project plus owaspzaphistoric.db for the project table. The databases run in WAL
+    mode so readers never block the writer, and are created on first use."""
+
+    def __init__(self, directory, projectname, timeout=60):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.abspath(os.path.join(directory, projectname + '.db'))
+        self.con = connect_to_sqlite_db(path, timeout)
+        self.ocon = connect_to_sqlite_db(os.path.join(directory, ROOT_DATABASE + '.db'),
+                                         timeout)
+        self.schema_changes = apply_sqlite_schema(self.con, SQLITE_PROJECT_TABLES,
+                                                  SQLITE_PROJECT_COLUMNS,
+                                                  SQLITE_PROJECT_INDEXES)
+        self.schema_changes += apply_sqlite_schema(self.ocon, SQLITE_ROOT_TABLES, {},
+                                                   SQLITE_ROOT_INDEXES)
+        # a database created again at the same path starts its ids afresh
+        if "Created table TB_ALERT_TYPE" in self.schema_changes:
+            self.alert_types = reset_alert_type_cache('sqlite:' + path)
+        else:
+            self.alert_types = get_alert_type_cache('sqlite:' + path)
+
+    def add_execution(self, execution_date, this_env, scantype, zapresults, url_link, version,
+                      batch_size=ALERT_BATCH_SIZE, verify_totals=False, report_digest=None,
+                      instances=None):
+        """This method inserts an execution and its alerts, with the URL instances read from
+        instances when given, and counts it in the scan rollup, all in one transaction. It
+        returns the execution id, its alert totals, the id of the previous execution of the
+        environment and scan type (None for the first) and the project's number of
+        executions."""
+        totals = count_alert_levels(zapresults)
+        alert_type_ids = self.resolve_alert_types(zapresults)
+        cursor_obj = self.con.cursor()
+        # take the write lock up front so concurrent writers queue instead of deadlocking
+        cursor_obj.execute("BEGIN IMMEDIATE")
+        try:
+            cursor_obj.execute(
+                "INSERT INTO TB_EXECUTION (Execution_Date, Environment, Scan_Type, "
+                "High_Alerts, Medium_Alerts, Low_Alerts, Informational_Alerts, False_Alerts, "
+                "URL_Link, Version, Report_Digest) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (format_sqlite_date(execution_date), this_env, scantype, totals['High'],
+                 totals['Medium'], totals['Low'], totals['Informational'],
+                 totals['False Positive'], url_link, version, report_digest))
+            execution_id = cursor_obj.lastrowid
+            insert_alerts(cursor_obj, execution_id, zapresults, alert_type_ids, batch_size,
+                          placeholder='?')
+            if instances is not None:
+                insert_instances(cursor_obj, execution_id, instances, alert_type_ids,
+                                 batch_size, placeholder='?')
+            if verify_totals:
+                verify_alert_levels(cursor_obj, execution_id, totals, placeholder='?')
+            cursor_obj.execute(SQLITE_ROLLUP_UPSERT_SQL, (this_env, scantype, execution_id))
+            previous_id, total_executions = cursor_obj.execute(
+                sqlite_sql(ROLLUP_SQL), (this_env, scantype)).fetchone()
+            cursor_obj.execute("COMMIT")
+        except Exception:
+            cursor_obj.execute("ROLLBACK")
+            raise
+        return execution_id, totals, previous_id, total_executions
+
+    def resolve_alert_types(self, zapresults):
+        """This method returns the TB_ALERT_TYPE ids by (level, type) of parsed results,
+        adding the alert types not stored yet in their own transaction. Types missing from
+        the cache are looked up in batches."""
+        missing = self.alert_types.find_missing(zapresults)
+        if missing:
+            self.alert_types.add(select_alert_types(self.con.cursor(), missing, '?'))
+            missing = self.alert_types.find_missing(missing)
+        if missing:
+            cursor_obj = self.con.cursor()
+            cursor_obj.execute("BEGIN IMMEDIATE")
+            try:
+                cursor_obj.executemany(SQLITE_ALERT_TYPE_INSERT_SQL, missing)
+                cursor_obj.execute("COMMIT")
+            except Exception:
+                cursor_obj.execute("ROLLBACK")
+                raise
+            self.alert_types.add(select_alert_types(cursor_obj, missing, '?'))
+            self.alert_types.check(missing)
+        return self.alert_types.ids
+
+    def update_project(self, projectname, execution_date, this_env, scantype, totals, version,
+                       total_executions):
+        """This method refreshes the project's row in the project table, adding the row the
+        first time the project is seen."""
+        cursor_obj = self.ocon.cursor()
+        cursor_obj.execute("BEGIN IMMEDIATE")
+        try:
+            cursor_obj.execute("INSERT OR IGNORE INTO TB_PROJECT (Project_Name) VALUES (?)",
+                               (projectname,))
+            cursor_obj.execute(
+                "UPDATE TB_PROJECT SET Last_Updated = ?, Total_Executions = ?, "
+                "Environment = ?, Scan_Type = ?, Recent_High = ?, Recent_Medium = ?, "
+                "Recent_Low = ?, Recent_Informational = ?, Recent_False = ?, Version = ? "
+                "WHERE Project_Name = ?",
+                (format_sqlite_date(execution_date), total_executions, this_env, scantype,
+                 totals['High'], totals['Medium'], totals['Low'], totals['Informational'],
+                 totals['False Positive'], version, projectname))
+            cursor_obj.execute("COMMIT")
+        except Exception:
+            cursor_obj.execute("ROLLBACK")
+            raise
+
+    def find_report(self, this_env, scantype, report_digest):
+        """This method returns the id of the latest execution of the environment and scan
+        type stored from a report with this digest, or None."""
+        return self.con.execute(sqlite_sql(REPORT_DIGEST_SQL),
+                                (report_digest, this_env, scantype)).fetchone()[0]
+
+    def add_duplicate(self, execution_id, execution_date, url_link, version):
+        """This method records that a report already stored as execution_id was sent
+        again."""
+        self.con.execute(sqlite_sql(DUPLICATE_REPORT_SQL),
+                         (execution_id, format_sqlite_date(execution_date), url_link, version))
+
+    def get_previous_execution(self, this_env, scantype, execution_id):
+        """This method returns the id of the execution of the environment and scan type
+        before execution_id, or None."""
+        return self.con.execute(sqlite_sql(PREVIOUS_EXECUTION_SQL),
+                                (this_env, scantype, execution_id)).fetchone()[0]
+
+    def get_execution(self, execution_id):
+        """This method returns the id, date, report link and version of an execution."""
+        row = self.con.execute(sqlite_sql(EXECUTION_SQL), (execution_id,)).fetchone()
+        return row[0], datetime.datetime.fromisoformat(row[1]), row[2], row[3]
+
+    def get_alert_counts(self, execution_id):
+        """This method returns the alert type id and urls affected of an execution's alerts,
+        in the order they were stored."""
+        return read_alert_counts(self.con.cursor(), self.alert_types, execution_id, '?')
+
+    def get_alert_names(self, keys):
+        """This method returns the (level, type) of each alert type id in keys."""
+        return read_alert_names(self.con.cursor(), self.alert_types, keys, '?')
+
+    def get_alerts(self, execution_id):
+        """This method returns the level, type and urls affected of an execution's alerts."""
+        return name_alert_counts(self.get_alert_counts(execution_id), self.get_alert_names)
+
+    def get_recent_alerts(self, this_env, scantype, runs):
+        """This method returns the execution id, date and version with the level, type and
+        urls affected of each alert of the latest runs executions, oldest first."""
+        rows = self.con.execute(sqlite_sql(RECENT_ALERTS_SQL), (this_env, scantype, runs))
+        return [(row[0], datetime.datetime.fromisoformat(row[1])) + tuple(row[2:])
+                for row in rows]
+
+    def migrate(self, projectname):
+        """This method returns the tables and indexes created when the databases were opened,
+        registering the project in the project table if it is new."""
+        cursor_obj = self.ocon.execute("INSERT OR IGNORE INTO TB_PROJECT (Project_Name) "
+                                       "VALUES (?)", (projectname,))
+        if cursor_obj.rowcount:
+            return self.schema_changes + ["Registered project %s" % projectname]
+        return list(self.schema_changes)
+
+    def query_plans(self):
+        """This method returns each comparison query with the lines of its query plan."""
+        return [(sql, [row[3] for row in self.con.execute("EXPLAIN QUERY PLAN " +
+                                                          sqlite_sql(sql), params)])
+                for sql, params in PLAN_QUERIES]
+
+    def close(self):
+        """This method closes both database files."""
+        self.con.close()
+        self.ocon.close()
+
+
+class AlertTypeCache:
+    """This class holds the TB_ALERT_TYPE ids of one project database by alert level and
+    type, and the level and type of each id. Ids are only added once committed, so they stay
+    valid for the life of the database."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+
+    def find_missing(self, alerts):
+        """This method returns the (level, type) pairs of alerts without a known id, sorted so
+        concurrent runs insert new types in the same order."""
+        return sorted({(alert[0], alert[1]) for alert in alerts} - self.ids.keys())
+
+    def add(self, rows):
+        """This method records (id, level, type) rows read from TB_ALERT_TYPE."""
+        for alert_type_id, level, alert_type in rows:
+            self.ids[(level, alert_type)] = alert_type_id
+            self.names[alert_type_id] = (level, alert_type)
+
+    def find_unnamed(self, keys):
+        """This method returns the alert type ids among keys whose level and type are not
+        known. Keys of alerts stored without an id are their (level, type) already."""
+        return sorted({key for key in keys if not isinstance(key, tuple)} - self.names.keys())
+
+    def check(self, alert_keys):
+        """This method raises ValueError if any (level, type) pair still has no id."""
+        missing = [alert_key for alert_key in alert_keys if alert_key not in self.ids]
+        if missing:
+            raise ValueError("Unable to store alert types %s in TB_ALERT_TYPE" % missing)
+
+
+def get_alert_type_cache(location):
+    """This function returns the process wide alert type cache of a project database,
+    creating it on first use, or a new cache when there is no location."""
+    if location is None:
+        return AlertTypeCache()
+    alert_types = ALERT_TYPE_CACHES.get(location)
+    if alert_types is None:
+        alert_types = ALERT_TYPE_CACHES[location] = AlertTypeCache()
+    return alert_types
+
+
+def reset_alert_type_cache(location):
+    """This function forgets the alert type ids of a project database whose TB_ALERT_TYPE was
+    just created and returns its new, empty cache."""
+    ALERT_TYPE_CACHES.pop(location, None)
+    return get_alert_type_cache(location)
+
+
+def select_alert_types(cursor_obj, alert_keys, placeholder='%s'):
+    """This function looks up the TB_ALERT_TYPE rows of the types of (level, type) pairs, up
+    to ALERT_TYPE_LOOKUP_SIZE types per query, and returns them as (id, level, type) rows.
+    Types are matched on their own, so the lookup is a range of the unique index, and rows
+    of the other levels of a type come back as well."""
+    rows = []
+    alert_types = sorted({alert_type for _, alert_type in alert_keys})
+    for start in range(0, len(alert_types), ALERT_TYPE_LOOKUP_SIZE):
+        chunk = alert_types[start:start + ALERT_TYPE_LOOKUP_SIZE]
+        cursor_obj.execute("SELECT Alert_Type_Id, Alert_Level, Alert_Type FROM TB_ALERT_TYPE "
+                           "WHERE Alert_Type IN (%s)" % ', '.join([placeholder] * len(chunk)),
+                           chunk)
+        rows.extend(cursor_obj.fetchall())
+    return rows
+
+
+def read_alert_counts(cursor_obj, alert_types, execution_id, placeholder='%s'):
+    """This function returns (key, urls affected) rows of an execution's alerts in the order
+    they were stored, keyed by alert type id. Alerts stored without an id take the id of
+    their level and type, or are keyed by (level, type) when it has none."""
+    cursor_obj.execute(EXECUTION_ALERTS_SQL.replace('%s', placeholder), (execution_id,))
+    rows = cursor_obj.fetchall()
+    if all(alert_type_id is not None for _, alert_type_id, _ in rows):
+        return [(alert_type_id, urls_affected) for _, alert_type_id, urls_affected in rows]
+    cursor_obj.execute(UNTYPED_ALERTS_SQL.replace('%s', placeholder), (execution_id,))
+    untyped = {alert_id: (level, alert_type)
+               for alert_id, level, alert_type in cursor_obj.fetchall()}
+    missing = alert_types.find_missing(untyped.values())
+    if missing:
+        alert_types.add(select_alert_types(cursor_obj, missing, placeholder))
+    return [(alert_types.ids.get(untyped[alert_id], untyped[alert_id])
+             if alert_type_id is None else alert_type_id, urls_affected)
+            for alert_id, alert_type_id, urls_affected in rows]
+
+
+def read_alert_names(cursor_obj, alert_types, keys, placeholder='%s'):
+    """This function returns the (level, type) of each alert key, looking up the ids the
+    cache does not know yet up to ALERT_TYPE_LOOKUP_SIZE per query."""
+    unnamed = alert_types.find_unnamed(keys)
+    for start in range(0, len(unnamed), ALERT_TYPE_LOOKUP_SIZE):
+        chunk = unnamed[start:start + ALERT_TYPE_LOOKUP_SIZE]
+        cursor_obj.execute("SELECT Alert_Type_Id, Alert_Level, Alert_Type FROM TB_ALERT_TYPE "
+                           "WHERE Alert_Type_Id IN (%s)" % ', '.join([placeholder] * len(chunk)),
+                           chunk)
+        alert_types.add(cursor_obj.fetchall())
+    return {key: key if isinstance(key, tuple) else alert_types.names[key] for key in keys}
+
+
+def name_alert_counts(alert_counts, get_alert_names):
+    """This function turns (key, urls affected) rows into (level, type, urls affected) rows
+    with the names get_alert_names returns for their keys."""
+    names = get_alert_names([key for key, _ in alert_counts])
+    return [names[key] + (urls_affected,) for key, urls_affected in alert_counts]
+
+
+def apply_mysql_schema(cursor_obj, tables, columns, indexes):
+    """This function creates the tables, columns and indexes missing from the cursor's MySQL
+    schema, looking them up in information_schema first, and returns what it created."""
+    changes = []
+    cursor_obj.execute("SELECT TABLE_NAME FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE()")
+    existing_tables = {row[0].upper() for row in cursor_obj.fetchall()}
+    for table, statement in tables.items():
+        if table not in existing_tables:
+            cursor_obj.execute(statement)
+            changes.append("Created table %s" % table)
+            if table in TABLE_BACKFILLS:
+                cursor_obj.execute(TABLE_BACKFILLS[table])
+                changes.append("Filled %s with %s rows" % (table, cursor_obj.rowcount))
+    if columns:
+        cursor_obj.execute("SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS "
+                           "WHERE TABLE_SCHEMA = DATABASE()")
+        existing_columns = {(row[0].upper(), row[1].upper()) for row in cursor_obj.fetchall()}
+        for table, table_columns in columns.items():
+            for column, column_type in table_columns:
+                if (table, column.upper()) not in existing_columns:
+                    cursor_obj.execute("ALTER TABLE %s ADD COLUMN %s %s"
+                                       % (table, column, column_type))
+                    changes.append("Added column %s to %s" % (column, table))
+                    if (table, column) in COLUMN_BACKFILLS:
+                        cursor_obj.execute(COLUMN_BACKFILLS[(table, column)])
+                        changes.append("Filled %s of %s rows of %s"
+                                       % (column, cursor_obj.rowcount, table))
+    cursor_obj.execute("SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS "
+                       "WHERE TABLE_SCHEMA = DATABASE()")
+    existing_indexes = {(row[0].upper(), row[1].upper()) for row in cursor_obj.fetchall()}
+    for table, index, columns in indexes:
+        if (table, index) not in existing_indexes:
+            cursor_obj.execute("CREATE INDEX %s ON %s (%s)" % (index, table, columns))
+            changes.append("Created index %s on %s" % (index, table))
+    return changes
+
+
+def connect_to_sqlite_db(path, timeout=60):
+    """This function opens an SQLite database in WAL mode. Transactions are begun explicitly
+    by the storage methods."""
+    con = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                          check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    # WAL stays consistent after a crash at NORMAL, it only risks the last commits on power loss
+    con.execute("PRAGMA synchronous=NORMAL")
+    return con
+
+
+def apply_sqlite_schema(con, tables, columns, indexes):
+    """This function creates the tables, columns and indexes missing from an SQLite database and
+    returns what it created. It runs in one transaction, so processes opening the database
+    at the same time cannot both fill a new table."""
+    wanted = set(tables) | {index for _, index, _ in indexes}
+    if wanted <= get_sqlite_objects(con):
+        return []
+    changes = []
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        existing = get_sqlite_objects(con)
+        for table, statement in tables.items():
+            if table not in existing:
+                con.execute(statement)
+                changes.append("Created table %s" % table)
+                if table in TABLE_BACKFILLS:
+                    rowcount = con.execute(TABLE_BACKFILLS[table]).rowcount
+                    changes.append("Filled %s with %s rows" % (table, rowcount))
+        for table, table_columns in columns.items():
+            existing_columns = {row[1].upper() for row in
+                                con.execute("PRAGMA table_info(%s)" % table)}
+            for column, column_type in table_columns:
+                if column.upper() not in existing_columns:
+                    con.execute("ALTER TABLE %s ADD COLUMN %s %s" % (table, column, column_type))
+                    changes.append("Added column %s to %s" % (column, table))
+                    if (table, column) in COLUMN_BACKFILLS:
+                        rowcount = con.execute(COLUMN_BACKFILLS[(table, column)]).rowcount
+                        changes.append("Filled %s of %s rows of %s" % (column, rowcount, table))
+        for table, index, columns in indexes:
+            if index not in existing:
+                con.execute("CREATE INDEX %s ON %s (%s)" % (index, table, columns))
+                changes.append("Created index %s on %s" % (index, table))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return changes
+
+
+def get_sqlite_objects(con):
+    """This function returns the upper cased names of the tables and indexes in an SQLite
+    database."""
+    return {row[0].upper() for row in con.execute("SELECT name FROM sqlite_master")}
+
+
+def sqlite_sql(sql):
+    """This function turns a query written with MySQL placeholders into its SQLite form."""
+    return sql.replace('%s', '?')
+
+
+def format_sqlite_date(execution_date):
+    """This function stores a UTC execution date as ISO 8601 text, which sorts by date."""
+    return execution_date.isoformat(' ')
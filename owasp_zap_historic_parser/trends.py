@@ -0,0 +1,143 @@
+"""This module follows alerts across the latest executions of an environment and scan type"""
+from array import array
+from .owasp_zap_historical import get_severity_rank, open_storage
+
+TREND_RUNS = 10
+
+
+class AlertTrends:
+    """This class holds the URLs affected by each alert in each of a run of executions as an
+    alert by execution matrix. The counts live in one flat array, a row per alert and a column
+    per execution, with 0 where the alert was not reported. A second array of the same shape
+    marks where the alert was reported, as older reports can list an alert with no URLs."""
+
+    def __init__(self, executions, alerts, counts, present):
+        self.executions = executions
+        self.alerts = alerts
+        self.counts = counts
+        self.present = present
+
+    def series(self, alert_index):
+        """This method returns the URLs affected by an alert in each execution, oldest first."""
+        width = len(self.executions)
+        return self.counts[alert_index * width:(alert_index + 1) * width]
+
+    def deltas(self):
+        """This method returns, for every alert and pair of consecutive executions, the change
+        in URLs affected, as a flat array with a row per alert."""
+        width = len(self.executions)
+        counts = self.counts
+        if not counts:
+            return array('l')
+        return array('l', [counts[cell] - counts[cell - 1]
+                           for row in range(0, len(counts), width)
+                           for cell in range(row + 1, row + width)])
+
+    def summary(self):
+        """This method returns a dictionary per alert with its level, type, URLs affected per
+        execution, the ids of the executions it was first and last seen in, and the change
+        in URLs affected over the run."""
+        summaries = []
+        width = len(self.executions)
+        for alert_index, (level, alert_type) in enumerate(self.alerts):
+            series = self.series(alert_index)
+            seen = [column for column in range(width)
+                    if self.present[alert_index * width + column]]
+            summaries.append({'level': level, 'alert': alert_type, 'counts': series.tolist(),
+                              'first_seen': self.executions[seen[0]][0],
+                              'last_seen': self.executions[seen[-1]][0],
+                              'change': series[-1] - series[0]})
+        return summaries
+
+    def churn(self):
+        """This method returns a dictionary per execution after the first, counting the
+        alerts that were new, resolved, increased and decreased since the execution before."""
+        totals = [dict.fromkeys(('new', 'resolved', 'increased', 'decreased'), 0)
+                  for _ in self.executions[1:]]
+        width = len(self.executions)
+        deltas = self.deltas()
+        present = self.present
+        for cell, delta in enumerate(deltas):
+            row, column = divmod(cell, width - 1)
+            before = present[row * width + column]
+            after = present[row * width + column + 1]
+            if not before:
+                if after:
+                    totals[column]['new'] += 1
+            elif not after:
+                totals[column]['resolved'] += 1
+            elif delta > 0:
+                totals[column]['increased'] += 1
+            elif delta < 0:
+                totals[column]['decreased'] += 1
+        for execution, total in zip(self.executions[1:], totals):
+            total['execution'] = execution[0]
+        return totals
+
+
+def build_alert_trends(rows):
+    """This function pivots (execution id, date, version, level, type, urls affected) rows,
+    ordered by execution, into AlertTrends. Alerts are ordered by severity, then type."""
+    executions = []
+    columns = {}
+    rows_by_alert = {}
+    for execution_id, execution_date, version, level, alert_type, urls_affected in rows:
+        if execution_id not in columns:
+            columns[execution_id] = len(executions)
+            executions.append((execution_id, execution_date, version))
+        if level is not None:
+            rows_by_alert.setdefault((level, alert_type), []).append(
+                (columns[execution_id], urls_affected))
+    alerts = sorted(rows_by_alert, key=lambda alert: (get_severity_rank(alert[0]), alert[1]))
+    width = len(executions)
+    counts = array('l', bytes(array('l').itemsize * width * len(alerts)))
+    present = array('b', bytes(width * len(alerts)))
+    for alert_index, alert in enumerate(alerts):
+        for column, urls_affected in rows_by_alert[alert]:
+            counts[alert_index * width + column] += int(urls_affected)
+            present[alert_index * width + column] = 1
+    return AlertTrends(executions, alerts, counts, present)
+
+
+def get_alert_trends(storage, this_env, scantype, runs=TREND_RUNS):
+    """This keyword reads the alerts of the latest runs executions of an environment and scan
+    type in one query and returns their AlertTrends."""
+    return build_alert_trends(storage.get_recent_alerts(this_env, scantype, runs))
+
+
+def format_alert_trends(trends, this_env, scantype):
+    """This function renders AlertTrends as a plain text table followed by the churn of each
+    execution."""
+    lines = ["Alert trends for %s / %s over %s executions" % (this_env, scantype,
+                                                               len(trends.executions))]
+    for execution_id, execution_date, version in trends.executions:
+        lines.append("  #%s  %s  version %s" % (execution_id,
+                                                 execution_date.strftime('%Y-%m-%d %H:%M UTC'),
+                                                 version))
+    summaries = trends.summary()
+    type_width = max([len('Alert')] + [len(summary['alert']) for summary in summaries])
+    header = "%-15s%-*s" % ('Level', type_width, 'Alert')
+    header += ''.join("%8s" % ('#%s' % execution[0]) for execution in trends.executions)
+    lines += ['', header + "  First   Last  Change"]
+    for summary in summaries:
+        lines.append("%-15s%-*s" % (summary['level'], type_width, summary['alert']) +
+                     ''.join("%8s" % count for count in summary['counts']) +
+                     "%7s%7s%+8d" % ('#%s' % summary['first_seen'],
+                                     '#%s' % summary['last_seen'], summary['change']))
+    lines.append('')
+    for churn in trends.churn():
+        lines.append("#%(execution)s: %(new)s new, %(resolved)s resolved, %(increased)s "
+                     "increased, %(decreased)s decreased" % churn)
+    return '\n'.join(lines)
+
+
+def report_trends(opts):
+    """This keyword prints the alert trends of the environment and scan type in opts over
+    the latest opts.runs executions."""
+    with open_storage(opts) as storage:
+        trends = get_alert_trends(storage, opts.this_env, opts.scantype, opts.runs)
+    if not trends.executions:
+        print("No executions found for %s / %s" % (opts.this_env, opts.scantype))
+        return 1
+    print(format_alert_trends(trends, opts.this_env, opts.scantype))
+    return 0
@@ -0,0 +1,123 @@
+"""This module watches a spool directory and ingests the ZAP reports dropped into it"""
+import os
+import shutil
+import time
+import mysql.connector
+from .owasp_zap_historical import REPORT_EXTENSIONS, get_connection_pool, get_report_digest, \
+    parse_report, store_duplicate_report, store_zap_results
+
+DONE_DIR = 'done'
+FAILED_DIR = 'failed'
+# Errors that mean the database is unreachable rather than that the report is bad
+RETRY_ERRORS = (ConnectionError, mysql.connector.InterfaceError,
+                mysql.connector.OperationalError)
+
+
+def watch_spool(opts, max_polls=None):
+    """This keyword polls the spool directory in opts.target for new ZAP reports, ingests each
+    one and moves it into the done or failed subfolder. It runs until interrupted, or for
+    max_polls polls."""
+    spool_dir = opts.target
+    for folder in (DONE_DIR, FAILED_DIR):
+        os.makedirs(os.path.join(spool_dir, folder), exist_ok=True)
+    warm_up_connections(opts)
+    seen_sizes = {}
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            for report_path in find_ready_reports(spool_dir, seen_sizes):
+                ingest_spooled_report(opts, report_path)
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(opts.poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped watching %s" % spool_dir)
+
+
+def find_ready_reports(spool_dir, seen_sizes):
+    """This function returns the reports in the spool directory whose size has not changed
+    since the previous poll, so files still being written are left alone."""
+    ready = []
+    current_sizes = {}
+    for file_name in sorted(os.listdir(spool_dir)):
+        report_path = os.path.join(spool_dir, file_name)
+        if file_name.startswith('.') or not os.path.isfile(report_path) or \
+                os.path.splitext(file_name)[1].lower() not in REPORT_EXTENSIONS:
+            continue
+        current_sizes[report_path] = os.path.getsize(report_path)
+        if seen_sizes.get(report_path) == current_sizes[report_path]:
+            ready.append(report_path)
+    seen_sizes.clear()
+    seen_sizes.update(current_sizes)
+    return ready
+
+
+def ingest_spooled_report(opts, report_path):
+    """This keyword parses and stores one spooled report, retrying with backoff while the
+    database is unreachable, then files the report under done or failed. A report already
+    ingested is filed under done without parsing it again."""
+    started = time.monotonic()
+    try:
+        report_digest = get_report_digest(report_path)
+        duplicate_id, parsed_results = store_with_retry(opts, report_path, report_digest)
+    except Exception as error:  # pylint: disable=broad-except
+        print("FAILED %s: %s" % (report_path, error))
+        move_report(report_path, FAILED_DIR)
+        return False
+    if duplicate_id is not None:
+        print("SAME   %s: already ingested as execution %s" % (report_path, duplicate_id))
+        move_report(report_path, DONE_DIR)
+        return True
+    print("OK     %s: %s alerts in %.0f ms" % (report_path, len(parsed_results),
+                                               (time.monotonic() - started) * 1000))
+    move_report(report_path, DONE_DIR)
+    return True
+
+
+def store_with_retry(opts, report_path, report_digest=None):
+    """This keyword stores a report unless one with the same digest was already ingested,
+    waiting and retrying both with exponential backoff while the database cannot be reached.
+    It returns the id of the execution the report was already stored as, or None, and the
+    parsed results, which are None for a report already stored."""
+    backoff = 1
+    parsed_results = None
+    while True:
+        try:
+            duplicate_id = store_duplicate_report(opts, report_digest)
+            if duplicate_id is not None:
+                return duplicate_id, None
+            if parsed_results is None:
+                parsed_results = parse_report(report_path, opts.streaming)
+            store_zap_results(opts, parsed_results, report_digest=report_digest,
+                              report_path=report_path)
+            return None, parsed_results
+        except RETRY_ERRORS as error:
+            print("Database unavailable (%s), retrying in %s seconds" % (error, backoff))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, opts.max_backoff)
+
+
+def warm_up_connections(opts):
+    """This keyword opens the pooled connections up front so the first report does not pay
+    for the handshakes."""
+    if opts.backend != 'mysql':
+        return
+    pool = get_connection_pool(opts.ozh_host, opts.ozh_port, opts.ozh_username,
+                               opts.ozh_password, opts.pool_size, opts.pool_recycle,
+                               opts.connect_timeout)
+    try:
+        with pool.connection(opts.projectname), pool.connection('owaspzaphistoric'):
+            pass
+    except RETRY_ERRORS as error:
+        print("Database unavailable (%s), reports will wait for it" % error)
+
+
+def move_report(report_path, folder):
+    """This function moves a report into a subfolder of its spool directory without
+    overwriting an earlier report of the same name."""
+    target = os.path.join(os.path.dirname(report_path), folder, os.path.basename(report_path))
+    if os.path.exists(target):
+        base, extension = os.path.splitext(target)
+        target = "%s.%s%s" % (base, int(time.time() * 1000), extension)
+    shutil.move(report_path, target)
+    return target
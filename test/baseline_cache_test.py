@@ -0,0 +1,77 @@
+"""Unit tests for the baseline cache of OWASP ZAP Historic Parser"""
+import datetime
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from owasp_zap_historic_parser.baseline_cache import BaselineCache
+from owasp_zap_historic_parser.owasp_zap_historical import record_zap_results
+from owasp_zap_historic_parser.storage import SQLiteStorage
+
+RUNS = [
+    [['High', 'Alert One', 2], ['Low', 'Alert Two', 1]],
+    [['High', 'Alert One', 3], ['Medium', 'Alert Three', 1]],
+    [['Medium', 'Alert Three', 2]],
+]
+
+
+class TestBaselineCache(unittest.TestCase):
+    """Unit Tests for baseline_cache.py"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = BaselineCache(os.path.join(self.temp_dir.name, 'cache'), 'sqlite:test')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def ingest(self, folder, baseline_cache=None):
+        """Records every run into a fresh SQLite project and returns the comparisons"""
+        storage = SQLiteStorage(os.path.join(self.temp_dir.name, folder), 'test')
+        try:
+            return [record_zap_results(storage, 'QA', 'Active', results, 'test',
+                                       'http://www.google.com/%s' % run, '1.%s' % run,
+                                       execution_date=datetime.datetime(2021, 3, run + 1, 12),
+                                       baseline_cache=baseline_cache)
+                    for run, results in enumerate(RUNS)]
+        finally:
+            storage.close()
+
+    def test_cache_hit_matches_database(self):
+        """Tests that cached comparisons skip the previous execution's reads and match the
+        comparisons built from the database"""
+        expected = self.ingest('uncached')
+        with patch.object(SQLiteStorage, 'get_execution') as mock_get_execution:
+            cached = self.ingest('cached', self.cache)
+        mock_get_execution.assert_not_called()
+        self.assertEqual(cached, expected)
+
+    def test_stale_snapshot_is_ignored(self):
+        """Tests that a snapshot of another execution is not used"""
+        self.cache.save('test', 'QA', 'Active',
+                        (7, datetime.datetime(2021, 3, 1), 'link', '1.0'), RUNS[0])
+        self.assertIsNone(self.cache.load('test', 'QA', 'Active', 8))
+        self.assertIsNone(self.cache.load('test', 'QA', 'Passive', 7))
+        self.assertIsNone(BaselineCache(self.cache.directory, 'sqlite:other')
+                          .load('test', 'QA', 'Active', 7))
+        execution_row, alerts = self.cache.load('test', 'QA', 'Active', 7)
+        self.assertEqual(execution_row, (7, datetime.datetime(2021, 3, 1), 'link', '1.0'))
+        self.assertEqual(alerts, RUNS[0])
+
+    def test_old_snapshot_format_is_a_miss(self):
+        """Tests that a snapshot written before alerts were keyed by alert type id is not
+        used"""
+        os.makedirs(self.cache.directory)
+        with open(self.cache.path('test', 'QA', 'Active'), 'w', encoding='utf-8') as cached:
+            json.dump({'execution_id': 1, 'execution_date': '2021-03-01T00:00:00',
+                       'url_link': 'link', 'version': '1.0', 'alerts': RUNS[0]}, cached)
+        self.assertIsNone(self.cache.load('test', 'QA', 'Active', 1))
+
+    def test_corrupt_snapshot_is_a_miss(self):
+        """Tests that an unreadable snapshot falls back to the database"""
+        os.makedirs(self.cache.directory)
+        with open(self.cache.path('test', 'QA', 'Active'), 'w', encoding='utf-8') as cached:
+            cached.write('{"execution_id": 1, "alerts": [')
+        self.assertIsNone(self.cache.load('test', 'QA', 'Active', 1))
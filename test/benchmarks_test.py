@@ -0,0 +1,49 @@
+"""Unit tests for the benchmark report generator of OWASP ZAP Historic Parser"""
+import os
+import tempfile
+import unittest
+
+from benchmarks.generate_reports import change_alerts, generate_alerts, write_report
+from benchmarks.run_benchmarks import find_regressions
+from owasp_zap_historic_parser.owasp_zap_historical import get_severity_rank, parse_report
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Unit Tests for the benchmarks directory"""
+
+    def test_generated_reports_parse_back(self):
+        """Tests that both parsers read back the alerts written in either layout"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for layout in ('old', 'new'):
+                alerts = change_alerts(generate_alerts(40, layout))
+                path = write_report(os.path.join(temp_dir, layout + '.html'), alerts, layout)
+                expected = sorted(alerts, key=lambda alert: get_severity_rank(alert[0]))
+                self.assertEqual(parse_report(path), expected)
+                self.assertEqual(parse_report(path, True), expected)
+
+    def test_later_run_changes_alerts(self):
+        """Tests that the later run keeps the alert count but resolves and adds alerts"""
+        alerts = generate_alerts(200)
+        later = change_alerts(alerts)
+        self.assertEqual(len(later), len(alerts))
+        self.assertNotEqual({alert[1] for alert in later}, {alert[1] for alert in alerts})
+
+    def test_find_regressions(self):
+        """Tests that only changes beyond the tolerance and the noise floor are regressions"""
+        baseline = {'a': {'seconds': 1.0, 'peak_kib': 1000},
+                    'b': {'seconds': 0.001, 'peak_kib': 10}}
+        results = {'a': {'seconds': 1.6, 'peak_kib': 2000},
+                   'b': {'seconds': 0.003, 'peak_kib': 30},
+                   'c': {'seconds': 9.0, 'peak_kib': 9000}}
+        regressions = find_regressions(results, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(regression.startswith('a ') for regression in regressions))
+
+    def test_find_resident_memory_regressions(self):
+        """Tests that the peak resident memory of a parse is checked when both runs have it"""
+        baseline = {'a': {'seconds': 1.0, 'peak_kib': 1000, 'peak_rss_kib': 100000},
+                    'b': {'seconds': 1.0, 'peak_kib': 1000}}
+        results = {'a': {'seconds': 1.0, 'peak_kib': 1000, 'peak_rss_kib': 1500000},
+                   'b': {'seconds': 1.0, 'peak_kib': 1000, 'peak_rss_kib': 1500000}}
+        self.assertEqual(find_regressions(results, baseline),
+                         ["a peaked at 1500000 KiB resident, baseline 100000 KiB"])
@@ -0,0 +1,72 @@
+"""Concurrent ingestion tests for OWASP ZAP Historic Parser"""
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from owasp_zap_historic_parser.owasp_zap_historical import record_zap_results
+from owasp_zap_historic_parser.storage import SQLiteStorage
+
+WRITERS = 8
+RUNS_PER_WRITER = 5
+
+
+class TestConcurrentIngestion(unittest.TestCase):
+    """Stress tests for parallel writers ingesting into one project"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'test.db')
+        # create the databases once, before the writers start
+        SQLiteStorage(self.temp_dir.name, 'test').close()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def ingest(self, writer, errors):
+        """Ingests RUNS_PER_WRITER executions whose alerts are all tagged with the writer"""
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        try:
+            for run in range(RUNS_PER_WRITER):
+                zap_results = [['Low', 'Writer %s Alert %s' % (writer, alert), run + 1]
+                               for alert in range(writer + 1)]
+                zap_results.append(['High', 'Writer %s Run %s' % (writer, run), 1])
+                record_zap_results(storage, 'QA', 'Active', zap_results, 'test',
+                                   'http://www.google.com', 'writer %s' % writer,
+                                   batch_size=2)
+        except Exception as error:  # pylint: disable=broad-except
+            errors.append(error)
+        finally:
+            storage.close()
+
+    def test_parallel_writers_keep_their_alerts(self):
+        """Every execution written by parallel writers holds exactly its own alerts"""
+        errors = []
+        threads = [threading.Thread(target=self.ingest, args=(writer, errors))
+                   for writer in range(WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        con = sqlite3.connect(self.db_path)
+        executions = con.execute("SELECT Execution_Id, Version, High_Alerts, Low_Alerts "
+                                 "FROM TB_EXECUTION").fetchall()
+        self.assertEqual(len(executions), WRITERS * RUNS_PER_WRITER)
+        runs_seen = set()
+        for execution_id, version, high_alerts, low_alerts in executions:
+            writer = int(version.split()[1])
+            alerts = con.execute("SELECT Alert_Level, Alert_Type, URLS_Affected FROM TB_ALERTS "
+                                 "WHERE Execution_Id = ?", (execution_id,)).fetchall()
+            run_alerts = [alert for alert in alerts if alert[0] == 'High']
+            self.assertEqual(len(run_alerts), 1)
+            run = int(run_alerts[0][1].split()[-1])
+            expected_alerts = [('Low', 'Writer %s Alert %s' % (writer, alert), run + 1)
+                               for alert in range(writer + 1)]
+            expected_alerts.append(('High', 'Writer %s Run %s' % (writer, run), 1))
+            self.assertEqual(sorted(alerts), sorted(expected_alerts))
+            self.assertEqual((high_alerts, low_alerts), (1, writer + 1))
+            runs_seen.add((writer, run))
+        self.assertEqual(len(runs_seen), WRITERS * RUNS_PER_WRITER)
+        con.close()
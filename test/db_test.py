@@ -1,23 +1,40 @@
 """Unit tests for functions using db in OWASP ZAP Historic Parser"""
+import io
 import os
+import shutil
 import sys
+import tempfile
 import unittest
 import datetime
+from contextlib import redirect_stdout
 from unittest import mock
 from unittest.mock import patch, MagicMock, call
 
+import mysql.connector
+
 from owasp_zap_historic_parser.owasp_zap_historical import connect_to_mysql_db, \
-    process_zap_file, process_zap_results, html_parser
+    process_zap_file, process_zap_results, html_parser, get_connection_pool, \
+    close_connection_pools, iter_report_instances, get_report_digest, migrate_schema
 from owasp_zap_historic_parser.runner import main, parse_options
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 MOCK_DATE = datetime.datetime(2018, 5, 6, 5, 5, 5)
 
 
+def alert_type_rows(zap_results):
+    """Returns TB_ALERT_TYPE rows giving every alert level and type of the results an id"""
+    alert_keys = sorted({(level, alert_type) for level, alert_type, _ in zap_results})
+    return [(number, level, alert_type) for number, (level, alert_type) in
+            enumerate(alert_keys, 1)]
+
+
 class TestDBFunctions(unittest.TestCase):
     """Unit Tests for runner.py"""
 
-    @patch('owasp_zap_historic_parser.runner.process_zap_file')
+    def tearDown(self):
+        close_connection_pools()
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.process_zap_file')
     # pylint: disable=R0201
     def test_main(self, pzf_mock):
         """Tests main function"""
@@ -42,19 +59,177 @@ class TestDBFunctions(unittest.TestCase):
         connect_to_mysql_db(*args)
         self.assertRaises(AttributeError)
 
+    @patch('mysql.connector.connect')
+    def test_connect_to_mysql_db_unreachable(self, connect_mock):
+        """Tests that an unreachable server gives no connection and prints why"""
+        connect_mock.side_effect = mysql.connector.InterfaceError(
+            msg="Can't connect to MySQL server", errno=2003)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertIsNone(connect_to_mysql_db(1, 2, 3, 4, 5))
+        self.assertIn("Unable to make MySQL connection: 2003: Can't connect to MySQL server",
+                      output.getvalue())
+
+    @patch('mysql.connector.connect')
+    def test_connect_to_mysql_db_access_denied(self, connect_mock):
+        """Tests that errors other than an unreachable server are raised"""
+        connect_mock.side_effect = mysql.connector.ProgrammingError(
+            msg="Access denied for user", errno=1045)
+        with self.assertRaises(mysql.connector.ProgrammingError):
+            connect_to_mysql_db(1, 2, 3, 4, 5)
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.store_duplicate_report',
+           return_value=None)
+    @patch('mysql.connector.connect')
+    def test_process_zap_file(self, mock_connect, _):
+        """Tests that process zap file prints the comparison as it is written and returns it"""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.html"
+        mock_cursor = mock_connect.return_value.cursor.return_value
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchone.side_effect = [(None, 1)]
+        mock_cursor.fetchall.return_value = alert_type_rows(html_parser(file_path))
+        sys.argv[1:] = ['-f', file_path]
+        options = parse_options()
+        output = io.StringIO()
+        with patch.dict('owasp_zap_historic_parser.storage.ALERT_TYPE_CACHES', clear=True), \
+                redirect_stdout(output):
+            result = process_zap_file(options)
+        self.assertEqual(2, mock_connect.call_count)
+        self.assertIn('Not enough rows to compare results for Not Provided and Not Provided',
+                      result)
+        self.assertEqual(output.getvalue(), result + '\n')
+        digest = get_report_digest(file_path)
+        self.assertTrue(any(digest in query[0][1] for query in
+                            mock_cursor.execute.call_args_list if len(query[0]) > 1))
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.store_duplicate_report',
+           return_value=None)
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.get_report_digest')
     @patch('owasp_zap_historic_parser.owasp_zap_historical.html_parser')
     @patch('mysql.connector.connect')
     @patch('owasp_zap_historic_parser.owasp_zap_historical.process_zap_results',
            return_value='some html code')
-    def test_process_zap_file(self, mock_hp, mock_connect, mock_pzr):
-        """Tests the process zap file function"""
+    def test_process_zap_file_reuses_connections(self, mock_pzr, mock_connect, mock_hp, *_):
+        """Tests that process zap file reuses pooled connections for later reports"""
         sys.argv[1:] = ['-f', 'test_files/testReport.html']
         options = parse_options()
-        result = process_zap_file(options)
-        self.assertEqual(1, mock_hp.call_count)
+        process_zap_file(options)
+        process_zap_file(options)
+        self.assertEqual(2, mock_hp.call_count)
+        self.assertEqual(2, mock_connect.call_count)
+        self.assertEqual(2, mock_pzr.call_count)
+        used = [pzr_call[0][:2] for pzr_call in mock_pzr.call_args_list]
+        self.assertEqual(set(used[0]), set(used[1]))
+        self.assertEqual('owaspzaphistoric', used[1][1].database)
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.store_duplicate_report',
+           return_value=None)
+    @patch('mysql.connector.connect')
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.process_zap_results',
+           return_value='some html code')
+    def test_main_batch_directory(self, mock_pzr, mock_connect, _):
+        """Tests that main ingests every report in a directory in order and reports failures"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for file_name in ['testReport.html', 'newReport.html', 'testReport.json']:
+                shutil.copy(ROOT_PATH + "/test_files/" + file_name, temp_dir)
+            with open(os.path.join(temp_dir, 'broken.json'), 'w', encoding='utf-8') as report:
+                report.write('{"site": [{"alerts": [{"riskcode": "9"}]}]}')
+            sys.argv[1:] = ['-f', temp_dir, '--workers', '2']
+            output = io.StringIO()
+            with redirect_stdout(output):
+                exit_code = main()
+        self.assertEqual(1, exit_code)
+        self.assertEqual(3, mock_pzr.call_count)
         self.assertEqual(2, mock_connect.call_count)
+        stored = [pzr_call[0][4] for pzr_call in mock_pzr.call_args_list]
+        self.assertEqual(stored[0], [['False Positive', 'Test Alert', 1]])
+        self.assertEqual(10, len(stored[1]))
+        self.assertEqual(4, len(stored[2]))
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('FAILED ' + os.path.join(temp_dir, 'broken.json')))
+        self.assertTrue(lines[1].endswith('newReport.html: 1 alerts'))
+        self.assertEqual(lines[-1], '3 of 4 reports ingested')
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.store_duplicate_report',
+           return_value=None)
+    @patch('mysql.connector.connect')
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.process_zap_results',
+           return_value='some html code')
+    def test_main_batch_missing_report(self, mock_pzr, *_):
+        """Tests that a report missing from a manifest fails on its own and the rest are
+        ingested"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copy(ROOT_PATH + "/test_files/testReport.json", temp_dir)
+            manifest_path = os.path.join(temp_dir, 'reports.txt')
+            with open(manifest_path, 'w', encoding='utf-8') as manifest:
+                manifest.write('missing.html\ntestReport.json\n')
+            sys.argv[1:] = ['-f', '@' + manifest_path, '--workers', '1']
+            output = io.StringIO()
+            with redirect_stdout(output):
+                exit_code = main()
+        self.assertEqual(1, exit_code)
         self.assertEqual(1, mock_pzr.call_count)
-        self.assertEqual(result, 'some html code')
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('FAILED ' + os.path.join(temp_dir, 'missing.html')))
+        self.assertTrue(lines[1].endswith('testReport.json: 4 alerts'))
+        self.assertEqual(lines[-1], '1 of 2 reports ingested')
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.process_zap_batch', return_value=0)
+    def test_main_batch_manifest(self, mock_batch):
+        """Tests that main reads the reports to ingest from a manifest"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest_path = os.path.join(temp_dir, 'reports.txt')
+            with open(manifest_path, 'w', encoding='utf-8') as manifest:
+                manifest.write('# nightly reports\nfirst.html\n\nsecond.json\n')
+            sys.argv[1:] = ['-f', '@' + manifest_path]
+            exit_code = main()
+        self.assertEqual(0, exit_code)
+        self.assertEqual(mock_batch.call_args[0][1], [os.path.join(temp_dir, 'first.html'),
+                                                      os.path.join(temp_dir, 'second.json')])
+
+    @patch('owasp_zap_historic_parser.owasp_zap_historical.print_schema_report')
+    @patch('mysql.connector.connect')
+    def test_migrate_schema_creates_databases(self, mock_connect, mock_report):
+        """Tests that init-schema creates both schemas over a connection without a default
+        database before applying the tables to them"""
+        mock_connect.return_value.cursor.return_value.rowcount = 1
+        sys.argv[1:] = ['init-schema', '-n', 'test']
+        output = io.StringIO()
+        with redirect_stdout(output):
+            migrate_schema(parse_options())
+        self.assertEqual([connect_call[1]['database'] for connect_call in
+                          mock_connect.call_args_list], [None, 'owaspzaphistoric', 'test'])
+        statements = [query[0][0] for query in
+                      mock_connect.return_value.cursor.return_value.execute.call_args_list]
+        self.assertEqual(statements, ['CREATE DATABASE IF NOT EXISTS `test`',
+                                      'CREATE DATABASE IF NOT EXISTS `owaspzaphistoric`'])
+        self.assertIn('Created database owaspzaphistoric', output.getvalue())
+        self.assertEqual(1, mock_report.call_count)
+
+    @patch('mysql.connector.connect')
+    def test_connection_pool_recycle(self, mock_connect):
+        """Tests that the connection pool replaces connections older than the recycle time"""
+        mock_connect.side_effect = lambda **kwargs: MagicMock(name='connection')
+        pool = get_connection_pool(1, 2, 3, 4, size=1, recycle=0)
+        first = pool.acquire('project')
+        pool.release(first)
+        second = pool.acquire('project')
+        self.assertIsNot(first, second)
+        first.close.assert_called_once()
+        self.assertEqual(2, mock_connect.call_count)
+
+    @patch('mysql.connector.connect')
+    def test_connection_pool_size(self, mock_connect):
+        """Tests that the connection pool closes connections released beyond its size"""
+        mock_connect.side_effect = lambda **kwargs: MagicMock(name='connection')
+        pool = get_connection_pool(1, 2, 3, 4, size=1)
+        first = pool.acquire('project')
+        second = pool.acquire('owaspzaphistoric')
+        pool.release(first)
+        pool.release(second)
+        second.close.assert_called_once()
+        self.assertIs(first, pool.acquire('owaspzaphistoric'))
+        self.assertEqual('owaspzaphistoric', first.database)
 
     @patch('mysql.connector.connect')
     def test_process_zap_results_no_compare(self, mock_conn):
@@ -62,9 +237,11 @@ class TestDBFunctions(unittest.TestCase):
         file_path = ROOT_PATH + "/" + "test_files/testReport.html"
         mock_cursor = mock.Mock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = (1, datetime.datetime(2018, 5, 6, 5, 5, 5))
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchone.side_effect = [(None, 1)]
         mock_cursor.description = (('name',), ('title',))
         zap_results = html_parser(file_path)
+        mock_cursor.fetchall.return_value = alert_type_rows(zap_results)
         args = (mock_conn, mock_conn, 'test', 'test', zap_results, 'test',
                 'http://www.google.com', 'test')
         result = process_zap_results(*args)
@@ -77,20 +254,17 @@ class TestDBFunctions(unittest.TestCase):
         file_path = ROOT_PATH + "/" + "test_files/testReport.html"
         mock_cursor = mock.Mock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.side_effect = [(1, datetime.datetime(2018, 1, 6, 5, 5, 5)),
-                                            (2, ), (2, ), (2, ), (2, ), (2, ), (2, ),
-                                            (2, datetime.datetime(2018, 2, 6, 5, 5, 5)),
-                                            ('test', )]
-        mock_cursor.fetchall.side_effect = [[(1, datetime.datetime(2018, 3, 6, 5, 5, 5),
-                                              'http://www.google.com'),
-                                             (1, datetime.datetime(2018, 4, 6, 5, 5, 5),
-                                              'http://www.google.com')],
-                                            [("High", "Test Alert A", 3),
-                                             ("Medium", "Test Alert B", 6)],
-                                            [("High", "Test Alert A", 3),
-                                             ("Medium", "Test Alert B", 6)]]
-        mock_cursor.description = (('name',), ('title',))
+        mock_cursor.lastrowid = 2
         zap_results = html_parser(file_path)
+        mock_cursor.fetchone.side_effect = [(1, 2),
+                                            (1, datetime.datetime(2018, 4, 6, 5, 5, 5),
+                                             'http://www.google.com', 'test')]
+        mock_cursor.fetchall.side_effect = [alert_type_rows(zap_results),
+                                            [(3, 101, 3), (4, 102, 6)],
+                                            [(1, 101, 3), (2, 102, 6)],
+                                            [(101, "High", "Test Alert A"),
+                                             (102, "Medium", "Test Alert B")]]
+        mock_cursor.description = (('name',), ('title',))
         args = (mock_conn, mock_conn, 'test', 'test', zap_results, 'test',
                 'http://www.google.com', 'test')
         result = process_zap_results(*args)
@@ -103,20 +277,17 @@ class TestDBFunctions(unittest.TestCase):
         file_path = ROOT_PATH + "/" + "test_files/testReport.html"
         mock_cursor = mock.Mock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.side_effect = [(1, datetime.datetime(2018, 1, 6, 5, 5, 5)),
-                                            (2, ), (2, ), (2, ), (2, ), (2, ), (2, ),
-                                            (2, datetime.datetime(2018, 2, 6, 5, 5, 5)),
-                                            ('test', )]
-        mock_cursor.fetchall.side_effect = [[(1, datetime.datetime(2018, 3, 6, 5, 5, 5),
-                                              'http://www.google.com'),
-                                             (1, datetime.datetime(2018, 4, 6, 5, 5, 5),
-                                              'http://www.google.com')],
-                                            [("Low", "Test Alert A", 3),
-                                             ("Informational", "Test Alert B", 6)],
-                                            [("Low", "Test Alert A", 2),
-                                             ("Informational", "Test Alert B", 5)]]
-        mock_cursor.description = (('name',), ('title',))
+        mock_cursor.lastrowid = 2
         zap_results = html_parser(file_path)
+        mock_cursor.fetchone.side_effect = [(1, 2),
+                                            (1, datetime.datetime(2018, 4, 6, 5, 5, 5),
+                                             'http://www.google.com', 'test')]
+        mock_cursor.fetchall.side_effect = [alert_type_rows(zap_results),
+                                            [(3, 101, 3), (4, 102, 6)],
+                                            [(1, 101, 2), (2, 102, 5)],
+                                            [(101, "Low", "Test Alert A"),
+                                             (102, "Informational", "Test Alert B")]]
+        mock_cursor.description = (('name',), ('title',))
         args = (mock_conn, mock_conn, 'test', 'test', zap_results, 'test',
                 'http://www.google.com', 'test')
         result = process_zap_results(*args)
@@ -129,22 +300,134 @@ class TestDBFunctions(unittest.TestCase):
         file_path = ROOT_PATH + "/" + "test_files/testReport.html"
         mock_cursor = mock.Mock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_cursor.fetchone.side_effect = [(1, datetime.datetime(2018, 1, 6, 5, 5, 5)),
-                                            (2, ), (2, ), (2, ), (2, ), (2, ), (2, ),
-                                            (2, datetime.datetime(2018, 2, 6, 5, 5, 5)),
-                                            ('test', )]
-        mock_cursor.fetchall.side_effect = [[(1, datetime.datetime(2018, 3, 6, 5, 5, 5),
-                                              'http://www.google.com'),
-                                             (1, datetime.datetime(2018, 4, 6, 5, 5, 5),
-                                              'http://www.google.com')],
-                                            [("High", "Test Alert A", 1),
-                                             ("False Positive", "Test Alert B", 4)],
-                                            [("High", "Test Alert A", 2),
-                                             ("False Positive", "Test Alert B", 5)]]
-        mock_cursor.description = (('name',), ('title',))
+        mock_cursor.lastrowid = 2
         zap_results = html_parser(file_path)
+        mock_cursor.fetchone.side_effect = [(1, 2),
+                                            (1, datetime.datetime(2018, 4, 6, 5, 5, 5),
+                                             'http://www.google.com', 'test')]
+        mock_cursor.fetchall.side_effect = [alert_type_rows(zap_results),
+                                            [(3, 101, 1), (4, 102, 4)],
+                                            [(1, 101, 2), (2, 102, 5)],
+                                            [(101, "High", "Test Alert A"),
+                                             (102, "False Positive", "Test Alert B")]]
+        mock_cursor.description = (('name',), ('title',))
         args = (mock_conn, mock_conn, 'test', 'test', zap_results, 'test',
                 'http://www.google.com', 'test')
         result = process_zap_results(*args)
         check_text = 'Number of URLs Affected decreased'
         self.assertTrue(check_text in result)
+
+    @patch('mysql.connector.connect')
+    def test_process_zap_results_batches_alerts(self, mock_conn):
+        """Tests that process zap results inserts the alerts in batches and commits the
+        execution once"""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.html"
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchone.side_effect = [(None, 1)]
+        zap_results = html_parser(file_path)
+        mock_cursor.fetchall.return_value = alert_type_rows(zap_results)
+        args = (mock_conn, mock_conn, 'test', 'test', zap_results, 'test',
+                'http://www.google.com', 'test')
+        process_zap_results(*args, batch_size=4)
+        batches = [len(batch_call[0][1]) for batch_call in
+                   mock_cursor.executemany.call_args_list]
+        self.assertEqual(batches, [4, 4, 2])
+        # one commit for the project schema and one for owaspzaphistoric
+        self.assertEqual(2, mock_conn.commit.call_count)
+
+    @patch('mysql.connector.connect')
+    def test_process_zap_results_instances(self, mock_conn):
+        """Tests that process zap results inserts the URL instances in batches after the
+        alerts, in the same transaction"""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.html"
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchone.side_effect = [(None, 1)]
+        zap_results = html_parser(file_path)
+        mock_cursor.fetchall.return_value = alert_type_rows(zap_results)
+        args = (mock_conn, mock_conn, 'test', 'test', zap_results, 'test',
+                'http://www.google.com', 'test')
+        process_zap_results(*args, batch_size=20, instances=iter_report_instances(file_path))
+        inserts = mock_cursor.executemany.call_args_list
+        self.assertTrue(inserts[1][0][0].startswith('INSERT INTO TB_ALERT_INSTANCE'))
+        self.assertEqual([len(insert[0][1]) for insert in inserts[1:]], [20, 20, 5])
+        self.assertEqual(inserts[1][0][1][0][:3],
+                         (1, 10, 'https://www.someurl.com/facility/login.jsp?SiteID=109'))
+        self.assertEqual(2, mock_conn.commit.call_count)
+
+    @patch('mysql.connector.connect')
+    def test_process_zap_results_alert_types(self, mock_conn):
+        """Tests that new alert types are added and committed before the execution, and that
+        a later report at the same location takes their ids from the cache"""
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchone.side_effect = [(None, 1), (None, 2)]
+        mock_cursor.fetchall.side_effect = [[], [(7, 'High', 'Test Alert A')]]
+        args = (mock_conn, mock_conn, 'test', 'test', [['High', 'Test Alert A', 2]], 'test',
+                'http://www.google.com', 'test')
+        location = 'mysql:localhost:3306/alert_types_test'
+        with patch.dict('owasp_zap_historic_parser.storage.ALERT_TYPE_CACHES', clear=True):
+            process_zap_results(*args, location=location)
+            process_zap_results(*args, location=location)
+        inserts = mock_cursor.executemany.call_args_list
+        self.assertTrue(inserts[0][0][0].startswith('INSERT INTO TB_ALERT_TYPE'))
+        self.assertEqual(inserts[0][0][1], [('High', 'Test Alert A')])
+        self.assertEqual([insert[0][1] for insert in inserts[1:]],
+                         [[(1, 'High', 'Test Alert A', 2, 7)]] * 2)
+        lookups = [query for query in mock_cursor.execute.call_args_list
+                   if 'FROM TB_ALERT_TYPE' in query[0][0]]
+        self.assertEqual(len(lookups), 2)
+        # the alert types, then each execution and project update
+        self.assertEqual(5, mock_conn.commit.call_count)
+
+    @patch('mysql.connector.connect')
+    def test_process_zap_results_rollback(self, mock_conn):
+        """Tests that process zap results rolls back the execution when an insert fails"""
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.lastrowid = 1
+        mock_cursor.executemany.side_effect = RuntimeError('lost connection')
+        mock_cursor.fetchall.return_value = [(1, 'High', 'Test Alert')]
+        args = (mock_conn, mock_conn, 'test', 'test', [['High', 'Test Alert', 1]], 'test',
+                'http://www.google.com', 'test')
+        with self.assertRaises(RuntimeError):
+            process_zap_results(*args)
+        mock_conn.rollback.assert_called_once()
+        mock_conn.commit.assert_not_called()
+
+    @patch('mysql.connector.connect')
+    def test_process_zap_results_verify_totals(self, mock_conn):
+        """Tests that process zap results checks its totals with one grouped query"""
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchone.side_effect = [(None, 1)]
+        mock_cursor.fetchall.side_effect = [[(1, 'High', 'Test Alert A'),
+                                             (2, 'Low', 'Test Alert B')],
+                                            [('High', 1), ('Low', 1)]]
+        args = (mock_conn, mock_conn, 'test', 'test',
+                [['High', 'Test Alert A', 1], ['Low', 'Test Alert B', 3]], 'test',
+                'http://www.google.com', 'test')
+        result = process_zap_results(*args, verify_totals=True)
+        self.assertTrue('Not enough rows to compare results for test and test' in result)
+        grouped = [query for query in mock_cursor.execute.call_args_list
+                   if 'GROUP BY Alert_Level' in query[0][0]]
+        self.assertEqual(1, len(grouped))
+
+    @patch('mysql.connector.connect')
+    def test_process_zap_results_verify_totals_mismatch(self, mock_conn):
+        """Tests that process zap results rolls back when its totals do not match the stored
+        alerts"""
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.lastrowid = 1
+        mock_cursor.fetchall.side_effect = [[(1, 'High', 'Test Alert A')], [('High', 2)]]
+        args = (mock_conn, mock_conn, 'test', 'test', [['High', 'Test Alert A', 1]], 'test',
+                'http://www.google.com', 'test')
+        with self.assertRaises(ValueError):
+            process_zap_results(*args, verify_totals=True)
+        mock_conn.rollback.assert_called_once()
@@ -0,0 +1,109 @@
+"""Unit tests for the machine-readable comparison formats of OWASP ZAP Historic Parser"""
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+from contextlib import redirect_stdout
+
+from owasp_zap_historic_parser.delta_formats import build_alert_delta, write_alert_delta
+from owasp_zap_historic_parser.owasp_zap_historical import convert_alert_to_dictionary
+from owasp_zap_historic_parser.runner import main
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+TOTALS = {'High': 1, 'Medium': 1, 'Low': 0, 'Informational': 2, 'False Positive': 0}
+CURRENT = [['Informational', 'Same Alert', 2], ['High', 'New Alert', 1],
+           ['Medium', 'More Alert', 5], ['Informational', 'Fewer Alert', 1]]
+PREVIOUS = [['Medium', 'More Alert', 3], ['Informational', 'Fewer Alert', 4],
+            ['Informational', 'Same Alert', 2], ['Low', 'Gone Alert', 7]]
+
+
+class TestDeltaFormats(unittest.TestCase):
+    """Unit Tests for delta_formats.py"""
+
+    def delta(self):
+        """Returns the comparison of CURRENT with PREVIOUS"""
+        return build_alert_delta('QA', 'Active',
+                                 (datetime.datetime(2021, 3, 2, 10), 'http://a b', '1.1'),
+                                 (1, datetime.datetime(2021, 3, 1, 10), 'http://c', '1.0'),
+                                 TOTALS, convert_alert_to_dictionary(CURRENT),
+                                 convert_alert_to_dictionary(PREVIOUS))
+
+    def write(self, output_format):
+        """Returns the comparison of CURRENT with PREVIOUS written in output_format"""
+        sink = io.StringIO()
+        write_alert_delta(sink, output_format, self.delta())
+        return sink.getvalue()
+
+    def test_alert_statuses(self):
+        """Tests that alerts are classified and listed by severity, resolved ones last"""
+        delta = json.loads(self.write('json'))
+        self.assertEqual([(alert['alert'], alert['status']) for alert in delta['alerts']],
+                         [('New Alert', 'new'), ('More Alert', 'increased'),
+                          ('Same Alert', 'unchanged'), ('Fewer Alert', 'decreased'),
+                          ('Gone Alert', 'resolved')])
+        self.assertEqual(delta['statuses'], {'new': 1, 'increased': 1, 'decreased': 1,
+                                             'unchanged': 1, 'resolved': 1})
+        self.assertEqual(delta['totals']['Total'], 4)
+        self.assertEqual(delta['execution_date'], '2021-03-02T10:00:00Z')
+        self.assertEqual(delta['comparison']['version'], '1.0')
+
+    def test_junit_fails_new_and_increased_alerts(self):
+        """Tests that only new or increased alerts above informational fail the test suite"""
+        suite = ElementTree.fromstring(self.write('junit'))
+        self.assertEqual((suite.get('tests'), suite.get('failures')), ('5', '2'))
+        failed = [case.get('name') for case in suite if case.find('failure') is not None]
+        self.assertEqual(failed, ['New Alert', 'More Alert'])
+
+    def test_alerts_without_urls(self):
+        """Tests that alerts affecting 0 URLs are new or unchanged by whether the previous
+        execution had them, and that a new one fails the JUnit test suite"""
+        current = convert_alert_to_dictionary([['High', 'New Empty Alert', 0],
+                                               ['Low', 'Same Empty Alert', 0],
+                                               ['Medium', 'Emptied Alert', 0]])
+        previous = convert_alert_to_dictionary([['Low', 'Same Empty Alert', 0],
+                                                ['Medium', 'Emptied Alert', 2]])
+        delta = build_alert_delta('QA', 'Active',
+                                  (datetime.datetime(2021, 3, 2, 10), 'http://a', '1.1'),
+                                  (1, datetime.datetime(2021, 3, 1, 10), 'http://c', '1.0'),
+                                  TOTALS, current, previous)
+        sink = io.StringIO()
+        write_alert_delta(sink, 'json', delta)
+        self.assertEqual([(alert['alert'], alert['status'])
+                          for alert in json.loads(sink.getvalue())['alerts']],
+                         [('New Empty Alert', 'new'), ('Emptied Alert', 'decreased'),
+                          ('Same Empty Alert', 'unchanged')])
+        self.assertEqual(delta['statuses'], {'new': 1, 'increased': 0, 'decreased': 1,
+                                             'unchanged': 1, 'resolved': 0})
+        sink = io.StringIO()
+        write_alert_delta(sink, 'junit', delta)
+        suite = ElementTree.fromstring(sink.getvalue())
+        self.assertEqual((suite.get('tests'), suite.get('failures')), ('3', '1'))
+        self.assertIsNotNone(suite[0].find('failure'))
+
+    def test_markdown_tables(self):
+        """Tests that the Markdown lists the totals and a row per alert"""
+        markdown = self.write('markdown')
+        self.assertIn('| 4 | 1 | 1 | 0 | 2 | 0 |', markdown)
+        self.assertIn('| Low | Gone Alert | 0 | 7 | resolved |', markdown)
+        self.assertIn('<http://a%20b>', markdown)
+
+    def test_cli_output_format(self):
+        """Tests that --output-format prints the comparison as JSON instead of HTML"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            deltas = []
+            for file_name in ('testReport.json', 'newReport.html'):
+                sys.argv[1:] = ['-f', ROOT_PATH + '/test_files/' + file_name, '-n', 'test',
+                                '--backend', 'sqlite', '--sqlite-path', temp_dir,
+                                '--output-format', 'json']
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    self.assertEqual(main(), 0)
+                deltas.append(json.loads(output.getvalue()))
+        self.assertIsNone(deltas[0]['comparison'])
+        self.assertEqual({alert['status'] for alert in deltas[0]['alerts']}, {'new'})
+        self.assertIsNotNone(deltas[1]['comparison'])
+        self.assertEqual(len(deltas[1]['alerts']), sum(deltas[1]['statuses'].values()))
@@ -1,14 +1,35 @@
 """Unit tests for functions used in OWASP ZAP Historic Parser"""
+import io
 import unittest
 import os
+import shutil
+import tempfile
+from lxml import etree
 
 from owasp_zap_historic_parser.owasp_zap_historical import convert_alert_to_dictionary
 from owasp_zap_historic_parser.owasp_zap_historical import compare_zap_results
 from owasp_zap_historic_parser.owasp_zap_historical import html_parser
 from owasp_zap_historic_parser.owasp_zap_historical import get_alert_table_row
 from owasp_zap_historic_parser.owasp_zap_historical import get_locators
+from owasp_zap_historic_parser.owasp_zap_historical import iter_html_alerts
+from owasp_zap_historic_parser.owasp_zap_historical import AlertAggregator
+from owasp_zap_historic_parser.owasp_zap_historical import html_stream_parser
+from owasp_zap_historic_parser.owasp_zap_historical import json_parser
+from owasp_zap_historic_parser.owasp_zap_historical import xml_parser
+from owasp_zap_historic_parser.owasp_zap_historical import parse_report
+from owasp_zap_historic_parser.owasp_zap_historical import get_report_format
+from owasp_zap_historic_parser.owasp_zap_historical import JsonReportStream
+from owasp_zap_historic_parser.owasp_zap_historical import count_alert_levels
+from owasp_zap_historic_parser.owasp_zap_historical import expand_report_paths
+from owasp_zap_historic_parser.owasp_zap_historical import write_parsed_reports
+from owasp_zap_historic_parser.owasp_zap_historical import write_alert_breakdown
+from owasp_zap_historic_parser.owasp_zap_historical import iter_report_instances
 
 ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+STRUCTURED_RESULT = [['Medium', 'X-Frame-Options Header Not Set', 3],
+                     ['Low', 'Cookie Without SameSite Attribute', 5],
+                     ['Informational', 'Timestamp Disclosure - Unix', 1],
+                     ['False Positive', 'Test Alert', 1]]
 THIS_DATE = "Aug 30 2020 10:43 PM CDT"
 COMP_DATE = "Jul 30 2020 9:43 PM CDT"
 
@@ -82,6 +103,137 @@ class TestFunctions(unittest.TestCase):
         expected_result = "[['False Positive', 'Test Alert', 1]]"
         self.assertEqual(str(result), expected_result)
 
+    def test_html_stream_parser(self):
+        """This test verifies that the streaming html parser returns the same results as the
+        html parser for older and newer zap files."""
+        for file_name in ["testReport.html", "testReportWithSame.html", "newReport.html",
+                          "empty.html"]:
+            file_path = ROOT_PATH + "/" + "test_files/" + file_name
+            self.assertEqual(html_stream_parser(file_path), html_parser(file_path))
+
+    def test_json_parser(self):
+        """This test verifies that the json parser correctly parses a zap json file."""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.json"
+        self.assertEqual(json_parser(file_path), STRUCTURED_RESULT)
+
+    def test_json_report_stream_small_chunks(self):
+        """This test verifies that the json report stream decodes every alert when values
+        are split across many reads."""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.json"
+        with open(file_path, encoding='utf-8') as report:
+            stream = JsonReportStream(report, chunk_size=3)
+            alerts = []
+            while stream.find_array('alerts'):
+                alerts.extend(alert['alert'] for alert in stream.iter_array())
+        self.assertEqual(len(alerts), 6)
+
+    def test_xml_parser(self):
+        """This test verifies that the xml parser correctly parses a zap xml file."""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.xml"
+        self.assertEqual(xml_parser(file_path), STRUCTURED_RESULT)
+
+    def test_get_report_format_extension(self):
+        """This test verifies that get report format uses the file extension."""
+        self.assertEqual(get_report_format("report.json"), "json")
+        self.assertEqual(get_report_format("report.XML"), "xml")
+        self.assertEqual(get_report_format("report.htm"), "html")
+
+    def test_parse_report_sniffs_content(self):
+        """This test verifies that parse report picks the reader from the content of a file
+        without a known extension."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for file_name, expected_result in [("testReport.json", STRUCTURED_RESULT),
+                                               ("testReport.xml", STRUCTURED_RESULT),
+                                               ("newReport.html",
+                                                [['False Positive', 'Test Alert', 1]])]:
+                copy_path = os.path.join(temp_dir, file_name + ".report")
+                shutil.copy(ROOT_PATH + "/" + "test_files/" + file_name, copy_path)
+                self.assertEqual(parse_report(copy_path), expected_result)
+
+    def test_iter_report_instances(self):
+        """This test verifies that the instances of every alert are read from each report
+        format, one for each affected URL the HTML report counts."""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.html"
+        url_counts = {}
+        for level, alert_type, url, _, _, _, _ in iter_report_instances(file_path):
+            self.assertTrue(url.startswith('https://'))
+            url_counts[(level, alert_type)] = url_counts.get((level, alert_type), 0) + 1
+        self.assertEqual(url_counts, {(level, alert_type): int(url_count) for
+                                      level, alert_type, url_count in parse_report(file_path)})
+        for file_name in ("testReport.json", "testReport.xml"):
+            instances = list(iter_report_instances(ROOT_PATH + "/" + "test_files/" + file_name))
+            self.assertEqual(len(instances), 8)
+            self.assertEqual(instances[0], ('Medium', 'X-Frame-Options Header Not Set',
+                                            'https://www.example.com/login', 'GET',
+                                            'X-Frame-Options', '', ''))
+
+    def test_expand_report_paths(self):
+        """This test verifies that expand report paths expands directories and globs in sorted
+        order and leaves a single report alone."""
+        test_dir = ROOT_PATH + "/" + "test_files"
+        self.assertEqual(expand_report_paths(test_dir + "/testReport*.html"),
+                         [test_dir + "/testReport.html", test_dir + "/testReportWithSame.html"])
+        self.assertEqual(len(expand_report_paths(test_dir)), 6)
+        self.assertEqual(expand_report_paths("report.html"), ["report.html"])
+
+    def test_write_parsed_reports(self):
+        """This test verifies that write parsed reports writes one canonical json line per
+        alert followed by the report's totals."""
+        file_path = ROOT_PATH + "/" + "test_files/newReport.html"
+        sink = io.StringIO()
+        write_parsed_reports([file_path], sink)
+        expected_result = '{"alert":"Test Alert","level":"False Positive","report":"' + \
+                          file_path + '","urls_affected":1}\n{"report":"' + file_path + \
+                          '","totals":{"False Positive":1,"High":0,"Informational":0,"Low":0,' \
+                          '"Medium":0}}\n'
+        self.assertEqual(sink.getvalue(), expected_result)
+
+    def test_iter_html_alerts_results_table(self):
+        """This test verifies that iter html alerts yields each results table row of an older
+        zap file in document order."""
+        file_path = ROOT_PATH + "/" + "test_files/testReportWithSame.html"
+        tree = etree.parse(file_path, etree.HTMLParser())
+        result = list(iter_html_alerts(tree))
+        expected_result = [('Medium', 'X-Frame-Options Header Not Set', 1),
+                           ('Medium', 'X-Frame-Options Header Not Set', 10)]
+        self.assertEqual(result, expected_result)
+
+    def test_iter_html_alerts_alerts_table(self):
+        """This test verifies that iter html alerts yields each alerts table row of a newer
+        zap file."""
+        file_path = ROOT_PATH + "/" + "test_files/newReport.html"
+        tree = etree.parse(file_path, etree.HTMLParser())
+        result = list(iter_html_alerts(tree))
+        self.assertEqual(result, [('False Positive', 'Test Alert', 1)])
+
+    def test_alert_aggregator_merges_rows(self):
+        """This test verifies that the alert aggregator adds up the URL counts of rows with the
+        same level and alert type, and groups the results by severity in first-seen order."""
+        aggregator = AlertAggregator()
+        aggregator.add_rows([("Low", "Alert B", 2), ("High", "Alert A", 1),
+                             ("Low", "Alert C", 4), ("Low", "Alert B", 3),
+                             ("Medium", "Alert B", 5)])
+        expected_result = [["High", "Alert A", 1], ["Medium", "Alert B", 5],
+                           ["Low", "Alert B", 5], ["Low", "Alert C", 4]]
+        self.assertEqual(aggregator.results(), expected_result)
+        self.assertEqual(len(aggregator), 4)
+
+    def test_alert_aggregator_equal_rows(self):
+        """This test verifies that the alert aggregator keeps separate entries that happen to
+        have equal URL counts."""
+        aggregator = AlertAggregator()
+        aggregator.add_rows([("Low", "Alert A", 1), ("Low", "Alert B", 1),
+                             ("Low", "Alert A", 1)])
+        self.assertEqual(aggregator.results(), [["Low", "Alert A", 2], ["Low", "Alert B", 1]])
+
+    def test_count_alert_levels(self):
+        """This test verifies that count alert levels totals the alerts at each level."""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.html"
+        result = count_alert_levels(html_parser(file_path))
+        expected_result = {'High': 0, 'Medium': 1, 'Low': 7, 'Informational': 2,
+                           'False Positive': 0}
+        self.assertEqual(result, expected_result)
+
     def test_compare_zap_results_same(self):
         """This test verifies that compare zap results returns the alert table correctly."""
         this_dict = {'High | Same URL Count': {'Alert Level': 'High',
@@ -139,6 +291,26 @@ class TestFunctions(unittest.TestCase):
         result = compare_zap_results(this_dict, comp_dict, THIS_DATE, COMP_DATE)
         self.assertTrue(check_text in result)
 
+    def test_write_alert_breakdown_streams_rows(self):
+        """This test verifies that the breakdown is written row by row in severity order, the
+        same as compare zap results returns it."""
+        this_dict = convert_alert_to_dictionary([('Low', 'Low Alert', 2),
+                                                 ('High', 'High Alert', 1),
+                                                 ('Medium', 'Medium Alert', 4)])
+        comp_dict = convert_alert_to_dictionary([('Low', 'Low Alert', 3),
+                                                 ('Informational', 'Old Alert', 1)])
+        writes = []
+        sink = io.StringIO()
+        sink.write = lambda text: writes.append(text) or len(text)
+        write_alert_breakdown(sink, this_dict, comp_dict, THIS_DATE, COMP_DATE)
+        result = ''.join(writes)
+        self.assertEqual(result, compare_zap_results(this_dict, comp_dict, THIS_DATE,
+                                                     COMP_DATE))
+        self.assertEqual(len(writes), 6)
+        positions = [result.index(alert) for alert in ('High Alert', 'Medium Alert',
+                                                       'Low Alert', 'Old Alert')]
+        self.assertEqual(positions, sorted(positions))
+
     def test_compare_zap_results_resolved(self):
         """This test verifies that compare zap results returns the alert table correctly."""
         this_dict = {}
@@ -0,0 +1,78 @@
+"""Unit tests for the ingest metrics and profiling of OWASP ZAP Historic Parser"""
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
+
+from owasp_zap_historic_parser.metrics import IngestMetrics
+from owasp_zap_historic_parser.owasp_zap_historical import process_zap_results
+from owasp_zap_historic_parser.runner import main
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestMetrics(unittest.TestCase):
+    """Unit Tests for metrics.py"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def ingest(self, file_name, *extra):
+        """Runs the parser on a test report with the SQLite backend"""
+        sys.argv[1:] = ['-f', ROOT_PATH + '/test_files/' + file_name, '-n', 'test',
+                        '--backend', 'sqlite', '--sqlite-path', self.temp_dir.name] + list(extra)
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(main(), 0)
+
+    def test_metrics_record_per_report(self):
+        """Tests that each report appends its stages, rows and round trips as a JSON line"""
+        metrics_path = os.path.join(self.temp_dir.name, 'metrics.ndjson')
+        self.ingest('testReport.json', '--metrics', metrics_path)
+        self.ingest('newReport.html', '--metrics', metrics_path, '--verify-totals')
+        with open(metrics_path, encoding='utf-8') as metrics_file:
+            first, second = [json.loads(line) for line in metrics_file]
+        self.assertEqual(set(first['stages']), {'digest', 'find_duplicate', 'parse', 'connect',
+                                                'insert', 'update_project', 'compare',
+                                                'render'})
+        self.assertEqual(first['rows'], {'parsed_alerts': 4, 'inserted_alerts': 4})
+        self.assertEqual(first['stages']['compare']['round_trips'], 0)
+        self.assertEqual(second['rows']['previous_alerts'], 4)
+        # alerts of both executions and the previous execution row
+        self.assertEqual(second['stages']['compare']['round_trips'], 3)
+        # the first report also looked its alert types up before and after adding them, the
+        # second finds them all in the process cache
+        self.assertEqual(second['statements']['SELECT'] - first['statements']['SELECT'], 2)
+        self.assertEqual(second['round_trips'], sum(second['statements'].values()))
+
+    def test_mysql_round_trips(self):
+        """Tests that the statements sent over MySQL connections are counted"""
+        con = mock.MagicMock()
+        con.cursor.return_value.fetchone.side_effect = [(None, 1)]
+        con.cursor.return_value.fetchall.return_value = [(1, 'High', 'Alert')]
+        metrics = IngestMetrics('report.html')
+        process_zap_results(con, con, 'QA', 'Active', [['High', 'Alert', 1]] * 3, 'test',
+                            'link', '1.0', batch_size=2, metrics=metrics)
+        record = metrics.record()
+        # alert type lookup, execution, two alert batches, its update, the rollup and its read
+        # back, the project
+        self.assertEqual(record['stages']['insert']['round_trips'], 8)
+        self.assertEqual(record['stages']['update_project']['round_trips'], 2)
+        self.assertEqual(record['statements']['COMMIT'], 2)
+        self.assertEqual(con.cursor.return_value.executemany.call_count, 2)
+
+    def test_profile(self):
+        """Tests that --profile saves the profile and prints a summary to stderr"""
+        profile_path = os.path.join(self.temp_dir.name, 'ingest.prof')
+        errors = io.StringIO()
+        with redirect_stderr(errors):
+            self.ingest('testReport.html', '--profile', profile_path)
+        self.assertTrue(os.path.getsize(profile_path))
+        self.assertIn('process_zap_file', errors.getvalue())
+        self.assertIn('Python memory:', errors.getvalue())
@@ -0,0 +1,108 @@
+"""Unit tests for the offline spool and replay of OWASP ZAP Historic Parser"""
+import datetime
+import io
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import mysql.connector
+
+from owasp_zap_historic_parser.owasp_zap_historical import store_zap_results, \
+    close_connection_pools, process_zap_file
+from owasp_zap_historic_parser.offline_spool import spool_zap_results, replay_spool, \
+    read_spool_entries
+from owasp_zap_historic_parser.runner import parse_options
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+RESULTS = [['High', 'Alert One', 2], ['Low', 'Alert Two', 1]]
+
+
+class TestOfflineSpool(unittest.TestCase):
+    """Unit Tests for offline_spool.py"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.temp_dir.name, 'offline.ndjson')
+
+    def tearDown(self):
+        close_connection_pools()
+        self.temp_dir.cleanup()
+
+    def options(self, *extra):
+        """Returns parsed options spooling to the test spool file"""
+        sys.argv[1:] = ['-n', 'test', '-e', 'QA', '-i', 'Active',
+                        '--offline-spool', self.spool_path] + list(extra)
+        return parse_options()
+
+    @patch('mysql.connector.connect')
+    def test_store_spools_when_database_is_down(self, mock_connect):
+        """Tests that results are appended to the spool when MySQL cannot be reached"""
+        mock_connect.side_effect = mysql.connector.InterfaceError('no route to host')
+        with redirect_stdout(io.StringIO()):
+            message = store_zap_results(self.options('--connect-timeout', '2'), RESULTS)
+            store_zap_results(self.options(), RESULTS[:1])
+        self.assertIn('spooled 2 alerts', message)
+        self.assertEqual(mock_connect.call_args_list[0][1]['connection_timeout'], 2)
+        entries = read_spool_entries(self.spool_path)
+        self.assertEqual([entry['results'] for entry in entries], [RESULTS, RESULTS[:1]])
+        self.assertEqual((entries[0]['project'], entries[0]['environment'],
+                          entries[0]['scan_type']), ('test', 'QA', 'Active'))
+
+    @patch('mysql.connector.connect')
+    def test_report_spools_after_one_connection_attempt(self, mock_connect):
+        """Tests that a report goes to the spool after a single failed connection, saying so
+        once"""
+        mock_connect.side_effect = mysql.connector.InterfaceError('no route to host')
+        output = io.StringIO()
+        with redirect_stdout(output):
+            message = process_zap_file(self.options('-f', ROOT_PATH +
+                                                    '/test_files/testReport.json'))
+        self.assertEqual(mock_connect.call_count, 1)
+        self.assertIn('spooled 4 alerts', message)
+        self.assertEqual(output.getvalue().count('spooled'), 1)
+        self.assertEqual(len(read_spool_entries(self.spool_path)), 1)
+
+    @patch('mysql.connector.connect')
+    def test_store_without_spool_still_fails(self, mock_connect):
+        """Tests that an unreachable database is an error when no spool is configured"""
+        mock_connect.side_effect = mysql.connector.InterfaceError('no route to host')
+        sys.argv[1:] = ['-n', 'test']
+        with redirect_stdout(io.StringIO()), self.assertRaises(ConnectionError):
+            store_zap_results(parse_options(), RESULTS)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_torn_final_line_is_ignored(self):
+        """Tests that a partly written last entry is not read back"""
+        opts = self.options()
+        with redirect_stdout(io.StringIO()):
+            spool_zap_results(self.spool_path, opts, RESULTS)
+        with open(self.spool_path, 'a', encoding='utf-8') as spool:
+            spool.write('{"project":"te')
+        self.assertEqual(len(read_spool_entries(self.spool_path)), 1)
+
+    @patch('mysql.connector.connect')
+    @patch('owasp_zap_historic_parser.offline_spool.process_zap_results')
+    def test_replay_resumes_without_duplicates(self, mock_pzr, mock_connect):
+        """Tests that replay keeps order and dates, stops at a failure and resumes after it"""
+        opts = self.options()
+        dates = [datetime.datetime(2021, 3, day, 10, 30, 15, 1234) for day in (1, 2, 3)]
+        with redirect_stdout(io.StringIO()):
+            for position, execution_date in enumerate(dates):
+                spool_zap_results(self.spool_path, opts, RESULTS[:position + 1],
+                                  execution_date)
+            mock_pzr.side_effect = [None, ConnectionError('lost'), None, None, None]
+            sys.argv[1:] = ['replay', self.spool_path]
+            self.assertEqual(replay_spool(parse_options()), 2)
+            self.assertFalse(os.path.exists(self.spool_path))
+            spool_zap_results(self.spool_path, opts, RESULTS)
+            self.assertEqual(replay_spool(parse_options()), 0)
+        replayed = [(call[0][4], call[1]['execution_date']) for call in mock_pzr.call_args_list]
+        self.assertEqual(replayed[:4], [(RESULTS[:1], dates[0]), (RESULTS[:2], dates[1]),
+                                        (RESULTS[:2], dates[1]), (RESULTS[:3], dates[2])])
+        self.assertEqual(replayed[4][0], RESULTS)
+        self.assertEqual(mock_pzr.call_count, 5)
+        self.assertEqual(mock_connect.call_count, 4)
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
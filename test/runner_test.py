@@ -1,10 +1,29 @@
 """Unit tests for functions used in OWASP ZAP Historic Parser runner"""
+import json
+import os
+import subprocess
 import sys
 import unittest
 
 from owasp_zap_historic_parser.runner import parse_options
 
 
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+# Runs a cold owaspzaphistoricparser with the given arguments and prints the heavy modules
+# it loaded
+COLD_IMPORTS = """
+import sys
+sys.argv = ['owaspzaphistoricparser'] + sys.argv[1:]
+from owasp_zap_historic_parser.runner import main
+try:
+    main()
+except SystemExit:
+    pass
+print(' '.join(sorted(name for name in ('mysql.connector', 'lxml', 'pytz')
+                      if name in sys.modules)))
+"""
+
+
 class TestRunner(unittest.TestCase):
     """Unit Tests for runner.py"""
 
@@ -127,3 +146,93 @@ class TestRunner(unittest.TestCase):
         sys.argv[1:] = ['-v']
         with self.assertRaises(SystemExit):
             parse_options()
+
+    def test_streaming(self):
+        """Argument parser positive test for streaming"""
+        sys.argv[1:] = ['--streaming']
+        options = parse_options()
+        self.assertTrue(options.streaming)
+
+    def test_streaming_default(self):
+        """Argument parser default test for streaming"""
+        sys.argv[1:] = []
+        options = parse_options()
+        self.assertFalse(options.streaming)
+
+    def test_batch_size(self):
+        """Argument parser positive test for batch size"""
+        sys.argv[1:] = ['--batch-size', '50']
+        options = parse_options()
+        self.assertEqual(50, options.batch_size)
+
+    def test_batch_size_invalid(self):
+        """Argument parser negative test for batch size"""
+        sys.argv[1:] = ['--batch-size', 'many']
+        with self.assertRaises(SystemExit):
+            parse_options()
+
+    def test_verify_totals(self):
+        """Argument parser positive test for verify totals"""
+        sys.argv[1:] = ['--verify-totals']
+        options = parse_options()
+        self.assertTrue(options.verify_totals)
+
+    def test_pool_options(self):
+        """Argument parser positive test for pool size and recycle"""
+        sys.argv[1:] = ['--pool-size', '4', '--pool-recycle', '60']
+        options = parse_options()
+        self.assertEqual((4, 60), (options.pool_size, options.pool_recycle))
+
+    def test_command_default(self):
+        """Argument parser default test for command"""
+        sys.argv[1:] = ['-f', 'empty.html']
+        options = parse_options()
+        self.assertEqual('ingest', options.command)
+
+    def test_command_watch(self):
+        """Argument parser positive test for the watch command"""
+        sys.argv[1:] = ['watch', '-n', 'test_project', 'spool', '--poll-interval', '0.5']
+        options = parse_options()
+        self.assertEqual(('watch', 'spool', 'test_project', 0.5),
+                         (options.command, options.target, options.projectname,
+                          options.poll_interval))
+
+    def test_command_watch_no_directory(self):
+        """Argument parser negative test for the watch command"""
+        sys.argv[1:] = ['watch']
+        with self.assertRaises(SystemExit):
+            parse_options()
+
+    def test_command_invalid(self):
+        """Argument parser negative test for command"""
+        sys.argv[1:] = ['explode']
+        with self.assertRaises(SystemExit):
+            parse_options()
+
+    def test_help_skips_heavy_imports(self):
+        """Cold --help must not load the database driver, lxml or pytz"""
+        result = subprocess.run([sys.executable, '-c', COLD_IMPORTS, '--help'],
+                                capture_output=True, text=True, cwd=os.path.dirname(ROOT_PATH),
+                                check=True)
+        self.assertIn('usage:', result.stdout)
+        self.assertEqual(result.stdout.splitlines()[-1], '')
+
+    def test_parse_only_skips_database(self):
+        """--parse-only writes NDJSON without loading the database driver"""
+        file_path = ROOT_PATH + "/" + "test_files/testReport.json"
+        result = subprocess.run([sys.executable, '-c', COLD_IMPORTS, '--parse-only', '-f',
+                                 file_path], capture_output=True, text=True,
+                                cwd=os.path.dirname(ROOT_PATH), check=True)
+        lines = result.stdout.splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(json.loads(lines[0]), {'report': file_path, 'level': 'Medium',
+                                                'alert': 'X-Frame-Options Header Not Set',
+                                                'urls_affected': 3})
+        self.assertEqual(json.loads(lines[4])['totals']['Low'], 1)
+        self.assertEqual(lines[-1], '')
+
+    def test_parse_only(self):
+        """Argument parser positive test for parse only and output"""
+        sys.argv[1:] = ['--parse-only', '-o', 'alerts.ndjson']
+        options = parse_options()
+        self.assertEqual((True, 'alerts.ndjson'), (options.parse_only, options.output))
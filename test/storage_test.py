@@ -0,0 +1,304 @@
+"""Unit tests for the storage backends of OWASP ZAP Historic Parser"""
+import datetime
+import io
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from owasp_zap_historic_parser.owasp_zap_historical import record_zap_results
+from owasp_zap_historic_parser.runner import main
+from owasp_zap_historic_parser.storage import MySQLStorage, SQLiteStorage
+from owasp_zap_historic_parser import storage as storage_module
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    """Unit Tests for storage.py"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def ingest(self, file_name, version, *extra):
+        """Runs the parser on a test report with the SQLite backend and returns its output"""
+        sys.argv[1:] = ['-f', ROOT_PATH + '/test_files/' + file_name, '-n', 'test', '-e', 'QA',
+                        '-i', 'Active', '-v', version, '--backend', 'sqlite',
+                        '--sqlite-path', self.temp_dir.name, '--verify-totals'] + list(extra)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(main(), 0)
+        return output.getvalue()
+
+    def test_full_pipeline(self):
+        """Tests that reports are stored and compared without a MySQL server"""
+        first = self.ingest('testReport.json', '1.0')
+        self.assertIn('Not enough rows to compare results for QA and Active', first)
+        second = self.ingest('newReport.html', '1.1')
+        self.assertIn('Comparison Report Version:</strong></td><td style=\'border: 1px;\'>1.0',
+                      second)
+        self.assertIn('Overall Alerts', second)
+        con = sqlite3.connect(os.path.join(self.temp_dir.name, 'test.db'))
+        self.assertEqual(con.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+        executions = con.execute("SELECT Execution_Id, Version, Medium_Alerts, Low_Alerts "
+                                 "FROM TB_EXECUTION ORDER BY Execution_Id").fetchall()
+        self.assertEqual(executions[0], (1, '1.0', 1, 1))
+        self.assertEqual(len(con.execute("SELECT * FROM TB_ALERTS WHERE Execution_Id = 1")
+                             .fetchall()), 4)
+        self.assertEqual(con.execute("SELECT * FROM TB_SCAN_ROLLUP").fetchall(),
+                         [('QA', 'Active', 2, 2, 1)])
+        con.close()
+        con = sqlite3.connect(os.path.join(self.temp_dir.name, 'owaspzaphistoric.db'))
+        self.assertEqual(con.execute("SELECT Total_Executions, Version FROM TB_PROJECT "
+                                     "WHERE Project_Name = 'test'").fetchall(), [(2, '1.1')])
+        con.close()
+
+    def test_comparison_is_streamed_to_stdout(self):
+        """Tests that the streamed comparison printed by the CLI is the returned comparison"""
+        self.ingest('testReport.json', '1.0')
+        printed = self.ingest('newReport.html', '1.1')
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        try:
+            returned = record_zap_results(storage, 'QA', 'Active', [], 'test',
+                                          ROOT_PATH + '/test_files/newReport.html', '1.1')
+        finally:
+            storage.close()
+        self.assertTrue(printed.endswith('</tbody></table>\n'))
+        self.assertEqual(printed.count('\n'), 1)
+        self.assertEqual(printed.split('This report date: ')[0],
+                         returned.split('This report date: ')[0])
+
+    def test_failed_execution_is_rolled_back(self):
+        """Tests that an execution whose alerts cannot be stored leaves nothing behind"""
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        zap_results = [['High', 'Alert One', 1], ['Low', 'Alert Two', object()]]
+        with self.assertRaises(sqlite3.Error):
+            storage.add_execution(datetime.datetime(2020, 1, 1), 'QA', 'Active', zap_results,
+                                  'http://www.google.com', '1.0')
+        self.assertEqual(storage.con.execute("SELECT COUNT(*) FROM TB_EXECUTION").fetchone(),
+                         (0,))
+        self.assertEqual(storage.con.execute("SELECT COUNT(*) FROM TB_ALERTS").fetchone(), (0,))
+        storage.close()
+
+    def test_rollup_is_filled_from_history(self):
+        """Tests that a database from before the rollup gets it filled from its executions"""
+        con = sqlite3.connect(os.path.join(self.temp_dir.name, 'test.db'))
+        con.execute("CREATE TABLE TB_EXECUTION (Execution_Id INTEGER PRIMARY KEY "
+                    "AUTOINCREMENT, Execution_Date TEXT, Environment TEXT, Scan_Type TEXT, "
+                    "High_Alerts INTEGER, Medium_Alerts INTEGER, Low_Alerts INTEGER, "
+                    "Informational_Alerts INTEGER, False_Alerts INTEGER, URL_Link TEXT, "
+                    "Version TEXT)")
+        con.executemany("INSERT INTO TB_EXECUTION (Execution_Date, Environment, Scan_Type, "
+                        "URL_Link, Version) VALUES ('2020-01-01 00:00:00', ?, ?, 'link', ?)",
+                        [('QA', 'Active', '1'), ('QA', 'Passive', '1'), ('QA', 'Active', '2')])
+        con.commit()
+        con.close()
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        self.assertIn('Filled TB_SCAN_ROLLUP with 2 rows', storage.schema_changes)
+        execution_id, _, previous_id, total_executions = storage.add_execution(
+            datetime.datetime(2020, 1, 2), 'QA', 'Active', [['High', 'Alert', 1]], 'link', '3')
+        self.assertEqual((execution_id, previous_id, total_executions), (4, 3, 4))
+        self.assertEqual(storage.get_execution(previous_id)[3], '2')
+        storage.close()
+
+    def test_identical_report_is_not_stored_twice(self):
+        """Tests that a report ingested again prints its comparison without a new execution"""
+        self.ingest('testReport.json', '1.0')
+        first = self.ingest('newReport.html', '1.1')
+        error = io.StringIO()
+        with mock.patch('sys.stderr', error):
+            again = self.ingest('newReport.html', '1.1')
+        self.assertIn('Report already ingested as execution 2', error.getvalue())
+        self.assertEqual(again.split('This report date: ')[0],
+                         first.split('This report date: ')[0])
+        sys.argv.append('--record-duplicate')
+        with redirect_stdout(io.StringIO()), mock.patch('sys.stderr', io.StringIO()):
+            self.assertEqual(main(), 0)
+        con = sqlite3.connect(os.path.join(self.temp_dir.name, 'test.db'))
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM TB_EXECUTION").fetchone(), (2,))
+        self.assertEqual(con.execute("SELECT Execution_Id, Version FROM TB_DUPLICATE_REPORT")
+                         .fetchall(), [(2, '1.1')])
+        con.close()
+
+    def test_digest_column_is_added(self):
+        """Tests that a database from before report digests gets the column added"""
+        con = sqlite3.connect(os.path.join(self.temp_dir.name, 'test.db'))
+        con.execute("CREATE TABLE TB_EXECUTION (Execution_Id INTEGER PRIMARY KEY "
+                    "AUTOINCREMENT, Execution_Date TEXT, Environment TEXT, Scan_Type TEXT, "
+                    "High_Alerts INTEGER, Medium_Alerts INTEGER, Low_Alerts INTEGER, "
+                    "Informational_Alerts INTEGER, False_Alerts INTEGER, URL_Link TEXT, "
+                    "Version TEXT)")
+        con.close()
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        self.assertIn('Added column Report_Digest to TB_EXECUTION', storage.schema_changes)
+        storage.add_execution(datetime.datetime(2020, 1, 2), 'QA', 'Active',
+                              [['High', 'Alert', 1]], 'link', '1', report_digest='ab' * 32)
+        self.assertEqual(storage.find_report('QA', 'Active', 'ab' * 32), 1)
+        self.assertIsNone(storage.find_report('QA', 'Passive', 'ab' * 32))
+        storage.close()
+
+    def test_alert_types_are_stored_once(self):
+        """Tests that alerts are stored with the id of their level and type, and that known
+        types are taken from the process cache"""
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        zap_results = [['High', 'Alert One', 1], ['Low', 'Alert Two', 2], ['Low', 'Alert One', 3]]
+        storage.add_execution(datetime.datetime(2020, 1, 1), 'QA', 'Active', zap_results,
+                              'link', '1')
+        storage.close()
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        with mock.patch.object(storage_module, 'select_alert_types') as mock_select:
+            storage.add_execution(datetime.datetime(2020, 1, 2), 'QA', 'Active',
+                                  zap_results[1:], 'link', '2')
+        mock_select.assert_not_called()
+        self.assertEqual(storage.con.execute("SELECT * FROM TB_ALERT_TYPE ORDER BY "
+                                             "Alert_Type_Id").fetchall(),
+                         [(1, 'High', 'Alert One'), (2, 'Low', 'Alert One'),
+                          (3, 'Low', 'Alert Two')])
+        self.assertEqual(storage.con.execute("SELECT Alert_Type_Id FROM TB_ALERTS WHERE "
+                                             "Execution_Id = 2 ORDER BY Alert_Id").fetchall(),
+                         [(3,), (2,)])
+        self.assertEqual(storage.get_alerts(2), [('Low', 'Alert Two', 2),
+                                                 ('Low', 'Alert One', 3)])
+        storage.close()
+
+    def test_alert_types_are_filled_from_history(self):
+        """Tests that a database from before TB_ALERT_TYPE gets the ids of its alerts filled"""
+        con = sqlite3.connect(os.path.join(self.temp_dir.name, 'test.db'))
+        con.execute("CREATE TABLE TB_ALERTS (Alert_Id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "Execution_Id INTEGER, Alert_Level TEXT, Alert_Type TEXT, "
+                    "URLS_Affected INTEGER)")
+        con.executemany("INSERT INTO TB_ALERTS (Execution_Id, Alert_Level, Alert_Type, "
+                        "URLS_Affected) VALUES (?, ?, ?, ?)",
+                        [(1, 'High', 'Alert One', 1), (1, 'Low', 'Alert Two', 2),
+                         (2, 'High', 'Alert One', 4)])
+        con.commit()
+        con.close()
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        self.assertIn('Filled TB_ALERT_TYPE with 2 rows', storage.schema_changes)
+        self.assertIn('Filled Alert_Type_Id of 3 rows of TB_ALERTS', storage.schema_changes)
+        self.assertEqual(storage.get_alerts(2), [('High', 'Alert One', 4)])
+        storage.close()
+
+    def test_alerts_without_type_id_are_compared(self):
+        """Tests that alerts stored without an alert type id are still read and compared"""
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        storage.add_execution(datetime.datetime(2020, 1, 1), 'QA', 'Active',
+                              [['High', 'Alert One', 1], ['Low', 'Alert Two', 2]], 'link', '1')
+        storage.con.execute("UPDATE TB_ALERTS SET Alert_Type_Id = NULL")
+        storage.con.execute("INSERT INTO TB_ALERTS (Execution_Id, Alert_Level, Alert_Type, "
+                            "URLS_Affected) VALUES (1, 'Medium', 'Alert Gone', 5)")
+        storage.con.commit()
+        self.assertEqual(storage.get_alert_counts(1),
+                         [(1, 1), (2, 2), (('Medium', 'Alert Gone'), 5)])
+        self.assertEqual(storage.get_alerts(1), [('High', 'Alert One', 1),
+                                                 ('Low', 'Alert Two', 2),
+                                                 ('Medium', 'Alert Gone', 5)])
+        output = json.loads(record_zap_results(storage, 'QA', 'Active', [['High', 'Alert One', 3]],
+                                               'test', 'link', '2', output_format='json'))
+        storage.close()
+        self.assertEqual([(alert['alert'], alert['status']) for alert in output['alerts']],
+                         [('Alert One', 'increased'), ('Alert Two', 'resolved'),
+                          ('Alert Gone', 'resolved')])
+
+    def test_capture_instances(self):
+        """Tests that --capture-instances stores every URL instance against its alert type"""
+        self.ingest('testReport.json', '1.0')
+        self.ingest('testReport.html', '1.1', '--capture-instances')
+        storage = SQLiteStorage(self.temp_dir.name, 'test')
+        rows = storage.con.execute(
+            "SELECT i.Execution_Id, t.Alert_Level, t.Alert_Type, i.URL, i.Method FROM "
+            "TB_ALERT_INSTANCE i JOIN TB_ALERT_TYPE t ON t.Alert_Type_Id = i.Alert_Type_Id "
+            "ORDER BY i.Instance_Id").fetchall()
+        self.assertEqual(len(rows), 45)
+        self.assertEqual({row[0] for row in rows}, {2})
+        self.assertEqual(rows[0], (2, 'Medium', 'X-Frame-Options Header Not Set',
+                                   'https://www.someurl.com/facility/login.jsp?SiteID=109',
+                                   'GET'))
+        self.assertEqual(len({row[1:3] for row in rows}), 10)
+        storage.close()
+
+    def test_init_schema_is_idempotent(self):
+        """Tests that init-schema creates the indexes once and reports plans that use them"""
+        sys.argv[1:] = ['init-schema', '-n', 'test', '--backend', 'sqlite',
+                        '--sqlite-path', self.temp_dir.name]
+        first = io.StringIO()
+        with redirect_stdout(first):
+            self.assertEqual(main(), 0)
+        self.assertIn('Created index IX_EXECUTION_ENV_SCAN on TB_EXECUTION', first.getvalue())
+        self.assertIn('Registered project test', first.getvalue())
+        sys.argv[1] = 'migrate'
+        second = io.StringIO()
+        with redirect_stdout(second):
+            self.assertEqual(main(), 0)
+        self.assertIn('Schema for test is up to date', second.getvalue())
+        self.assertNotIn('Created', second.getvalue())
+        self.assertIn('SEARCH TB_SCAN_ROLLUP USING INDEX', second.getvalue())
+        self.assertIn('SEARCH TB_EXECUTION USING INTEGER PRIMARY KEY', second.getvalue())
+        self.assertIn('USING COVERING INDEX IX_ALERTS_EXECUTION_LEVEL', second.getvalue())
+
+
+class TestMySQLStorage(unittest.TestCase):
+    """Unit Tests for the MySQL schema management in storage.py"""
+
+    def test_migrate_creates_only_missing_objects(self):
+        """Tests that migrate checks information_schema and creates only what is missing"""
+        mock_conn = mock.Mock()
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 3
+        mock_cursor.fetchall.side_effect = [
+            [('TB_EXECUTION',), ('TB_ALERTS',), ('TB_ALERT_TYPE',), ('TB_DUPLICATE_REPORT',),
+             ('TB_ALERT_INSTANCE',)],
+            [('TB_EXECUTION', 'EXECUTION_ID'), ('TB_EXECUTION', 'REPORT_DIGEST'),
+             ('TB_ALERTS', 'ALERT_TYPE_ID')],
+            [('TB_EXECUTION', 'PRIMARY'), ('TB_ALERTS', 'IX_ALERTS_EXECUTION_LEVEL'),
+             ('TB_EXECUTION', 'IX_EXECUTION_DIGEST'),
+             ('TB_ALERT_INSTANCE', 'IX_INSTANCE_EXECUTION_TYPE')],
+            [('TB_PROJECT',)],
+            [('TB_PROJECT', 'PRIMARY'), ('TB_PROJECT', 'IX_PROJECT_NAME')],
+        ]
+        mock_cursor.fetchone.return_value = (1,)
+        changes = MySQLStorage(mock_conn, mock_conn).migrate('test')
+        self.assertEqual(changes, ['Created table TB_SCAN_ROLLUP',
+                                   'Filled TB_SCAN_ROLLUP with 3 rows',
+                                   'Created index IX_EXECUTION_ENV_SCAN on TB_EXECUTION'])
+        statements = [query[0][0] for query in mock_cursor.execute.call_args_list]
+        created = [sql for sql in statements if sql.startswith('CREATE')]
+        self.assertEqual(len(created), 2)
+        self.assertTrue(created[0].startswith('CREATE TABLE IF NOT EXISTS TB_SCAN_ROLLUP'))
+        self.assertEqual(created[1], 'CREATE INDEX IX_EXECUTION_ENV_SCAN ON TB_EXECUTION '
+                                     '(Environment(64), Scan_Type(64), Execution_Id)')
+
+    def test_migrate_fills_alert_types(self):
+        """Tests that migrate fills TB_ALERT_TYPE and the alert type ids of stored alerts"""
+        mock_conn = mock.Mock()
+        mock_cursor = mock.Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.rowcount = 5
+        mock_cursor.fetchall.side_effect = [
+            [('TB_EXECUTION',), ('TB_ALERTS',), ('TB_SCAN_ROLLUP',), ('TB_DUPLICATE_REPORT',),
+             ('TB_ALERT_INSTANCE',)],
+            [('TB_EXECUTION', 'REPORT_DIGEST')],
+            [('TB_EXECUTION', 'IX_EXECUTION_ENV_SCAN'), ('TB_EXECUTION', 'IX_EXECUTION_DIGEST'),
+             ('TB_ALERTS', 'IX_ALERTS_EXECUTION_LEVEL'),
+             ('TB_ALERT_INSTANCE', 'IX_INSTANCE_EXECUTION_TYPE')],
+            [('TB_PROJECT',)],
+            [('TB_PROJECT', 'IX_PROJECT_NAME')],
+        ]
+        mock_cursor.fetchone.return_value = (1,)
+        changes = MySQLStorage(mock_conn, mock_conn).migrate('test')
+        self.assertEqual(changes, ['Created table TB_ALERT_TYPE',
+                                   'Filled TB_ALERT_TYPE with 5 rows',
+                                   'Added column Alert_Type_Id to TB_ALERTS',
+                                   'Filled Alert_Type_Id of 5 rows of TB_ALERTS'])
+        statements = [query[0][0] for query in mock_cursor.execute.call_args_list]
+        self.assertIn('ALTER TABLE TB_ALERTS ADD COLUMN Alert_Type_Id INT', statements)
+        self.assertTrue(any(sql.startswith('UPDATE TB_ALERTS SET Alert_Type_Id')
+                            for sql in statements))
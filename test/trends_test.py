@@ -0,0 +1,88 @@
+"""Unit tests for the alert trends of OWASP ZAP Historic Parser"""
+import datetime
+import io
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from owasp_zap_historic_parser.owasp_zap_historical import record_zap_results
+from owasp_zap_historic_parser.runner import main
+from owasp_zap_historic_parser.storage import SQLiteStorage
+from owasp_zap_historic_parser.trends import build_alert_trends, format_alert_trends
+
+DATE = datetime.datetime(2021, 3, 1, 12)
+ROWS = [
+    (4, DATE, '1.0', 'Low', 'Cookie', 2),
+    (4, DATE, '1.0', 'High', 'Injection', 1),
+    (5, DATE, '1.1', None, None, None),
+    (6, DATE, '1.2', 'Low', 'Cookie', 3),
+    (6, DATE, '1.2', 'Medium', 'Frame', 4),
+    (7, DATE, '1.3', 'Low', 'Cookie', 1),
+    (7, DATE, '1.3', 'Medium', 'Frame', 4),
+]
+
+
+class TestAlertTrends(unittest.TestCase):
+    """Unit Tests for trends.py"""
+
+    def test_matrix(self):
+        """Tests that rows are pivoted into an alert by execution matrix in severity order"""
+        trends = build_alert_trends(ROWS)
+        self.assertEqual([execution[0] for execution in trends.executions], [4, 5, 6, 7])
+        self.assertEqual(trends.alerts, [('High', 'Injection'), ('Medium', 'Frame'),
+                                         ('Low', 'Cookie')])
+        self.assertEqual(trends.counts.tolist(), [1, 0, 0, 0, 0, 0, 4, 4, 2, 0, 3, 1])
+        self.assertEqual(trends.deltas().tolist(), [-1, 0, 0, 0, 4, 0, -2, 3, -2])
+
+    def test_summary_and_churn(self):
+        """Tests first and last seen, change and churn per execution"""
+        trends = build_alert_trends(ROWS)
+        summary = trends.summary()
+        self.assertEqual([(row['alert'], row['first_seen'], row['last_seen'], row['change'])
+                          for row in summary],
+                         [('Injection', 4, 4, -1), ('Frame', 6, 7, 4), ('Cookie', 4, 7, -1)])
+        self.assertEqual(trends.churn(), [
+            {'execution': 5, 'new': 0, 'resolved': 2, 'increased': 0, 'decreased': 0},
+            {'execution': 6, 'new': 2, 'resolved': 0, 'increased': 0, 'decreased': 0},
+            {'execution': 7, 'new': 0, 'resolved': 0, 'increased': 0, 'decreased': 1},
+        ])
+
+    def test_alert_without_urls(self):
+        """Tests that an alert reported with no URLs in every run is still seen in them"""
+        trends = build_alert_trends([(4, DATE, '1.0', 'Low', 'Cookie', 0),
+                                     (5, DATE, '1.1', None, None, None),
+                                     (6, DATE, '1.2', 'Low', 'Cookie', 0)])
+        self.assertEqual(trends.summary(), [{'level': 'Low', 'alert': 'Cookie',
+                                             'counts': [0, 0, 0], 'first_seen': 4,
+                                             'last_seen': 6, 'change': 0}])
+        self.assertEqual([(churn['new'], churn['resolved']) for churn in trends.churn()],
+                         [(0, 1), (1, 0)])
+        self.assertIn('Cookie', format_alert_trends(trends, 'QA', 'Active'))
+
+    def test_empty(self):
+        """Tests that no executions give an empty matrix"""
+        trends = build_alert_trends([])
+        self.assertEqual((trends.summary(), trends.churn(), len(trends.deltas())), ([], [], 0))
+
+    def test_trend_command(self):
+        """Tests the trend command over the latest runs of a SQLite project"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            storage = SQLiteStorage(temp_dir, 'test')
+            for run, results in enumerate([[['Low', 'Cookie', 2]], [['Low', 'Cookie', 5]],
+                                           [['High', 'Injection', 1]]]):
+                record_zap_results(storage, 'QA', 'Active', results, 'test', 'link',
+                                   '1.%s' % run, execution_date=DATE)
+            record_zap_results(storage, 'QA', 'Passive', [['Low', 'Other', 1]], 'test',
+                               'link', '1.0', execution_date=DATE)
+            storage.close()
+            sys.argv[1:] = ['trend', '-n', 'test', '-e', 'QA', '-i', 'Active', '--runs', '2',
+                            '--backend', 'sqlite', '--sqlite-path', temp_dir]
+            output = io.StringIO()
+            with redirect_stdout(output):
+                self.assertEqual(main(), 0)
+        report = output.getvalue()
+        self.assertIn('Alert trends for QA / Active over 2 executions', report)
+        self.assertNotIn('#1 ', report)
+        self.assertNotIn('Other', report)
+        self.assertIn('#3: 1 new, 1 resolved, 0 increased, 0 decreased', report)
@@ -0,0 +1,100 @@
+"""Unit tests for the spool directory watch mode of OWASP ZAP Historic Parser"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import mysql.connector
+
+from owasp_zap_historic_parser.owasp_zap_historical import close_connection_pools
+from owasp_zap_historic_parser.runner import parse_options
+from owasp_zap_historic_parser.watcher import watch_spool, find_ready_reports, move_report
+
+ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
+
+
+class TestWatcher(unittest.TestCase):
+    """Unit Tests for watcher.py"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_dir = self.temp_dir.name
+
+    def tearDown(self):
+        close_connection_pools()
+        self.temp_dir.cleanup()
+
+    def spool(self, file_name):
+        """Copies a test report into the spool directory"""
+        shutil.copy(ROOT_PATH + "/test_files/" + file_name, self.spool_dir)
+
+    @patch('owasp_zap_historic_parser.watcher.store_duplicate_report', return_value=None)
+    @patch('time.sleep')
+    @patch('mysql.connector.connect')
+    @patch('owasp_zap_historic_parser.watcher.store_zap_results')
+    def test_watch_spool(self, mock_store, mock_connect, mock_sleep, _):
+        """Tests that watched reports are ingested, retried while the database is down and
+        filed under done or failed"""
+        mock_store.side_effect = [mysql.connector.OperationalError('gone away'), 'some html',
+                                  'some html']
+        self.spool('testReport.html')
+        self.spool('testReport.json')
+        with open(os.path.join(self.spool_dir, 'broken.xml'), 'w', encoding='utf-8') as report:
+            report.write('<OWASPZAPReport><site>')
+        sys.argv[1:] = ['watch', self.spool_dir, '--poll-interval', '0']
+        output = io.StringIO()
+        with redirect_stdout(output):
+            watch_spool(parse_options(), max_polls=2)
+        self.assertEqual(3, mock_store.call_count)
+        self.assertEqual(2, mock_connect.call_count)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.spool_dir, 'done'))),
+                         ['testReport.html', 'testReport.json'])
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'failed')), ['broken.xml'])
+        self.assertEqual(sorted(os.listdir(self.spool_dir)), ['done', 'failed'])
+        self.assertIn(unittest.mock.call(1), mock_sleep.call_args_list)
+        self.assertIn('Database unavailable (gone away)', output.getvalue())
+
+    @patch('owasp_zap_historic_parser.watcher.store_duplicate_report')
+    @patch('time.sleep')
+    @patch('owasp_zap_historic_parser.watcher.store_zap_results', return_value='some html')
+    def test_watch_spool_retries_duplicate_check(self, mock_store, mock_sleep, mock_duplicate):
+        """Tests that a report whose duplicate check loses the database is retried rather
+        than filed under failed"""
+        mock_duplicate.side_effect = [mysql.connector.InterfaceError('refused'), None]
+        self.spool('testReport.json')
+        sys.argv[1:] = ['watch', self.spool_dir, '--poll-interval', '0', '--backend', 'sqlite',
+                        '--sqlite-path', self.spool_dir]
+        output = io.StringIO()
+        with redirect_stdout(output):
+            watch_spool(parse_options(), max_polls=2)
+        self.assertEqual(2, mock_duplicate.call_count)
+        self.assertEqual(1, mock_store.call_count)
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'done')), ['testReport.json'])
+        self.assertEqual(os.listdir(os.path.join(self.spool_dir, 'failed')), [])
+        mock_sleep.assert_any_call(1)
+
+    def test_find_ready_reports_waits_for_stable_size(self):
+        """Tests that a report is only picked up once its size stops changing"""
+        report_path = os.path.join(self.spool_dir, 'report.html')
+        seen_sizes = {}
+        with open(report_path, 'w', encoding='utf-8') as report:
+            report.write('<html>')
+        self.assertEqual(find_ready_reports(self.spool_dir, seen_sizes), [])
+        with open(report_path, 'a', encoding='utf-8') as report:
+            report.write('</html>')
+        self.assertEqual(find_ready_reports(self.spool_dir, seen_sizes), [])
+        self.assertEqual(find_ready_reports(self.spool_dir, seen_sizes), [report_path])
+
+    def test_move_report_keeps_earlier_reports(self):
+        """Tests that moving a report never overwrites one with the same name"""
+        os.makedirs(os.path.join(self.spool_dir, 'done'))
+        self.spool('newReport.html')
+        first = move_report(os.path.join(self.spool_dir, 'newReport.html'), 'done')
+        self.spool('newReport.html')
+        second = move_report(os.path.join(self.spool_dir, 'newReport.html'), 'done')
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(os.listdir(os.path.join(self.spool_dir, 'done'))), 2)